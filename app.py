@@ -1,534 +1,630 @@
-from flask import Flask, render_template, request, redirect, url_for, jsonify
+from flask import Flask, Request, Response, g, render_template, request, redirect, url_for, jsonify, stream_with_context
 from flask_cors import CORS
-import os, json, datetime, traceback
+from flask_login import LoginManager, UserMixin, current_user, login_required, login_user, logout_user
+from werkzeug.security import generate_password_hash, check_password_hash
+import os, io, json, time, uuid, hashlib, logging, zipfile, datetime, threading
 from werkzeug.utils import secure_filename
-import re
-import numpy as np
-import pickle
+from concurrent.futures import ProcessPoolExecutor
+import ocr
+import ocr_preprocess
+import metrics
+from ocr import strategy_stats, tier_stats
+from ocr_jobs import OCRJobQueue, QueueFull, JOB_TTL, _init_worker as ocr_init_worker
+from ocr_cache import default_cache
+from storage import Storage, QuotaExceeded, DEFAULT_USER
+import prediction
+from prediction import predict_from_amount, predict_from_amounts
+from readiness import Readiness
+from upload_store import UploadStore, content_name
+from bulk_import import BulkImporter, Checkpoint, BULK_CHECKPOINT, BULK_WORKERS, checkpoint_path
+from job_store import default_store
+
+# Leveled key=value logging; debug output (e.g. every OCR line) costs nothing below LOG_LEVEL=DEBUG
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+logging.basicConfig(level=LOG_LEVEL, format='%(asctime)s level=%(levelname)s logger=%(name)s %(message)s')
+log = logging.getLogger('app')
 
 UPLOAD_FOLDER = 'uploads'
-DATA_FILE = 'data.json'
-REG_MODEL = 'models/regression_model.pkl'
-CLF_MODEL = 'models/classification_model.pkl'
+DATA_FILE = 'data.json'  # legacy store, migrated into the database on start-up
 ALLOWED_EXT = {'png','jpg','jpeg','gif','pdf'}
+# Raw (non-multipart) uploads: Content-Type -> extension
+UPLOAD_MIMETYPES = {'image/png': 'png', 'image/jpeg': 'jpg', 'image/gif': 'gif', 'application/pdf': 'pdf'}
+
+class InMemoryRequest(Request):
+    # Keep multipart file parts in memory (bounded by MAX_CONTENT_LENGTH)
+    # instead of spooling them to a temporary file that is then read back
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if self.path == '/upload/bulk':
+            # Bulk uploads can be far bigger; let werkzeug spool them to disk
+            return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+        return io.BytesIO()
 
 app = Flask(__name__)
+app.request_class = InMemoryRequest
 CORS(app)  # Enable CORS for all routes
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+# Sessions are signed with SECRET_KEY; set it so logins survive restarts and are shared across workers
+app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY') or os.urandom(32)
+REQUIRE_LOGIN = os.environ.get('REQUIRE_LOGIN', '0') != '0'  # otherwise anonymous visitors share DEFAULT_USER
+BULK_MAX_CONTENT_LENGTH = int(os.environ.get('BULK_MAX_CONTENT_LENGTH', 1024 * 1024 * 1024))  # whole bulk request
+BULK_MAX_FILES = int(os.environ.get('BULK_MAX_FILES', 5000))
+BULK_MAX_RUNNING = int(os.environ.get('BULK_MAX_RUNNING', 2))  # imports at once per process; more get HTTP 429
+HISTORY_PAGE_SIZE = int(os.environ.get('HISTORY_PAGE_SIZE', 20))  # rows on the first paint of /result
+HISTORY_MAX_PAGE = 500  # largest ?limit= accepted by /history
+STORAGE_RETRY_INTERVAL = float(os.environ.get('STORAGE_RETRY_INTERVAL', 5))  # seconds between database init retries
 
-# Initialize EasyOCR reader (lazy loading)
-ocr_reader = None
+job_store = default_store()  # set under serve.py: job polls can land on any worker
+ocr_jobs = OCRJobQueue(store=job_store)
+ocr_cache = default_cache()
+upload_store = UploadStore(UPLOAD_FOLDER)
+bulk_imports = {}  # job id -> (user id, BulkImporter), for /upload/bulk/<id>
+_bulk_lock = threading.Lock()
+_bulk_executor = None  # one OCR pool shared by every bulk import, created on first use
 
-def get_ocr_reader():
-    """Lazy initialization of EasyOCR reader"""
-    global ocr_reader
-    if ocr_reader is None:
-        try:
-            import easyocr
-            print("Initializing EasyOCR reader...")
-            ocr_reader = easyocr.Reader(['en'], gpu=False)  # Set gpu=True if you have CUDA
-            print("EasyOCR reader initialized successfully!")
-        except Exception as e:
-            print(f"Error initializing EasyOCR: {e}")
-            ocr_reader = False
-    return ocr_reader if ocr_reader is not False else None
+def _bulk_running():
+    """Drop imports finished more than JOB_TTL ago; returns how many are still running"""
+    # Caller holds _bulk_lock
+    now = time.time()
+    running = 0
+    for job_id, (_, importer) in list(bulk_imports.items()):
+        finished_at = importer.snapshot()['finished_at']
+        if finished_at is None:
+            running += 1
+        elif now - finished_at > JOB_TTL:
+            del bulk_imports[job_id]
+            if job_store:
+                job_store.delete(job_id)
+    return running
+
+def get_bulk_executor():
+    global _bulk_executor
+    with _bulk_lock:
+        if _bulk_executor is None:
+            _bulk_executor = ProcessPoolExecutor(max_workers=BULK_WORKERS, initializer=ocr_init_worker)
+        return _bulk_executor
+
+def shutdown_bulk_imports(timeout):
+    """
+    Give running bulk imports up to `timeout` seconds to finish, then mark the
+    rest failed (published to job_store) and stop the shared OCR pool. For a
+    server process that is about to exit.
+    """
+    deadline = time.monotonic() + timeout
+    with _bulk_lock:
+        importers = [(job_id, importer) for job_id, (_, importer) in bulk_imports.items()]
+    unfinished = 0
+    for job_id, importer in importers:
+        if not importer.wait(max(0.0, deadline - time.monotonic())):
+            log.warning("bulk import interrupted by shutdown job_id=%s", job_id)
+            importer.stop("server stopped before the import finished - upload the receipts again to resume")
+            unfinished += 1
+    if _bulk_executor is not None:
+        _bulk_executor.shutdown(wait=not unfinished, cancel_futures=True)
+
+def heartbeat():
+    """Tell a pre-fork server (serve.py) that a long request is still making progress"""
+    beat = request.environ.get('serve.heartbeat')
+    if beat is not None:
+        beat()
 
 def allowed_file(filename):
     """Check if file extension is allowed"""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXT
 
-# Utility: load / save json data
-def load_data():
-    if not os.path.exists(DATA_FILE):
-        with open(DATA_FILE,'w') as f:
-            json.dump([], f)
-    with open(DATA_FILE,'r') as f:
-        return json.load(f)
-
-def save_data(data):
-    with open(DATA_FILE,'w') as f:
-        json.dump(data, f, indent=2)
-
-# Enhanced amount extraction from text
-def extract_amounts_from_text(text):
-    """Extract monetary amounts from text with improved patterns"""
-    if not text:
-        return []
-    
-    # CRITICAL FIX: Clean up misread rupee symbols that appear as digits
-    # OCR often misreads ₹ symbol as "2" when followed by numbers
-    # Only apply this fix in UPI/payment contexts where we expect small amounts
-    # Look for patterns like "Paid to ... 21,750" or "Debited ... 21,750"
-    text_cleaned = text
-    
-    # Check if this looks like a UPI/payment receipt (strong indicators)
-    is_upi_context = bool(re.search(
-        r'(?:PAID\s+TO|DEBITED|CREDITED|TRANSACTION|UPI|TRANSFER|UTR)',
-        text.upper()
-    ))
-    
-    if is_upi_context:
-        # In UPI context, amounts like "21,750" are suspicious (likely ₹1,750)
-        # But "21,750.50" or amounts > 22,000 are likely legitimate
-        # Pattern: fix "2X,XXX" where X is 1-9 (e.g., 21,750 but not 22,000 or higher)
-        text_cleaned = re.sub(r'\b2([1-9],\d{3})(?![,\d])\b', r'\1', text_cleaned)  # 21,750 -> 1,750 (not followed by more digits)
-        text_cleaned = re.sub(r'\b2([1-9]\d{2,3})(?![,\d])\b', r'\1', text_cleaned)   # 21750 -> 1750 (3-4 digits after 2)
-        
-        if text != text_cleaned:
-            print(f"⚠️ UPI context detected - fixed likely rupee symbol misread (₹ → '2')")
-    
-    # Convert to uppercase for easier matching
-    text_upper = text_cleaned.upper()
-    amounts = []
-    amount_contexts = []  # Store (amount, context_score) tuples
-    
-    # High priority patterns - look for keywords like TOTAL, AMOUNT, etc.
-    priority_patterns = [
-        (r'(?:TOTAL|GRAND\s*TOTAL|NET\s*TOTAL|AMOUNT\s*PAYABLE|BILL\s*AMOUNT|INVOICE\s*TOTAL)[\s:]*(?:RS\.?|₹|INR)?\s*(\d+(?:[,\s]\d{3})*(?:\.\d{1,2})?)', 100),
-        (r'(?:TO\s*PAY|PAYABLE|BALANCE|DUE|BALANCE\s*DUE)[\s:]*(?:RS\.?|₹|INR)?\s*(\d+(?:[,\s]\d{3})*(?:\.\d{1,2})?)', 90),
-        (r'(?:PAID|PAYMENT|RECEIVED|AMOUNT\s*PAID)[\s:]*(?:RS\.?|₹|INR)?\s*(\d+(?:[,\s]\d{3})*(?:\.\d{1,2})?)', 80),
-        # UPI/Payment specific patterns - PAID TO and DEBITED are critical for UPI
-        (r'(?:PAID\s+TO|DEBITED|CREDITED|TRANSFERRED)[\s\w]*?(?:RS\.?|₹|INR)?\s*(\d+(?:[,\s]\d{3})*(?:\.\d{1,2})?)', 95),
-    ]
-    
-    # Check high priority patterns first
-    for pattern, score in priority_patterns:
-        matches = re.findall(pattern, text_upper, re.IGNORECASE)
-        for match in matches:
-            try:
-                cleaned = match.replace(',', '').replace(' ', '').strip()
-                value = float(cleaned)
-                if 1 <= value <= 10000000:  # Increased max to 10M
-                    amount_contexts.append((value, score))
-                    print(f"Found priority amount: {value} (score: {score}, pattern: {pattern[:50]})")
-            except:
-                pass
-    
-    # If we found high-priority amounts, return the highest scored one
-    if amount_contexts:
-        amount_contexts.sort(key=lambda x: (x[1], x[0]), reverse=True)
-        return [amt[0] for amt in amount_contexts[:5]]  # Top 5 candidates
-    
-    # Medium priority - currency prefixed amounts (more variations)
-    medium_patterns = [
-        # Direct rupee symbol patterns - these should catch ₹1,750 correctly
-        (r'₹\s*(\d{1,3}(?:[,\s]\d{3})*(?:\.\d{1,2})?)', 70),  # ₹ symbol with formatted number
-        (r'₹\s*(\d+(?:\.\d{1,2})?)', 65),  # ₹ symbol with simple number
-        (r'RS\.?\s*(\d{1,3}(?:[,\s]\d{3})*(?:\.\d{1,2})?)', 55),  # RS.
-        (r'INR\s*(\d{1,3}(?:[,\s]\d{3})*(?:\.\d{1,2})?)', 55),  # INR
-        (r'RS\.?\s*(\d+(?:\.\d{1,2})?)', 45),  # Simple RS
-        # Handle amounts with comma as decimal separator (some regions)
-        (r'₹\s*(\d{1,3}(?:\.\d{3})*,\d{2})', 50),  # European style: ₹1.234,56
-        # Handle cases where ₹ might be directly attached to number (no space)
-        (r'₹(\d{1,3}(?:,\d{3})*)', 68),  # ₹1,750 (no space)
-        (r'₹(\d+)', 63),  # ₹1750 (no space, no comma)
-    ]
-    
-    for pattern, score in medium_patterns:
-        matches = re.findall(pattern, text_upper, re.IGNORECASE)
-        for match in matches:
-            try:
-                # Handle European decimal format
-                if ',' in match and match.count(',') == 1 and match.count('.') > 0:
-                    cleaned = match.replace('.', '').replace(',', '.').strip()
-                else:
-                    cleaned = match.replace(',', '').replace(' ', '').strip()
-                value = float(cleaned)
-                if 10 <= value <= 10000000:  # Minimum 10 for currency-prefixed
-                    amount_contexts.append((value, score))
-                    print(f"Found currency-prefixed amount: {value} (score: {score})")
-            except Exception as e:
-                print(f"Error parsing medium pattern '{match}': {e}")
-                pass
-    
-    # If we found medium-priority amounts
-    if amount_contexts:
-        amount_contexts.sort(key=lambda x: (x[1], x[0]), reverse=True)
-        return [amt[0] for amt in amount_contexts[:5]]
-    
-    # Low priority - plain numbers with specific patterns
-    low_patterns = [
-        r'(\d{1,3}(?:,\d{3})+\.\d{2})',  # 1,234.56
-        r'(\d{1,3}(?:,\d{3})+)',  # 1,234 (large numbers with commas)
-        r'(\d{3,}\.\d{2})',  # 123.56 (at least 3 digits before decimal)
-    ]
-    
-    for pattern in low_patterns:
-        matches = re.findall(pattern, text_upper)
-        for match in matches:
-            try:
-                cleaned = match.replace(',', '').replace(' ', '').strip()
-                value = float(cleaned)
-                if 50 <= value <= 10000000:  # Minimum 50 for plain numbers
-                    amounts.append(value)
-                    print(f"Found plain number: {value}")
-            except:
-                pass
-    
-    # Return unique amounts, sorted descending (largest first)
-    unique_amounts = list(set(amounts))
-    unique_amounts.sort(reverse=True)
-    return unique_amounts[:5]  # Top 5 candidates
-
-# OCR using EasyOCR with image preprocessing
-def try_ocr(filepath):
-    """Extract text from image using EasyOCR with preprocessing and multiple strategies"""
+readiness = Readiness(['storage', 'models', 'ocr'], required=['storage'])
+
+# Entries live in SQLite; the legacy data.json is imported on first start
+storage = None
+forecaster = None  # per-user spend forecasts, updated incrementally from storage
+_forecaster_lock = threading.Lock()
+
+def init_storage():
+    global storage
+    store = Storage()
+    migrated = store.migrate_from_json(DATA_FILE)
+    storage = store  # only once it is usable; require_storage() retries otherwise
+    return {"entries": storage.count(), "migrated": migrated}
+
+readiness.run('storage', init_storage)  # synchronous: every route needs it
+_storage_retry_at = time.monotonic() + STORAGE_RETRY_INTERVAL
+_storage_retry_lock = threading.Lock()
+
+# Routes that answer without the database
+STORAGE_FREE_ENDPOINTS = {'static', 'healthz', 'readyz', 'metrics_route'}
+
+@app.before_request
+def require_storage():
+    # Registered before the login hooks, which load the user from storage
+    global _storage_retry_at
+    if storage is not None or request.endpoint in STORAGE_FREE_ENDPOINTS:
+        return None
+    with _storage_retry_lock:
+        if storage is None and time.monotonic() >= _storage_retry_at:
+            readiness.run('storage', init_storage)
+            _storage_retry_at = time.monotonic() + STORAGE_RETRY_INTERVAL
+    if storage is None:
+        return jsonify({"status":"error","message":"Storage unavailable, try again shortly"}), 503
+    return None
+
+def start_warmup():
+    """Load prediction models and OCR workers in the background; /readyz reports progress"""
+    return readiness.start_background([
+        ('models', prediction.warm_up),
+        ('ocr', ocr_jobs.warm_up),
+    ])
+
+if os.environ.get('APP_WARMUP', '1') != '0':
+    start_warmup()
+else:
+    readiness.defer('models')
+    readiness.defer('ocr')
+
+def get_forecaster():
+    # Built on the first /predict: forecast.py needs numpy, which boot and the page routes don't
+    global forecaster
+    with _forecaster_lock:
+        if forecaster is None or forecaster.storage is not storage:
+            from forecast import Forecaster
+            forecaster = Forecaster(storage)
+        return forecaster
+
+def append_entry(entry, user=DEFAULT_USER):
+    storage.add_entry(entry, user=user)
+
+# Accounts: every route reads and writes the signed-in user's partition only
+login_manager = LoginManager(app)
+login_manager.login_view = 'login'
+
+class User(UserMixin):
+    def __init__(self, row):
+        self.id = row['id']
+        self.username = row['username']
+
+@login_manager.user_loader
+def load_user(uid):
+    row = storage.get_user(user_id=int(uid))
+    return User(row) if row else None
+
+def user_id():
+    """The partition the current request works on"""
+    return current_user.id if current_user.is_authenticated else DEFAULT_USER
+
+# Reachable without an account even with REQUIRE_LOGIN=1
+PUBLIC_ENDPOINTS = {'login', 'register', 'static', 'healthz', 'readyz', 'metrics_route'}
+
+@app.before_request
+def require_login():
+    if REQUIRE_LOGIN and not current_user.is_authenticated and request.endpoint not in PUBLIC_ENDPOINTS:
+        return login_manager.unauthorized()
+
+@app.route('/login', methods=['GET', 'POST'])
+def login():
+    if request.method == 'GET':
+        return render_template('login.html', error=None)
+    row = storage.get_user(username=request.form.get('username', '').strip())
+    if row is None or not check_password_hash(row['password_hash'], request.form.get('password', '')):
+        return render_template('login.html', error="Wrong username or password"), 401
+    login_user(User(row), remember=True)
+    return redirect(url_for('index'))
+
+@app.route('/register', methods=['POST'])
+def register():
+    username = request.form.get('username', '').strip()
+    password = request.form.get('password', '')
+    if not username or len(password) < 8:
+        return render_template('login.html', error="Pick a username and a password of 8+ characters"), 400
     try:
-        reader = get_ocr_reader()
-        if reader is None:
-            print("⚠️ OCR reader not available - returning empty text")
-            return ""
-        
-        print(f"\n{'='*60}")
-        print(f"Processing image: {filepath}")
-        print(f"{'='*60}")
-        
-        all_results = []
-        
-        # Try to preprocess image for better OCR
-        try:
-            import cv2
-            import numpy as np
-            
-            # Read image
-            img = cv2.imread(filepath)
-            if img is None:
-                print(f"❌ Failed to read image file: {filepath}")
-                return ""
-            
-            print(f"✓ Image loaded: {img.shape}")
-            
-            # Strategy 1: Enhanced preprocessing (original method)
-            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-            blurred = cv2.GaussianBlur(gray, (3, 3), 0)
-            clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
-            enhanced = clahe.apply(blurred)
-            thresh = cv2.adaptiveThreshold(
-                enhanced, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, 
-                cv2.THRESH_BINARY, 11, 2
-            )
-            
-            print("Strategy 1: Enhanced preprocessing...")
-            results1 = reader.readtext(thresh, detail=0, paragraph=False)
-            all_results.extend(results1)
-            print(f"  → Found {len(results1)} segments")
-            
-            # Strategy 2: Simple grayscale
-            print("Strategy 2: Simple grayscale...")
-            results2 = reader.readtext(gray, detail=0, paragraph=False)
-            all_results.extend(results2)
-            print(f"  → Found {len(results2)} segments")
-            
-            # Strategy 3: Original color image
-            print("Strategy 3: Original image...")
-            results3 = reader.readtext(img, detail=0, paragraph=False)
-            all_results.extend(results3)
-            print(f"  → Found {len(results3)} segments")
-            
-            # Strategy 4: Inverted image (white text on dark background)
-            print("Strategy 4: Inverted image...")
-            inverted = cv2.bitwise_not(gray)
-            results4 = reader.readtext(inverted, detail=0, paragraph=False)
-            all_results.extend(results4)
-            print(f"  → Found {len(results4)} segments")
-            
-            # Strategy 5: High contrast binary
-            print("Strategy 5: Binary threshold...")
-            _, binary = cv2.threshold(gray, 127, 255, cv2.THRESH_BINARY)
-            results5 = reader.readtext(binary, detail=0, paragraph=False)
-            all_results.extend(results5)
-            print(f"  → Found {len(results5)} segments")
-            
-        except Exception as preprocess_error:
-            print(f"⚠️ Preprocessing failed: {preprocess_error}")
-            traceback.print_exc()
-            # Fallback to original image
-            try:
-                print("Fallback: Using original image path...")
-                results_fallback = reader.readtext(filepath, detail=0, paragraph=False)
-                all_results.extend(results_fallback)
-                print(f"  → Found {len(results_fallback)} segments")
-            except Exception as fallback_error:
-                print(f"❌ Fallback also failed: {fallback_error}")
-        
-        # Remove duplicates while preserving order
-        unique_results = []
-        seen = set()
-        for text in all_results:
-            text_clean = text.strip()
-            if text_clean and text_clean not in seen:
-                unique_results.append(text_clean)
-                seen.add(text_clean)
-        
-        # Join all detected text with spaces
-        final_text = ' '.join(unique_results)
-        print(f"\n{'='*60}")
-        print(f"✓ Total unique segments: {len(unique_results)}")
-        print(f"✓ Total text length: {len(final_text)} chars")
-        print(f"{'='*60}")
-        print(f"Extracted text preview:\n{final_text[:500]}")
-        print(f"{'='*60}\n")
-        
-        # Print line by line for debugging
-        if unique_results:
-            print("Detected text lines (unique):")
-            for i, line in enumerate(unique_results[:30], 1):  # Show first 30 lines
-                print(f"  {i:2d}. {line}")
-            if len(unique_results) > 30:
-                print(f"  ... and {len(unique_results) - 30} more lines")
-        else:
-            print("⚠️ No text detected from any strategy!")
-        
-        return final_text
-    except Exception as e:
-        print(f"❌ OCR Error: {e}")
-        traceback.print_exc()
-        return ""
-
-# Load models if present
-def load_models():
-    reg = clf = None
-    if os.path.exists(REG_MODEL):
-        try:
-            with open(REG_MODEL,'rb') as f:
-                reg = pickle.load(f)
-        except:
-            reg = None
-    if os.path.exists(CLF_MODEL):
-        try:
-            with open(CLF_MODEL,'rb') as f:
-                clf = pickle.load(f)
-        except:
-            clf = None
-    return reg, clf
+        new_id = storage.create_user(username, generate_password_hash(password))
+    except ValueError:
+        return render_template('login.html', error="That username is taken"), 409
+    login_user(User({"id": new_id, "username": username}), remember=True)
+    return redirect(url_for('index'))
 
-reg_model, clf_model = load_models()
+@app.route('/logout', methods=['POST'])
+def logout():
+    logout_user()
+    return redirect(url_for('login'))
+
+@app.before_request
+def start_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_latency(response):
+    started = g.pop('request_started', None)
+    if started is not None and metrics.METRICS_ENABLED:
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        metrics.request_seconds.observe(time.perf_counter() - started, method=request.method,
+                                        route=route, status=response.status_code)
+    return response
+
+@app.route('/metrics')
+def metrics_route():
+    # Prometheus text exposition of the stage and request latency histograms
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
 @app.route('/')
 def index():
-    data = load_data()
     # basic summary
     today = datetime.date.today().isoformat()
-    todays = [d for d in data if d.get('date')==today]
-    total_today = sum(item.get('amount',0) for item in todays)
-    total_month = sum(item.get('amount',0) for item in data if item.get('date', '')[:7]==today[:7])
+    user = user_id()
+    todays = storage.entries_on(today, user=user)
+    total_today = storage.day_total(today, user=user)
+    total_month = storage.month_total(today, user=user)
     health_score = max(0, 100 - min(100, int((total_month/100000)*100)))  # very rough scoring
     return render_template('index.html', total_today=total_today, total_month=total_month, health_score=health_score, todays=todays, today=today)
 
+@app.route('/healthz')
+def healthz():
+    # Liveness: the process is serving; includes per-component load state
+    return jsonify(dict(readiness.snapshot(), status="ok"))
+
+@app.route('/readyz')
+def readyz():
+    # Readiness: 503 until models and OCR workers have finished loading
+    snapshot = readiness.snapshot()
+    return jsonify(snapshot), (200 if snapshot['ready'] else 503)
+
 @app.route('/upload', methods=['POST'])
 def upload():
     try:
-        print("\n" + "="*50)
-        print("Upload request received")
-        print("="*50)
-        
-        if 'receipt' not in request.files:
-            print("ERROR: No file part in request")
-            return jsonify({"status":"error","message":"No file part"}), 400
-        
-        file = request.files['receipt']
-        print(f"File received: {file.filename}")
-        
-        if file.filename == '':
-            print("ERROR: No file selected")
-            return jsonify({"status":"error","message":"No selected file"}), 400
+        if request.mimetype in UPLOAD_MIMETYPES:
+            # Raw image body (e.g. fetch(url, {body: file})) - no multipart parsing at all
+            original = request.args.get('filename') or f"receipt.{UPLOAD_MIMETYPES[request.mimetype]}"
+            data = request.get_data(cache=False)
+        else:
+            if 'receipt' not in request.files:
+                log.warning("upload rejected reason=no_file_part")
+                return jsonify({"status":"error","message":"No file part"}), 400
+            file = request.files['receipt']
+            original = file.filename
+            if original == '':
+                log.warning("upload rejected reason=no_file_selected")
+                return jsonify({"status":"error","message":"No selected file"}), 400
+            data = file.read()
+            file.close()
+        log.info("upload received filename=%s bytes=%d", original, len(data))
         
-        if not allowed_file(file.filename):
-            print(f"ERROR: Invalid file type: {file.filename}")
+        if not allowed_file(original):
+            log.warning("upload rejected reason=invalid_type filename=%s", original)
             return jsonify({"status":"error","message":"Invalid file type. Allowed: JPG, PNG, GIF, PDF"}), 400
+        if not data:
+            log.warning("upload rejected reason=empty filename=%s", original)
+            return jsonify({"status":"error","message":"Empty file"}), 400
         
-        filename = secure_filename(file.filename)
-        save_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        
-        print(f"Saving to: {save_path}")
-        file.save(save_path)
-        print(f"File saved successfully")
-        
-        print(f"\n{'='*50}")
-        print(f"Processing receipt: {filename}")
-        print(f"{'='*50}")
-        
-        # Try OCR
-        text = try_ocr(save_path)
-        print(f"\n{'='*50}")
-        print(f"OCR Complete - Text length: {len(text)} chars")
-        print(f"{'='*50}")
+        # Content-addressed name: same-named receipts no longer overwrite each
+        # other. The original is written in the background; OCR works on the
+        # bytes already in memory.
+        user = user_id()
+        digest = hashlib.sha256(data).hexdigest()
+        filename = content_name(data, secure_filename(original), digest)
+        # Only the request that claims the name is charged: re-uploads, even concurrent ones, take no space
+        reserved = upload_store.reserve(filename, user)
+        if reserved:
+            try:
+                storage.record_upload(user, len(data))
+            except QuotaExceeded as e:
+                upload_store.release(filename, user)
+                log.warning("upload rejected reason=quota user=%s: %s", user, e)
+                return jsonify({"status":"error","message":"Upload quota reached. Delete old receipts or contact support."}), 403
+        saved = upload_store.save_async(filename, data, user, reserved=reserved)
+        if reserved:
+            nbytes = len(data)
+            saved.add_done_callback(lambda f: f.exception() is not None and storage.release_upload(user, nbytes))
+        log.debug("saving upload path=%s (in the background)", upload_store.path(filename, user))
         
-        # Extract amounts
-        amounts = extract_amounts_from_text(text)
-        print(f"\n{'='*50}")
-        print(f"Amount Extraction Results:")
-        print(f"  Detected {len(amounts)} potential amounts: {amounts}")
-        print(f"{'='*50}")
+        # Same image already OCR'd under the current config - answer right away
+        cache_key = ocr_cache.key_for_digest(digest)
+        cached = ocr_cache.get(cache_key)
+        if cached is not None:
+            log.info("OCR cache hit filename=%s", filename)
+            body = finish_upload(filename, cached, original, user)
+            body['ocr_cached'] = True
+            return jsonify(body), 200
         
-        # Use the first (highest priority) amount if found
-        extracted = amounts[0] if amounts else None
-        print(f"Selected amount: ₹{extracted}" if extracted else "⚠️ No amount detected")
-        print(f"{'='*50}\n")
+        def on_done(res):
+            if ocr.is_cacheable(res):  # don't cache "OCR unavailable" results
+                ocr_cache.put(cache_key, res)
+            return finish_upload(filename, res, original, user)
         
-        # Save an entry with extracted (or None) and OCR text for manual correction
-        entry = {
-            "date": datetime.date.today().isoformat(),
-            "filename": filename,
-            "extracted_amount": extracted,
-            "all_detected_amounts": amounts[:5],  # Store top 5 for reference
-            "ocr_text": text[:500]  # store more text for debugging
-        }
-        
-        data = load_data()
+        # Hand OCR to the worker pool; the client polls /jobs/<id> for the result
+        try:
+            job_id = ocr_jobs.submit(data, on_done=on_done, owner=user)
+        except QueueFull as e:
+            log.warning("OCR queue full: %s", e)
+            resp = jsonify({"status":"error","message":"Server is busy processing other receipts. Please retry shortly."})
+            resp.headers['Retry-After'] = '5'
+            return resp, 429
         
-        # If OCR failed to find amount, prompt user to manual entry via JSON response
-        if extracted is None:
-            data.append(entry)
-            save_data(data)
-            print("No amount detected - returning manual entry request")
-            return jsonify({
-                "status":"ok",
-                "message":"uploaded",
-                "need_manual_amount":True,
-                "entry":entry,
-                "debug_text": text[:300]  # Send more text for debugging
-            }), 200
-        else:
-            # run prediction on extracted amount
-            entry['amount'] = extracted  # Set amount field
-            pred = predict_from_amount(float(extracted))
-            entry.update(pred)
-            data.append(entry)
-            save_data(data)
-            print(f"Amount detected: ₹{extracted} - returning success")
-            
-            # Prepare response with alternatives if available
-            alternatives = amounts[1:4] if len(amounts) > 1 else []
-            
-            return jsonify({
-                "status":"ok",
-                "message":"uploaded",
-                "need_manual_amount":False,
-                "entry":entry,
-                "extracted_amount": extracted,
-                "alternative_amounts": alternatives,  # Show other detected amounts
-                "ocr_text_sample": text[:200]
-            }), 200
+        log.info("queued OCR job job_id=%s filename=%s", job_id, filename)
+        return jsonify({
+            "status":"queued",
+            "job_id":job_id,
+            "status_url":url_for('job_status', job_id=job_id)
+        }), 202
     except Exception as e:
-        print(f"\n{'='*50}")
-        print(f"ERROR in upload route:")
-        print(f"{'='*50}")
-        traceback.print_exc()
+        log.exception("error in upload route")
         return jsonify({"status":"error","message":str(e)}), 500
 
+def finish_upload(filename, ocr_result, original_filename=None, user=DEFAULT_USER):
+    """Turn a finished OCR job into a stored entry; returns the /upload response body"""
+    text = ocr_result['text']
+    amounts = ocr_result['amounts']
+    # Use the first (highest priority) amount if found
+    extracted = amounts[0] if amounts else None
+    log.info("OCR complete filename=%s chars=%d amounts=%s selected=%s", filename, len(text), amounts, extracted)
+    
+    # Save an entry with extracted (or None) and OCR text for manual correction
+    entry = {
+        "date": datetime.date.today().isoformat(),
+        "filename": filename,
+        "original_filename": original_filename or filename,
+        "extracted_amount": extracted,
+        "all_detected_amounts": amounts[:5],  # Store top 5 for reference
+        "ocr_text": text[:500]  # store more text for debugging
+    }
+    
+    # If OCR failed to find amount, prompt user to manual entry via JSON response
+    if extracted is None:
+        append_entry(entry, user)
+        return {
+            "status":"ok",
+            "message":"uploaded",
+            "need_manual_amount":True,
+            "entry":entry,
+            "debug_text": text[:300]  # Send more text for debugging
+        }
+    
+    # run prediction on extracted amount
+    entry['amount'] = extracted  # Set amount field
+    pred = predict_from_amount(float(extracted))
+    entry.update(pred)
+    append_entry(entry, user)
+    
+    # Prepare response with alternatives if available
+    alternatives = amounts[1:4] if len(amounts) > 1 else []
+    return {
+        "status":"ok",
+        "message":"uploaded",
+        "need_manual_amount":False,
+        "entry":entry,
+        "extracted_amount": extracted,
+        "alternative_amounts": alternatives,  # Show other detected amounts
+        "ocr_text_sample": text[:200]
+    }
+
+@app.route('/upload/bulk', methods=['POST'])
+def upload_bulk():
+    """
+    Backfill many receipts: any number of `receipts` files, zips of receipts
+    included. They are stored right away and imported in the background;
+    poll status_url for progress.
+    """
+    def busy():
+        return jsonify({"status":"error","message":f"{BULK_MAX_RUNNING} bulk imports already running"}), 429
+
+    with _bulk_lock:
+        if _bulk_running() >= BULK_MAX_RUNNING:
+            return busy()
+    request.max_content_length = BULK_MAX_CONTENT_LENGTH
+    user = user_id()
+    receipts, rejected = [], []
+    # Entries are dated by the form's `date`, else a zip member's timestamp, else the upload day
+    date = request.form.get('date') or None
+    if date:
+        try:
+            date = datetime.date.fromisoformat(date).isoformat()
+        except ValueError:
+            return jsonify({"status":"error","message":"date must be YYYY-MM-DD"}), 400
+
+    def add(original, data, member_date=None):
+        heartbeat()
+        if len(receipts) >= BULK_MAX_FILES or not allowed_file(original) or not data \
+                or len(data) > app.config['MAX_CONTENT_LENGTH']:
+            rejected.append(original)
+            return
+        filename = content_name(data, secure_filename(original) or original)
+        charged = upload_store.reserve(filename, user)
+        if charged:
+            try:
+                storage.record_upload(user, len(data))
+            except QuotaExceeded:
+                upload_store.release(filename, user)
+                rejected.append(original)
+                return
+        try:
+            path = upload_store.save(filename, data, user, reserved=charged)
+        except OSError:
+            if charged:
+                storage.release_upload(user, len(data))
+            rejected.append(original)
+            return
+        receipts.append((original, path, member_date))
+
+    try:
+        for file in request.files.getlist('receipts'):
+            if file.filename.lower().endswith('.zip'):
+                with zipfile.ZipFile(file.stream) as archive:
+                    for info in archive.infolist():
+                        if info.is_dir():
+                            continue
+                        if info.file_size > app.config['MAX_CONTENT_LENGTH']:
+                            rejected.append(info.filename)
+                            continue
+                        # 1980-01-01 is the zip format's "no timestamp"
+                        stamped = info.date_time[:3] != (1980, 1, 1)
+                        add(info.filename, archive.read(info),
+                            datetime.date(*info.date_time[:3]).isoformat() if stamped else None)
+            else:
+                add(file.filename, file.read())
+    except zipfile.BadZipFile as e:
+        return jsonify({"status":"error","message":f"Invalid zip file: {e}"}), 400
+
+    if not receipts:
+        return jsonify({"status":"error","message":"No receipts found","rejected":rejected}), 400
+
+    job_id = uuid.uuid4().hex
+    on_progress = (lambda p: job_store.put(job_id, dict(p, job_id=job_id), user)) if job_store else None
+    # The account's checkpoint, as for the CLI: uploading the same receipts again resumes
+    importer = BulkImporter(storage, cache=ocr_cache, executor=get_bulk_executor(), user=user,
+                            checkpoint=Checkpoint(checkpoint_path(BULK_CHECKPOINT, user) or None),
+                            on_progress=on_progress, date=date)
+    with _bulk_lock:
+        if _bulk_running() >= BULK_MAX_RUNNING:
+            return busy()
+        bulk_imports[job_id] = (user, importer)
+    threading.Thread(target=importer.run, args=(receipts,), name='bulk-import', daemon=True).start()
+    log.info("bulk import queued job_id=%s receipts=%d rejected=%d", job_id, len(receipts), len(rejected))
+    return jsonify({
+        "status":"queued",
+        "job_id":job_id,
+        "total":len(receipts),
+        "rejected":rejected,
+        "status_url":url_for('bulk_status', job_id=job_id)
+    }), 202
+
+@app.route('/upload/bulk/<job_id>')
+def bulk_status(job_id):
+    owner, importer = bulk_imports.get(job_id, (None, None))
+    if importer is None:
+        # Started by another server process?
+        progress = job_store.get(job_id, user_id()) if job_store else None
+        if progress is not None:
+            return jsonify(progress)
+    if importer is None or owner != user_id():
+        return jsonify({"status":"error","message":"Unknown bulk import"}), 404
+    return jsonify(dict(importer.snapshot(), job_id=job_id))
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = ocr_jobs.get(job_id, owner=user_id())
+    if job is None:
+        return jsonify({"status":"error","message":"Unknown job"}), 404
+    return jsonify(job)
+
+@app.route('/ocr/stats')
+def ocr_stats():
+    # Per-strategy run/win counts that drive the OCR cascade ordering, per-tier
+    # hit rate and time (fast backend vs. EasyOCR), plus cache counters
+    stats = {"strategies": strategy_stats.snapshot(), "tiers": tier_stats.snapshot(), "cache": ocr_cache.stats(),
+             "parallel": {"variants": ocr.OCR_PARALLEL, "torch_threads": ocr.OCR_TORCH_THREADS},
+             "preprocess": ocr_preprocess.totals.snapshot(), "uploads": upload_store.stats()}
+    if ocr.ocr_batcher is not None:
+        stats["batching"] = ocr.ocr_batcher.stats()
+    return jsonify(stats)
+
 @app.route('/manual-entry', methods=['POST'])
 def manual_entry():
     try:
         amount = float(request.form.get('amount',0))
         category = request.form.get('category','Misc')
-        date = request.form.get('date', datetime.date.today().isoformat())
+        date = request.form.get('date') or datetime.date.today().isoformat()
+        try:
+            date = datetime.date.fromisoformat(date).isoformat()
+        except ValueError:
+            return "date must be YYYY-MM-DD", 400
         entry = {
             "date": date,
             "amount": amount,
             "category": category,
             "source":"manual"
         }
-        data = load_data()
-        data.append(entry)
         # predict
         pred = predict_from_amount(amount)
         entry.update(pred)
-        save_data(data)
+        append_entry(entry, user_id())
         return redirect(url_for('result'))
     except Exception as e:
-        traceback.print_exc()
+        log.exception("error in manual-entry route")
         return str(e), 500
 
 @app.route('/result')
 def result():
-    data = load_data()
     # latest entry
-    latest = data[-1] if data else {}
+    user = user_id()
+    latest = storage.latest(user=user)
     # category breakdown
-    breakdown = {}
-    for d in data:
-        cat = d.get('category','Misc')
-        breakdown[cat] = breakdown.get(cat,0) + d.get('amount',0)
-    return render_template('result.html', latest=latest, breakdown=breakdown, data=data)
-
-def predict_from_amount(amount):
-    # Load models if not loaded
-    global reg_model, clf_model
-    if reg_model is None or clf_model is None:
-        reg_model, clf_model = load_models()
-    # Simple fallback prediction rules if models missing
-    if reg_model is None:
-        # assume daily amount * 365 gives yearly expense
-        predicted_annual = amount * 365
-    else:
-        try:
-            predicted_annual = float(reg_model.predict([[amount]])[0])
-        except:
-            predicted_annual = amount * 365
-    if clf_model is None:
-        # simple distress probability heuristic: if predicted annual expense > threshold
-        distress_prob = min(1.0, predicted_annual / 100000.0)
-    else:
-        try:
-            distress_prob = float(clf_model.predict_proba([[amount, predicted_annual]])[0][1])
-        except:
-            distress_prob = min(1.0, predicted_annual / 100000.0)
-    # Simple savings estimate: assume fixed income (can be extended)
-    assumed_income = 100000.0  # placeholder
-    predicted_savings = max(0.0, assumed_income - predicted_annual)
-    advice = generate_advice(predicted_annual, predicted_savings, distress_prob)
-    return {
-        "predicted_annual_expense": round(predicted_annual,2),
-        "predicted_annual_savings": round(predicted_savings,2),
-        "distress_probability": round(distress_prob,3),
-        "advice": advice
-    }
+    breakdown = storage.category_totals(user=user)
+    # Only the first page is rendered; the page pulls the rest from /history as needed
+    recent, next_cursor = storage.history(HISTORY_PAGE_SIZE, user=user)
+    return render_template('result.html', latest=latest, breakdown=breakdown, recent=recent,
+                           next_cursor=next_cursor, page_size=HISTORY_PAGE_SIZE)
+
+@app.route('/history')
+def history_route():
+    """
+    One page of entries, newest first, as NDJSON (one entry per line).
+    The cursor for the next page is in the X-Next-Cursor header (absent on
+    the last page); pass it back as ?cursor=.
+    """
+    try:
+        limit = min(HISTORY_MAX_PAGE, max(1, int(request.args.get('limit', HISTORY_PAGE_SIZE))))
+        page, next_cursor = storage.history(limit, request.args.get('cursor') or None, user=user_id())
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-def generate_advice(predicted_annual, predicted_savings, distress_prob):
-    tips = []
-    if distress_prob > 0.6:
-        tips.append("High risk detected: consider immediately reviewing recurring subscriptions and non-essential spending.")
-    if predicted_savings < 0:
-        tips.append("Projected savings negative: prioritize reducing expenses or increasing income.")
-    if predicted_annual > 50000:
-        tips.append("Your projected annual expense seems high; try cutting discretionary spending by 10% to start.")
-    if not tips:
-        tips.append("Your finances look stable for now. Maintain an emergency fund of 3-6 months of expenses.")
-    return " ".join(tips)
+    def generate():
+        for entry in page:
+            yield json.dumps(entry) + '\n'
+
+    resp = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    if next_cursor:
+        resp.headers['X-Next-Cursor'] = next_cursor
+    return resp
 
 @app.route('/predict', methods=['GET'])
 def predict_route():
-    # Aggregate data and run forecasting using simple rule or model if present
-    data = load_data()
-    amounts = [d.get('amount') for d in data if d.get('amount') is not None]
-    if not amounts:
+    # Next 365 days of spend from the user's cached seasonal fit (see forecast.py)
+    user = user_id()
+    count, _ = storage.amount_stats(user=user)
+    if not count:
+        return jsonify({"error":"no data"}), 400
+    fc = get_forecaster().forecast(user)
+    if fc is None:
+        # Only entries the forecaster can't use (e.g. future-dated)
         return jsonify({"error":"no data"}), 400
-    avg_daily = sum(amounts)/len(amounts)
-    predicted_annual = avg_daily * 365
+    predicted_annual = fc['predicted_total']
     # distress heuristic
     distress_prob = min(1.0, predicted_annual / 100000.0)
-    return jsonify({"predicted_annual_expense":predicted_annual, "predicted_annual_savings": max(0,100000-predicted_annual), "distress_probability": distress_prob})
+    return jsonify({"predicted_annual_expense":predicted_annual, "predicted_annual_savings": max(0,100000-predicted_annual),
+                    "distress_probability": distress_prob, "forecast": fc})
+
+@app.route('/predict/batch', methods=['POST'])
+def predict_batch_route():
+    # Score many amounts in one vectorized model call: {"amounts": [...]}
+    payload = request.get_json(silent=True) or {}
+    amounts = payload.get('amounts')
+    if not isinstance(amounts, list) or not amounts:
+        return jsonify({"error":"expected a non-empty 'amounts' list"}), 400
+    try:
+        amounts = [float(a) for a in amounts]
+    except (TypeError, ValueError):
+        return jsonify({"error":"amounts must be numbers"}), 400
+    return jsonify({"predictions": predict_from_amounts(amounts)})
+
+@app.route('/models', methods=['GET'])
+def models_route():
+    # Active model version, the versions on disk and the last load error (of the prediction worker)
+    return jsonify(prediction.model_status())
+
+@app.route('/models/reload', methods=['POST'])
+@login_required  # changes what every user gets, so never anonymous, even without REQUIRE_LOGIN
+def models_reload_route():
+    # Pick up a newly activated version now instead of at the next reload interval
+    return jsonify(prediction.reload_models())
 
 @app.route('/insights', methods=['GET'])
 def insights_route():
     # Provide simple rule-based insights (LLM placeholder)
-    data = load_data()
-    breakdown = {}
-    for d in data:
-        cat = d.get('category','Misc')
-        breakdown[cat] = breakdown.get(cat,0) + d.get('amount',0)
+    breakdown = storage.category_totals(user=user_id())
     sorted_cats = sorted(breakdown.items(), key=lambda x: x[1], reverse=True)
     top = sorted_cats[0] if sorted_cats else ("None",0)
     message = f"Top spending category: {top[0]} with total {top[1]}. Consider reducing this by 10%."
     return jsonify({"insights": message})
 
 if __name__ == '__main__':
-    # Ensure folders exist
+    # Development server, one process; production runs serve.py (or wsgi.py under another server).
+    # APP_DEBUG=1 turns on the debugger, which shows tracebacks to the client
     os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-    # Ensure data file exists
-    if not os.path.exists(DATA_FILE):
-        with open(DATA_FILE,'w') as f:
-            json.dump([], f)
-    app.run(host='0.0.0.0', port=5000, debug=True, use_reloader=False)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=5000, debug=os.environ.get('APP_DEBUG', '0') != '0', use_reloader=False)
\ No newline at end of file
@@ -0,0 +1,569 @@
+"""
+Benchmark suite for the hot paths: OCR per strategy, amount extraction,
+predictions, request latency through the Flask test client, the cold
+start of the web process and the pre-fork server's throughput and memory
+per worker.
+
+Every section adds its numbers to one JSON document, stamped with the git
+commit and host, so a run can be compared with one from another commit:
+
+    python bench.py [--sections ocr,extraction,prediction,requests,startup,serve]
+                    [--history 1000,100000,1000000] [--out bench.json]
+    python bench.py --compare before.json after.json
+
+Receipts are drawn locally with OpenCV, and the request section runs
+against throwaway databases seeded with N synthetic entries, so runs never
+touch finance.db, uploads/ or the OCR cache.
+"""
+import argparse, contextlib, datetime, io, json, os, platform, random, subprocess, sys, tempfile, time
+
+SECTIONS = ['ocr', 'extraction', 'prediction', 'requests', 'startup', 'serve']
+DEFAULT_HISTORY = [1000, 100000, 1000000]
+CATEGORIES = ['food', 'bus', 'bill', 'groceries', 'Misc']
+
+# (lines, expected amount) drawn onto the synthetic receipts
+SYNTHETIC_RECEIPTS = [
+    (["CITY SUPERMARKET", "Milk 2x 48.00", "Bread 35.00", "Eggs 72.00", "GRAND TOTAL 155.00"], 155.0),
+    (["Payment successful", "Paid to RAVI STORES", "Rs. 1,750", "UPI Ref 4512 7788 1034"], 1750.0),
+    (["INVOICE 20931", "Service charge 120.00", "GST 18% 21.60", "AMOUNT PAYABLE 141.60"], 141.6),
+]
+
+
+def percentiles(samples):
+    """p50/p95/max/mean of a list of durations, in milliseconds"""
+    ordered = sorted(samples)
+    if not ordered:
+        return {}
+
+    def pick(q):
+        return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+    return {
+        "n": len(ordered),
+        "p50_ms": round(pick(0.5) * 1000, 3),
+        "p95_ms": round(pick(0.95) * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 3),
+    }
+
+
+def timed(fn, repeat):
+    """Per-call durations (seconds) of `repeat` calls to fn, its stdout discarded"""
+    samples = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeat):
+            started = time.perf_counter()
+            fn()
+            samples.append(time.perf_counter() - started)
+    return samples
+
+
+def draw_receipt(lines, scale=1.0):
+    """White receipt on a darker table, as a BGR image"""
+    import cv2
+    import numpy as np
+    line_h = int(48 * scale)
+    width, height = int(720 * scale), line_h * (len(lines) + 2)
+    paper = np.full((height, width, 3), 250, dtype=np.uint8)
+    for i, line in enumerate(lines, 1):
+        cv2.putText(paper, line, (int(24 * scale), i * line_h + line_h // 2),
+                    cv2.FONT_HERSHEY_SIMPLEX, 1.0 * scale, (20, 20, 20), max(1, int(2 * scale)))
+    margin = int(60 * scale)
+    img = np.full((height + 2 * margin, width + 2 * margin, 3), 90, dtype=np.uint8)
+    img[margin:margin + height, margin:margin + width] = paper
+    return img
+
+
+def encode_png(img):
+    import cv2
+    ok, encoded = cv2.imencode('.png', img)
+    if not ok:
+        raise RuntimeError("could not encode synthetic receipt")
+    return encoded.tobytes()
+
+
+# Sections
+
+def bench_ocr(repeat=3):
+    """
+    Each strategy on its own (preprocessing and readtext timed separately,
+    plus whether its text alone yields the expected amount), then the whole
+    try_ocr_detailed() pipeline in cascade and full mode, and the ONNX
+    engines against the stock reader when they have been exported.
+    """
+    import cv2
+    import ocr
+    import ocr_preprocess
+    receipts = [(draw_receipt(lines), expected) for lines, expected in SYNTHETIC_RECEIPTS]
+    tiers = bench_ocr_tiers(receipts)
+    with contextlib.redirect_stdout(io.StringIO()):
+        reader = ocr.get_ocr_reader()
+    if reader is None:
+        return {"available": False, "reason": "EasyOCR reader could not be initialised", "tiers": tiers}
+
+    strategies = {}
+    for name, _, fn in ocr.OCR_STRATEGIES:
+        prep_samples, read_samples, hits = [], [], 0
+        for img, expected in receipts:
+            with contextlib.redirect_stdout(io.StringIO()):
+                img, _ = ocr_preprocess.prepare(img, readtext=reader.readtext)
+            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+            prep_samples += timed(lambda: fn(img, gray), repeat)
+            variant = fn(img, gray)
+            read_samples += timed(lambda: reader.readtext(variant, detail=0, paragraph=False), repeat)
+            with contextlib.redirect_stdout(io.StringIO()):
+                text = ' '.join(reader.readtext(variant, detail=0, paragraph=False))
+                amounts = ocr.extract_amounts_from_text(text)
+            hits += bool(amounts) and amounts[0] == expected
+        strategies[name] = {"preprocess": percentiles(prep_samples), "readtext": percentiles(read_samples),
+                            "hit_rate": round(hits / len(receipts), 3)}
+
+    pipeline = {}
+    for mode, cascade in (('cascade', True), ('full', False)):
+        samples, passes = [], 0
+        for img, _ in receipts:
+            data = encode_png(img)
+            samples += timed(lambda: ocr.try_ocr_detailed(data, cascade=cascade), repeat)
+            with contextlib.redirect_stdout(io.StringIO()):
+                passes += len(ocr.try_ocr_detailed(data, cascade=cascade)['strategies_run'])
+        pipeline[mode] = dict(percentiles(samples), passes_per_receipt=round(passes / len(receipts), 2))
+    import ocr_onnx
+    engines = None
+    if os.path.exists(ocr_onnx.model_path(ocr_onnx.OCR_ONNX_DIR, 'detector', 'fp32')):
+        # Stock PyTorch reader vs. the exported ONNX models (fp32 / int8), each in its own process
+        engines = ocr_onnx.check(repeat=repeat)
+    return {"available": True, "receipts": len(receipts), "strategies": strategies, "pipeline": pipeline,
+            "tiers": tiers, "engines": engines}
+
+
+def bench_ocr_tiers(receipts):
+    """Share of receipts the fast backend settles without EasyOCR, and each tier's latency"""
+    import ocr
+    import ocr_backends
+    fast = ocr_backends.fast_backend()
+    if fast is None:
+        return {"fast_backend": None, "reason": f"fast backend {ocr_backends.OCR_FAST_BACKEND!r} unavailable"}
+    resolved, correct, seconds = 0, 0, {}
+    for img, expected in receipts:
+        details = ocr.try_ocr_detailed(encode_png(img))
+        for tier, spent in details['tier_seconds'].items():
+            seconds.setdefault(tier, []).append(spent)
+        if details['tier'] == fast.name:
+            resolved += 1
+            amounts = ocr.extract_amounts_from_text(details['text'])
+            correct += bool(amounts) and amounts[0] == expected
+    return {
+        "fast_backend": fast.name,
+        "fast_hit_rate": round(resolved / len(receipts), 3),
+        "fast_correct": correct,
+        "seconds": {tier: percentiles(samples) for tier, samples in seconds.items()},
+    }
+
+
+def bench_extraction(iterations=200):
+    """extract_amounts_from_text() over the fixture corpus and one long OCR-sized document"""
+    import bench_extraction
+    import ocr
+    texts = [text for text, _ in bench_extraction.load_fixtures()]
+    long_doc = ' '.join(texts) * 4
+    short = bench_extraction.bench(ocr.extract_amounts_from_text, texts, iterations)
+    long = bench_extraction.bench(ocr.extract_amounts_from_text, [long_doc], iterations)
+    chars = sum(len(t) for t in texts) * iterations
+    return {
+        "corpus": {"texts": len(texts), **short, "chars_per_sec": round(chars / short['seconds'], 1)},
+        "long": {"chars": len(long_doc), **long,
+                 "chars_per_sec": round(len(long_doc) * iterations / long['seconds'], 1)},
+    }
+
+
+def bench_prediction(n=1000, repeat=5):
+    """predict_from_amount() once per amount vs. one predict_from_amounts() call, plus the forecast backtest"""
+    import prediction
+    rng = random.Random(0)
+    amounts = [round(rng.uniform(10, 5000), 2) for _ in range(n)]
+    with contextlib.redirect_stdout(io.StringIO()):
+        models = prediction.warm_up()
+    single = timed(lambda: [prediction.predict_from_amount(a) for a in amounts], repeat)
+    batch = timed(lambda: prediction.predict_from_amounts(amounts), repeat)
+    single_us, batch_us = min(single) / n * 1e6, min(batch) / n * 1e6
+    import forecast
+    return {
+        "forecast_backtest": forecast.backtest(*forecast.synthetic_series()),
+        "models": models,
+        "amounts": n,
+        "single_us_per_amount": round(single_us, 3),
+        "batch_us_per_amount": round(batch_us, 3),
+        "speedup": round(single_us / batch_us, 2),
+    }
+
+
+def seed_history(storage, n, chunk=50000):
+    """Insert n synthetic entries spread over ~3 years, then rebuild the aggregates once"""
+    from sqlalchemy import insert
+    from storage import entries, entry_to_row
+    rng = random.Random(n)
+    start = datetime.date.today() - datetime.timedelta(days=1095)
+    with storage.engine.begin() as conn:
+        for offset in range(0, n, chunk):
+            rows = []
+            for _ in range(min(chunk, n - offset)):
+                day = start + datetime.timedelta(days=rng.randrange(1096))
+                rows.append(entry_to_row({
+                    "date": day.isoformat(), "amount": round(rng.uniform(10, 2000), 2),
+                    "category": rng.choice(CATEGORIES), "source": "manual",
+                    "predicted_annual_expense": 0.0, "distress_probability": 0.0, "advice": "",
+                }))
+            conn.execute(insert(entries), rows)
+    storage.rebuild_aggregates()
+
+
+def bench_requests(history=DEFAULT_HISTORY, repeat=20, upload_timeout=120):
+    """
+    Test-client latency of GET /, /result, /history and POST /upload (the request
+    itself and until its OCR job is done) with n entries already stored.
+    """
+    workdir = tempfile.mkdtemp(prefix='bench-')
+    # Must be in place before app.py is imported: it opens storage and the OCR cache at import
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'boot.db')}"
+    os.environ['APP_WARMUP'] = '0'
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    os.environ.setdefault('OCR_CACHE_DIR', os.path.join(workdir, 'ocr_cache'))
+    os.environ.setdefault('OCR_STATS_FILE', os.path.join(workdir, 'ocr_strategy_stats.json'))
+    with contextlib.redirect_stdout(io.StringIO()):
+        import app as app_module
+    from storage import Storage
+    from upload_store import UploadStore
+    app_module.upload_store = UploadStore(os.path.join(workdir, 'uploads'))
+    client = app_module.app.test_client()
+    receipt = draw_receipt(SYNTHETIC_RECEIPTS[0][0])
+
+    results = {}
+    for n in history:
+        storage = Storage(f"sqlite:///{os.path.join(workdir, f'history-{n}.db')}")
+        seed_started = time.perf_counter()
+        seed_history(storage, n)
+        app_module.storage = storage
+        row = {"seed_seconds": round(time.perf_counter() - seed_started, 3)}
+        for route in ('/', '/result', '/history'):
+            responses = []
+            row[route] = percentiles(timed(lambda: responses.append(client.get(route)), repeat))
+            row[route]['bytes'] = len(responses[-1].data)
+            row[route]['status'] = responses[-1].status_code
+
+        request_samples, done_samples = [], []
+        with contextlib.redirect_stdout(io.StringIO()):
+            for i in range(repeat):
+                img = receipt.copy()
+                img[0, 0] = (i % 256, i // 256 % 256, n % 256)  # new bytes, so no OCR cache hits
+                data = encode_png(img)
+                started = time.perf_counter()
+                resp = client.post('/upload?filename=bench.png', data=data, content_type='image/png')
+                request_samples.append(time.perf_counter() - started)
+                if resp.status_code == 202:
+                    deadline = started + upload_timeout
+                    job = {}
+                    while time.perf_counter() < deadline:
+                        job = client.get(resp.get_json()['status_url']).get_json()
+                        if job['status'] in ('done', 'failed'):
+                            break
+                        time.sleep(0.005)
+                    if job.get('status') == 'done':
+                        done_samples.append(time.perf_counter() - started)
+        row['/upload'] = {"request": percentiles(request_samples), "until_done": percentiles(done_samples)}
+        results[str(n)] = row
+        storage.engine.dispose()
+    app_module.ocr_jobs.shutdown(wait=False)
+    return results
+
+
+# Start-up
+
+IMPORT_BUDGET_MS = float(os.environ.get('BENCH_IMPORT_BUDGET_MS', 1000))
+HEAVY_MODULES = ['torch', 'cv2', 'sklearn', 'scipy', 'easyocr', 'onnxruntime', 'pandas', 'numpy']
+
+# Imports app, serves the pages that need no OCR or models, and lists the heavy modules loaded
+_SERVE_SCRIPT = """
+import json, sys
+heavy = %r
+import app
+at_import = [m for m in heavy if m in sys.modules]
+client = app.app.test_client()
+client.get('/')
+client.get('/result')
+client.post('/manual-entry', data={'amount': '120.50', 'category': 'food'})
+print(json.dumps({"at_import": at_import, "after_serving": [m for m in heavy if m in sys.modules]}))
+"""
+
+
+def _app_subprocess(args, workdir):
+    env = dict(os.environ, APP_WARMUP='0', LOG_LEVEL='WARNING',
+               DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'startup.db')}",
+               OCR_CACHE_DIR=os.path.join(workdir, 'ocr_cache'),
+               OCR_STATS_FILE=os.path.join(workdir, 'ocr_strategy_stats.json'),
+               OCR_TIER_STATS_FILE=os.path.join(workdir, 'ocr_tier_stats.json'),
+               PYTHONPATH=os.path.dirname(os.path.abspath(__file__)))
+    return subprocess.run([sys.executable] + args, capture_output=True, text=True, env=env, cwd=workdir, check=True)
+
+
+def parse_importtime(stderr, module='app', top=8):
+    """(cumulative ms of `module`, its slowest direct imports) from `python -X importtime` output"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if not cumulative.strip().isdigit():
+            continue  # the header row
+        rows.append((name[1:].rstrip(), int(cumulative) / 1000))
+    # A module's own imports are printed just before it, one level deeper
+    total, children, pending = None, [], []
+    for name, ms in rows:
+        if not name.startswith(' '):
+            if name == module:
+                total, children = ms, pending
+            pending = []
+        elif name.startswith('  ') and not name.startswith('   '):
+            pending.append((name.strip(), ms))
+    children.sort(key=lambda c: -c[1])
+    return total, {name: round(ms, 1) for name, ms in children[:top]}
+
+
+def bench_startup(repeat=3):
+    """
+    Cold `import app` time (the best of `repeat` fresh interpreters) and which
+    heavy libraries are loaded at import and after serving /, /result and
+    /manual-entry. None of those should need torch, OpenCV or scikit-learn.
+    """
+    workdir = tempfile.mkdtemp(prefix='bench-startup-')
+    best, slowest = None, {}
+    for _ in range(repeat):
+        proc = _app_subprocess(['-X', 'importtime', '-c', 'import app'], workdir)
+        total, children = parse_importtime(proc.stderr)
+        if total is not None and (best is None or total < best):
+            best, slowest = total, children
+    serve = json.loads(_app_subprocess(['-c', _SERVE_SCRIPT % HEAVY_MODULES], workdir).stdout.strip().splitlines()[-1])
+    return {
+        "app_import_ms": round(best, 1) if best is not None else None,
+        "budget_ms": IMPORT_BUDGET_MS,
+        "within_budget": best is not None and best <= IMPORT_BUDGET_MS,
+        "slowest_imports_ms": slowest,
+        "heavy_at_import": serve["at_import"],
+        "heavy_after_serving": serve["after_serving"],
+    }
+
+
+# Pre-fork server
+
+def _memory_mb(pid):
+    """Rss, Pss and private (unshared) memory of a process from /proc/<pid>/smaps_rollup"""
+    fields = {}
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 3 and parts[2] == 'kB':
+                    fields[parts[0].rstrip(':')] = int(parts[1])
+    except OSError:
+        return {}
+    return {"rss_mb": round(fields.get('Rss', 0) / 1024, 1), "pss_mb": round(fields.get('Pss', 0) / 1024, 1),
+            "private_mb": round((fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0)) / 1024, 1)}
+
+
+def _children(pid):
+    found = []
+    for name in os.listdir('/proc'):
+        if name.isdigit():
+            try:
+                with open(f'/proc/{name}/stat') as f:
+                    if int(f.read().rsplit(')', 1)[1].split()[1]) == pid:
+                        found.append(int(name))
+            except (OSError, IndexError, ValueError):
+                pass
+    return found
+
+
+def _load(url, body, seconds, clients):
+    """Requests/sec of `clients` threads sending the same request for `seconds`"""
+    import threading, urllib.request
+    done, failed = [0] * clients, [0] * clients
+    deadline = time.perf_counter() + seconds
+
+    def client(i):
+        while time.perf_counter() < deadline:
+            request = urllib.request.Request(url, data=body, headers={'Content-Type': 'application/json'})
+            try:
+                urllib.request.urlopen(request, timeout=30).read()
+                done[i] += 1
+            except OSError:
+                failed[i] += 1
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return {"rps": round(sum(done) / (time.perf_counter() - started), 1), "errors": sum(failed)}
+
+
+def bench_serve(workers=(1, 2, 4), seconds=3, clients=8):
+    """
+    serve.py with 1, 2 and 4 workers: requests/sec of GET / and of a
+    100-amount POST /predict/batch, and the memory of each worker. A
+    worker's private memory is what one more worker costs; the last run
+    repeats the largest count with APP_WARMUP=0, where every worker loads
+    the models itself after the fork instead of sharing the master's.
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    workdir = tempfile.mkdtemp(prefix='bench-serve-')
+    env = dict(os.environ, PYTHONPATH=here, LOG_LEVEL='WARNING', MODEL_DIR=os.path.join(workdir, 'models'),
+               DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'serve.db')}",
+               OCR_CACHE_DIR=os.path.join(workdir, 'ocr_cache'), OCR_WORKERS='1',
+               OCR_STATS_FILE=os.path.join(workdir, 'ocr_strategy_stats.json'),
+               OCR_TIER_STATS_FILE=os.path.join(workdir, 'ocr_tier_stats.json'))
+    subprocess.run([sys.executable, os.path.join(here, 'train_models.py')], env=env, cwd=workdir,
+                   check=True, capture_output=True)
+    batch = json.dumps({"amounts": [round(10 + i * 37.5, 2) for i in range(100)]}).encode()
+    runs = [(n, True) for n in workers] + [(max(workers), False)]
+    results = {}
+    for n, preload in runs:
+        import socket, signal, urllib.request
+        with socket.socket() as s:
+            s.bind(('127.0.0.1', 0))
+            port = s.getsockname()[1]
+        url = f'http://127.0.0.1:{port}'
+        proc = subprocess.Popen([sys.executable, os.path.join(here, 'serve.py'), '--bind', f'127.0.0.1:{port}',
+                                 '--workers', str(n)], env=dict(env, APP_WARMUP='1' if preload else '0'),
+                                cwd=workdir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            deadline = time.time() + 120
+            while time.time() < deadline:
+                try:
+                    if urllib.request.urlopen(f'{url}/readyz', timeout=2).status == 200:
+                        break
+                except OSError:
+                    time.sleep(0.2)
+            # Unmeasured round first: without preload each worker loads the models on its first prediction
+            _load(f'{url}/predict/batch', batch, 2, clients)
+            row = {"/": _load(f'{url}/', None, seconds, clients),
+                   "/predict/batch": _load(f'{url}/predict/batch', batch, seconds, clients)}
+            pids = _children(proc.pid)
+            per_worker = [_memory_mb(pid) for pid in pids]
+            row["master"] = _memory_mb(proc.pid)
+            row["workers"] = len(pids)
+            for key in ('rss_mb', 'pss_mb', 'private_mb'):
+                values = [m[key] for m in per_worker if key in m]
+                row[f"worker_{key}"] = round(sum(values) / len(values), 1) if values else None
+            results[str(n) if preload else f"{n}-no-preload"] = row
+        finally:
+            proc.send_signal(signal.SIGTERM)
+            try:
+                proc.wait(timeout=60)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+    first = results[str(workers[0])]
+    for n in workers:
+        row = results[str(n)]
+        for route in ('/', '/predict/batch'):
+            row[route]["scaling"] = round(row[route]["rps"] / first[route]["rps"], 2) if first[route]["rps"] else None
+    results["mb_per_additional_worker"] = results[str(max(workers))]["worker_private_mb"]
+    results["mb_per_additional_worker_no_preload"] = results[f"{max(workers)}-no-preload"]["worker_private_mb"]
+    return results
+
+
+# Output
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(sections=SECTIONS, history=DEFAULT_HISTORY, repeat=20, iterations=200):
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.datetime.now().isoformat(timespec='seconds'),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+    }
+    for section in sections:
+        started = time.perf_counter()
+        if section == 'ocr':
+            report['ocr'] = bench_ocr()
+        elif section == 'extraction':
+            report['extraction'] = bench_extraction(iterations)
+        elif section == 'prediction':
+            report['prediction'] = bench_prediction()
+        elif section == 'requests':
+            report['requests'] = bench_requests(history, repeat)
+        elif section == 'startup':
+            report['startup'] = bench_startup()
+        elif section == 'serve':
+            report['serve'] = bench_serve()
+        else:
+            raise ValueError(f"unknown section {section!r}")
+        print(f"{section}: done in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+    return report
+
+
+def flatten(report, prefix=''):
+    """{'a.b.c': number} for every numeric leaf"""
+    flat = {}
+    for key, value in report.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, path + '.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[path] = value
+    return flat
+
+
+def compare(before, after):
+    """(metric, before, after, change %) for every numeric metric both reports share"""
+    old, new = flatten(before), flatten(after)
+    rows = []
+    for key in sorted(old.keys() & new.keys()):
+        if key.startswith('meta.'):
+            continue
+        change = (new[key] - old[key]) / old[key] * 100 if old[key] else None
+        rows.append((key, old[key], new[key], None if change is None else round(change, 1)))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sections', default=','.join(SECTIONS), help='comma-separated subset of ' + ','.join(SECTIONS))
+    parser.add_argument('--history', default=','.join(map(str, DEFAULT_HISTORY)),
+                        help='stored entry counts for the request section')
+    parser.add_argument('--repeat', type=int, default=20, help='requests per route and history size')
+    parser.add_argument('--iterations', type=int, default=200, help='passes over the extraction corpus')
+    parser.add_argument('--out', help='write the JSON report here instead of stdout')
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'), help='diff two saved reports')
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            before = json.load(f)
+        with open(args.compare[1]) as f:
+            after = json.load(f)
+        print(f"{before['meta'].get('commit')} -> {after['meta'].get('commit')}")
+        for key, old, new, change in compare(before, after):
+            print(f"{key:<60} {old:>14} {new:>14} {'' if change is None else f'{change:+.1f}%':>9}")
+        return 0
+
+    report = run([s for s in args.sections.split(',') if s],
+                 [int(n) for n in args.history.split(',') if n], args.repeat, args.iterations)
+    output = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
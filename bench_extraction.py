@@ -0,0 +1,211 @@
+"""
+Micro-benchmark: single-pass extraction engine vs. the old regex cascade
+
+Runs both implementations over the amount fixtures in test_extraction.py and
+test_rupee_fix.py (read with ast, so those scripts aren't executed), checks
+they rank identically, and reports calls/sec for each.
+
+    python bench_extraction.py [--iterations N] [--json]
+"""
+import argparse, ast, contextlib, io, json, re, sys, time
+
+import extraction
+
+FIXTURE_FILES = ['test_extraction.py', 'test_rupee_fix.py']
+
+
+def load_fixtures(files=FIXTURE_FILES):
+    """The (text, description) pairs assigned to `test_cases` in each file"""
+    fixtures = []
+    for path in files:
+        with open(path, 'r', encoding='utf-8') as f:
+            tree = ast.parse(f.read())
+        for node in tree.body:
+            if isinstance(node, ast.Assign) and any(getattr(t, 'id', None) == 'test_cases' for t in node.targets):
+                fixtures.extend(ast.literal_eval(node.value))
+    return fixtures
+
+
+def legacy_extract_scored_amounts(text):
+    """The pre-engine regex cascade from ocr.py, kept verbatim as the baseline"""
+    if not text:
+        return []
+    
+    # CRITICAL FIX: Clean up misread rupee symbols that appear as digits
+    # OCR often misreads ₹ symbol as "2" when followed by numbers
+    # Only apply this fix in UPI/payment contexts where we expect small amounts
+    # Look for patterns like "Paid to ... 21,750" or "Debited ... 21,750"
+    text_cleaned = text
+    
+    # Check if this looks like a UPI/payment receipt (strong indicators)
+    is_upi_context = bool(re.search(
+        r'(?:PAID\s+TO|DEBITED|CREDITED|TRANSACTION|UPI|TRANSFER|UTR)',
+        text.upper()
+    ))
+    
+    if is_upi_context:
+        # In UPI context, amounts like "21,750" are suspicious (likely ₹1,750)
+        # But "21,750.50" or amounts > 22,000 are likely legitimate
+        # Pattern: fix "2X,XXX" where X is 1-9 (e.g., 21,750 but not 22,000 or higher)
+        text_cleaned = re.sub(r'\b2([1-9],\d{3})(?![,\d])\b', r'\1', text_cleaned)  # 21,750 -> 1,750 (not followed by more digits)
+        text_cleaned = re.sub(r'\b2([1-9]\d{2,3})(?![,\d])\b', r'\1', text_cleaned)   # 21750 -> 1750 (3-4 digits after 2)
+        
+        if text != text_cleaned:
+            print("⚠️ UPI context detected - fixed likely rupee symbol misread (₹ → '2')")
+    
+    # Convert to uppercase for easier matching
+    text_upper = text_cleaned.upper()
+    amounts = []
+    amount_contexts = []  # Store (amount, context_score) tuples
+    
+    # High priority patterns - look for keywords like TOTAL, AMOUNT, etc.
+    priority_patterns = [
+        (r'(?:TOTAL|GRAND\s*TOTAL|NET\s*TOTAL|AMOUNT\s*PAYABLE|BILL\s*AMOUNT|INVOICE\s*TOTAL)[\s:]*(?:RS\.?|₹|INR)?\s*(\d+(?:[,\s]\d{3})*(?:\.\d{1,2})?)', 100),
+        (r'(?:TO\s*PAY|PAYABLE|BALANCE|DUE|BALANCE\s*DUE)[\s:]*(?:RS\.?|₹|INR)?\s*(\d+(?:[,\s]\d{3})*(?:\.\d{1,2})?)', 90),
+        (r'(?:PAID|PAYMENT|RECEIVED|AMOUNT\s*PAID)[\s:]*(?:RS\.?|₹|INR)?\s*(\d+(?:[,\s]\d{3})*(?:\.\d{1,2})?)', 80),
+        # UPI/Payment specific patterns - PAID TO and DEBITED are critical for UPI
+        (r'(?:PAID\s+TO|DEBITED|CREDITED|TRANSFERRED)[\s\w]*?(?:RS\.?|₹|INR)?\s*(\d+(?:[,\s]\d{3})*(?:\.\d{1,2})?)', 95),
+    ]
+    
+    # Check high priority patterns first
+    for pattern, score in priority_patterns:
+        matches = re.findall(pattern, text_upper, re.IGNORECASE)
+        for match in matches:
+            try:
+                cleaned = match.replace(',', '').replace(' ', '').strip()
+                value = float(cleaned)
+                if 1 <= value <= 10000000:  # Increased max to 10M
+                    amount_contexts.append((value, score))
+                    print(f"Found priority amount: {value} (score: {score}, pattern: {pattern[:50]})")
+            except Exception:
+                pass
+    
+    # If we found high-priority amounts, return the highest scored one
+    if amount_contexts:
+        amount_contexts.sort(key=lambda x: (x[1], x[0]), reverse=True)
+        return amount_contexts[:5]  # Top 5 candidates
+    
+    # Medium priority - currency prefixed amounts (more variations)
+    medium_patterns = [
+        # Direct rupee symbol patterns - these should catch ₹1,750 correctly
+        (r'₹\s*(\d{1,3}(?:[,\s]\d{3})*(?:\.\d{1,2})?)', 70),  # ₹ symbol with formatted number
+        (r'₹\s*(\d+(?:\.\d{1,2})?)', 65),  # ₹ symbol with simple number
+        (r'RS\.?\s*(\d{1,3}(?:[,\s]\d{3})*(?:\.\d{1,2})?)', 55),  # RS.
+        (r'INR\s*(\d{1,3}(?:[,\s]\d{3})*(?:\.\d{1,2})?)', 55),  # INR
+        (r'RS\.?\s*(\d+(?:\.\d{1,2})?)', 45),  # Simple RS
+        # Handle amounts with comma as decimal separator (some regions)
+        (r'₹\s*(\d{1,3}(?:\.\d{3})*,\d{2})', 50),  # European style: ₹1.234,56
+        # Handle cases where ₹ might be directly attached to number (no space)
+        (r'₹(\d{1,3}(?:,\d{3})*)', 68),  # ₹1,750 (no space)
+        (r'₹(\d+)', 63),  # ₹1750 (no space, no comma)
+    ]
+    
+    for pattern, score in medium_patterns:
+        matches = re.findall(pattern, text_upper, re.IGNORECASE)
+        for match in matches:
+            try:
+                # Handle European decimal format
+                if ',' in match and match.count(',') == 1 and match.count('.') > 0:
+                    cleaned = match.replace('.', '').replace(',', '.').strip()
+                else:
+                    cleaned = match.replace(',', '').replace(' ', '').strip()
+                value = float(cleaned)
+                if 10 <= value <= 10000000:  # Minimum 10 for currency-prefixed
+                    amount_contexts.append((value, score))
+                    print(f"Found currency-prefixed amount: {value} (score: {score})")
+            except Exception as e:
+                print(f"Error parsing medium pattern '{match}': {e}")
+                pass
+    
+    # If we found medium-priority amounts
+    if amount_contexts:
+        amount_contexts.sort(key=lambda x: (x[1], x[0]), reverse=True)
+        return amount_contexts[:5]
+    
+    # Low priority - plain numbers with specific patterns
+    low_patterns = [
+        r'(\d{1,3}(?:,\d{3})+\.\d{2})',  # 1,234.56
+        r'(\d{1,3}(?:,\d{3})+)',  # 1,234 (large numbers with commas)
+        r'(\d{3,}\.\d{2})',  # 123.56 (at least 3 digits before decimal)
+    ]
+    
+    for pattern in low_patterns:
+        matches = re.findall(pattern, text_upper)
+        for match in matches:
+            try:
+                cleaned = match.replace(',', '').replace(' ', '').strip()
+                value = float(cleaned)
+                if 50 <= value <= 10000000:  # Minimum 50 for plain numbers
+                    amounts.append(value)
+                    print(f"Found plain number: {value}")
+            except Exception:
+                pass
+    
+    # Return unique amounts, sorted descending (largest first)
+    unique_amounts = list(set(amounts))
+    unique_amounts.sort(reverse=True)
+    return [(amt, 0) for amt in unique_amounts[:5]]  # Top 5 candidates
+
+
+def engine_extract(text):
+    return extraction.extract(text)
+
+
+def bench(fn, texts, iterations):
+    # The legacy cascade prints every match; keep that out of the terminal but in the timing
+    sink = io.StringIO()
+    with contextlib.redirect_stdout(sink):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            for text in texts:
+                fn(text)
+        elapsed = time.perf_counter() - started
+    calls = iterations * len(texts)
+    return {"calls": calls, "seconds": round(elapsed, 4), "calls_per_sec": round(calls / elapsed, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--json', action='store_true', help='print machine-readable results')
+    args = parser.parse_args()
+
+    fixtures = load_fixtures()
+    texts = [text for text, _ in fixtures]
+    # A long OCR-sized document as well as the one-liners
+    long_doc = ' '.join(texts) * 4
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        mismatches = [text for text in texts + [long_doc]
+                      if legacy_extract_scored_amounts(text) != engine_extract(text)]
+
+    results = {
+        "fixtures": len(fixtures),
+        "mismatches": len(mismatches),
+        "short": {
+            "legacy": bench(legacy_extract_scored_amounts, texts, args.iterations),
+            "engine": bench(engine_extract, texts, args.iterations),
+        },
+        "long": {
+            "chars": len(long_doc),
+            "legacy": bench(legacy_extract_scored_amounts, [long_doc], args.iterations),
+            "engine": bench(engine_extract, [long_doc], args.iterations),
+        },
+    }
+    for case in ('short', 'long'):
+        results[case]["speedup"] = round(results[case]["engine"]["calls_per_sec"] /
+                                         results[case]["legacy"]["calls_per_sec"], 2)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"Fixtures: {results['fixtures']}  (ranking mismatches: {results['mismatches']})")
+        for case in ('short', 'long'):
+            r = results[case]
+            print(f"{case:>5}: legacy {r['legacy']['calls_per_sec']:>10} calls/s | "
+                  f"engine {r['engine']['calls_per_sec']:>10} calls/s | x{r['speedup']}")
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,275 @@
+"""
+Bulk receipt import for backfilling years of receipts at once.
+
+Receipts are OCR'd on a process pool in chunks of BULK_CHUNK_SIZE. Each
+chunk's entries are scored with one batched prediction call and written to
+storage in one transaction, after which a checkpoint file records the
+SHA-256 of every receipt handled so far - rerunning an interrupted import
+skips straight to where it stopped (and never imports the same image
+twice, even when it appears twice in one run). Each entry is dated by its
+receipt: the file's modification time, a zip member's timestamp, or an
+explicit --date. Progress, throughput and per-file failures are reported as
+it goes.
+
+    python bulk_import.py uploads/ [--workers N] [--chunk-size N] [--checkpoint PATH] [--user NAME] [--date YYYY-MM-DD]
+
+The same importer backs POST /upload/bulk (a zip and/or several files).
+"""
+import os, sys, json, time, hashlib, logging, datetime, argparse, threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+import metrics
+
+from ocr_jobs import OCR_WORKERS, _init_worker, _run_ocr
+
+BULK_WORKERS = int(os.environ.get('BULK_WORKERS', OCR_WORKERS))
+BULK_CHUNK_SIZE = int(os.environ.get('BULK_CHUNK_SIZE', 32))
+BULK_CHECKPOINT = os.environ.get('BULK_CHECKPOINT', 'bulk_import_checkpoint.json')
+IMPORT_EXT = {'png', 'jpg', 'jpeg', 'gif', 'pdf'}
+
+log = logging.getLogger(__name__)
+
+
+def find_receipts(directory):
+    """(name relative to directory, path) of every receipt file, sorted"""
+    found = []
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if '.' in name and name.rsplit('.', 1)[1].lower() in IMPORT_EXT:
+                path = os.path.join(root, name)
+                found.append((os.path.relpath(path, directory), path))
+    return sorted(found)
+
+
+def checkpoint_path(path, user):
+    """Each account resumes from its own file: DEFAULT_USER keeps `path`, others get <name>.u<id><ext>"""
+    from storage import DEFAULT_USER
+    if not path or user == DEFAULT_USER:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.u{user}{ext}"
+
+
+class Checkpoint:
+    """Digests of receipts already imported, persisted (merged with the file) after every chunk"""
+    def __init__(self, path=None):
+        self.path = path
+        self.done = set()
+        if path and os.path.exists(path):
+            with open(path, 'r') as f:
+                self.done = set(json.load(f).get('done', []))
+
+    def save(self):
+        if not self.path:
+            return
+        # Another import for the same account (a second web upload, the CLI) may have saved meanwhile
+        try:
+            with open(self.path, 'r') as f:
+                self.done.update(json.load(f).get('done', []))
+        except (OSError, ValueError):
+            pass
+        tmp = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump({"done": sorted(self.done), "updated_at": time.time()}, f)
+        os.replace(tmp, self.path)
+
+
+def file_date(path):
+    """ISO date of the file's modification time, or None if it can't be read"""
+    try:
+        return datetime.date.fromtimestamp(os.path.getmtime(path)).isoformat()
+    except (OSError, ValueError, OverflowError):
+        return None
+
+
+def build_entry(filename, ocr_result, original_filename=None, date=None):
+    """Entry for an OCR result, same fields as an /upload entry minus predictions"""
+    amounts = ocr_result.get('amounts') or []
+    entry = {
+        "date": date or datetime.date.today().isoformat(),
+        "filename": filename,
+        "original_filename": original_filename or filename,
+        "extracted_amount": amounts[0] if amounts else None,
+        "all_detected_amounts": amounts[:5],
+        "ocr_text": (ocr_result.get('text') or '')[:500],
+        "source": "bulk",
+    }
+    if entry['extracted_amount'] is not None:
+        entry['amount'] = entry['extracted_amount']
+    return entry
+
+
+class BulkImporter:
+    def __init__(self, storage, workers=BULK_WORKERS, chunk_size=BULK_CHUNK_SIZE,
+                 checkpoint=None, cache=None, executor=None, on_progress=None, user=0, date=None):
+        self.storage = storage
+        self.user = user  # entries are written to this user's partition
+        self.date = date  # date of every entry; otherwise each receipt's own
+        self.workers = workers
+        self.chunk_size = max(1, chunk_size)
+        self.checkpoint = checkpoint or Checkpoint()
+        self.cache = cache
+        self._executor = executor
+        self.on_progress = on_progress
+        self._lock = threading.Lock()
+        self._seen = set()  # digests handled in this run, before the checkpoint has them
+        self._stopping = threading.Event()
+        self._finished = threading.Event()
+        self.progress = {"status": "pending", "total": 0, "processed": 0, "imported": 0,
+                         "skipped": 0, "failed": 0, "chunks": 0, "elapsed_seconds": 0.0,
+                         "receipts_per_sec": None, "failures": [], "finished_at": None}
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.progress, failures=list(self.progress['failures']))
+
+    def wait(self, timeout=None):
+        """True once run() has returned"""
+        return self._finished.wait(timeout)
+
+    def stop(self, reason):
+        """Mark the import failed now; run() stops before its next chunk"""
+        self._stopping.set()
+        if self.snapshot()['finished_at'] is None:
+            self._update(status="failed", error=reason, finished_at=time.time())
+
+    def _update(self, **fields):
+        with self._lock:
+            self.progress.update(fields)
+            elapsed = self.progress['elapsed_seconds']
+            if elapsed:
+                self.progress['receipts_per_sec'] = round(self.progress['processed'] / elapsed, 2)
+        if self.on_progress:
+            self.on_progress(self.snapshot())
+
+    def run(self, receipts):
+        """
+        Import [(name, path), ...] - or (name, path, date) where the date is
+        known, e.g. from a zip member; returns the final progress snapshot.
+        """
+        started = time.perf_counter()
+        self._update(status="running", total=len(receipts))
+        executor = self._executor
+        owned = executor is None
+        if owned:
+            executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker)
+        try:
+            for i in range(0, len(receipts), self.chunk_size):
+                if self._stopping.is_set():
+                    return self.snapshot()
+                self._run_chunk(receipts[i:i + self.chunk_size], executor)
+                p = self.snapshot()
+                self._update(chunks=p['chunks'] + 1, elapsed_seconds=round(time.perf_counter() - started, 3))
+            self._update(status="done", elapsed_seconds=round(time.perf_counter() - started, 3),
+                         finished_at=time.time())
+        except Exception as e:
+            if self._stopping.is_set():
+                return self.snapshot()
+            log.exception("bulk import failed user=%s", self.user)
+            self._update(status="failed", error=str(e), elapsed_seconds=round(time.perf_counter() - started, 3),
+                         finished_at=time.time())
+        finally:
+            if owned:
+                executor.shutdown(wait=True)
+            self._finished.set()
+        return self.snapshot()
+
+    def _run_chunk(self, chunk, executor):
+        from prediction import predict_from_amounts
+        from ocr import record_outcome, is_cacheable
+        skipped, failures = 0, []
+        results = []  # (name, path, digest, ocr_result)
+        futures = {}
+        for name, path, *date in chunk:
+            date = self.date or (date[0] if date else None) or file_date(path)
+            try:
+                with open(path, 'rb') as f:
+                    data = f.read()
+            except OSError as e:
+                failures.append({"file": name, "error": str(e)})
+                continue
+            digest = hashlib.sha256(data).hexdigest()
+            if digest in self.checkpoint.done or digest in self._seen:
+                skipped += 1
+                continue
+            self._seen.add(digest)
+            cached = self.cache.get(self.cache.key_for_digest(digest)) if self.cache else None
+            if cached is not None:
+                results.append((name, path, digest, date, cached))
+            else:
+                futures[executor.submit(_run_ocr, data)] = (name, path, digest, date)
+
+        for future in as_completed(futures):
+            name, path, digest, date = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                failures.append({"file": name, "error": str(e)})
+                continue
+            metrics.merge(result.pop('metrics', None))
+            record_outcome(result)
+            if self.cache and is_cacheable(result):
+                self.cache.put(self.cache.key_for_digest(digest), result)
+            results.append((name, path, digest, date, result))
+
+        # One prediction call and one transaction for the whole chunk
+        entries = [build_entry(os.path.basename(path), result, name, date) for name, path, _, date, result in results]
+        scored = [e for e in entries if e.get('amount') is not None]
+        for entry, pred in zip(scored, predict_from_amounts([e['amount'] for e in scored])):
+            entry.update(pred)
+        self.storage.add_entries(entries, user=self.user)
+        self.checkpoint.done.update(digest for _, _, digest, _, _ in results)
+        self.checkpoint.save()
+
+        p = self.snapshot()
+        self._update(processed=p['processed'] + len(chunk), imported=p['imported'] + len(entries),
+                     skipped=p['skipped'] + skipped, failed=p['failed'] + len(failures),
+                     failures=p['failures'] + failures)
+
+
+def _print_progress(p):
+    rate = f"{p['receipts_per_sec']} receipts/s" if p['receipts_per_sec'] else "-"
+    print(f"[{p['processed']}/{p['total']}] imported {p['imported']}, skipped {p['skipped']}, "
+          f"failed {p['failed']} ({rate})", file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk-import a directory of receipts")
+    parser.add_argument('directory')
+    parser.add_argument('--workers', type=int, default=BULK_WORKERS)
+    parser.add_argument('--chunk-size', type=int, default=BULK_CHUNK_SIZE)
+    parser.add_argument('--checkpoint', default=BULK_CHECKPOINT, help="resume file ('' to disable)")
+    parser.add_argument('--executor', choices=['process', 'thread'], default='process')
+    parser.add_argument('--user', help="account to import into (default: the anonymous user)")
+    parser.add_argument('--date', type=datetime.date.fromisoformat,
+                        help="date of every entry (default: each file's modification date)")
+    args = parser.parse_args(argv)
+
+    from storage import Storage, DEFAULT_USER
+    from ocr_cache import default_cache
+    storage = Storage()
+    user = DEFAULT_USER
+    if args.user:
+        account = storage.get_user(username=args.user)
+        if account is None:
+            print(f"Unknown user {args.user!r}", file=sys.stderr)
+            return 2
+        user = account['id']
+    receipts = find_receipts(args.directory)
+    print(f"Found {len(receipts)} receipts in {args.directory}", file=sys.stderr)
+    executor = (ThreadPoolExecutor(max_workers=args.workers, initializer=_init_worker)
+                if args.executor == 'thread' else None)
+    importer = BulkImporter(storage, workers=args.workers, chunk_size=args.chunk_size,
+                            checkpoint=Checkpoint(checkpoint_path(args.checkpoint, user) or None), cache=default_cache(),
+                            executor=executor, on_progress=_print_progress, user=user,
+                            date=args.date and args.date.isoformat())
+    result = importer.run(receipts)
+    if executor is not None:
+        executor.shutdown()
+    for failure in result['failures']:
+        print(f"  FAILED {failure['file']}: {failure['error']}", file=sys.stderr)
+    print(json.dumps({k: v for k, v in result.items() if k != 'failures'}, indent=2))
+    return 0 if result['status'] == 'done' and not result['failed'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,11 +1,11 @@
-import json
+from storage import Storage
 
-with open('data.json', 'r') as f:
-    data = json.load(f)
+storage = Storage()
+storage.migrate_from_json('data.json')
 
 print("OCR Extraction Results:")
 print("=" * 80)
-for entry in data:
+for entry in storage.iter_entries():
     if 'filename' in entry:
         filename = entry.get('filename', 'N/A')
         extracted = entry.get('extracted_amount', 'None')
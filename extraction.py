@@ -0,0 +1,261 @@
+"""
+Single-pass amount extraction engine.
+
+The old extractor ran each of its ~15 regexes over the whole text with
+re.findall, tier by tier. Here every pattern is compiled once and the text
+is scanned a single time for anchors - the keywords and currency markers a
+priority or currency-prefixed pattern can start with. Only the patterns of
+the tier being evaluated are then tried, and only at those anchors (with
+pattern.match), keeping a "next allowed position" per pattern so each one
+still yields re.findall()'s non-overlapping matches. Candidates, and
+therefore the ranking, are the same as before; lower tiers are only
+evaluated when the higher ones come up empty. Plain numbers (the last
+resort) start at any digit, so that tier is scanned with finditer.
+
+scan() returns every Candidate (value, score, tier, pattern id, span);
+rank() applies the tiering: priority > currency-prefixed > plain.
+
+extract_normalized(layout=True) adds one layout rule for line-structured OCR text (see
+ocr_layout.py): a keyword line that ends in a money amount, with other
+words in between ("TOTAL (INCL. GST) 1,250.00"), is keyword-backed too.
+"""
+import re
+from collections import namedtuple
+
+PRIORITY, CURRENCY, PLAIN = 'priority', 'currency', 'plain'
+
+# (pattern with exactly one capturing group for the amount, score, tier)
+PATTERNS = [
+    # High priority patterns - look for keywords like TOTAL, AMOUNT, etc.
+    (r'(?:TOTAL|GRAND\s*TOTAL|NET\s*TOTAL|AMOUNT\s*PAYABLE|BILL\s*AMOUNT|INVOICE\s*TOTAL)[\s:]*(?:RS\.?|₹|INR)?\s*(\d+(?:[,\s]\d{3})*(?:\.\d{1,2})?)', 100, PRIORITY),
+    (r'(?:TO\s*PAY|PAYABLE|BALANCE|DUE|BALANCE\s*DUE)[\s:]*(?:RS\.?|₹|INR)?\s*(\d+(?:[,\s]\d{3})*(?:\.\d{1,2})?)', 90, PRIORITY),
+    (r'(?:PAID|PAYMENT|RECEIVED|AMOUNT\s*PAID)[\s:]*(?:RS\.?|₹|INR)?\s*(\d+(?:[,\s]\d{3})*(?:\.\d{1,2})?)', 80, PRIORITY),
+    # UPI/Payment specific patterns - PAID TO and DEBITED are critical for UPI
+    (r'(?:PAID\s+TO|DEBITED|CREDITED|TRANSFERRED)[\s\w]*?(?:RS\.?|₹|INR)?\s*(\d+(?:[,\s]\d{3})*(?:\.\d{1,2})?)', 95, PRIORITY),
+    # Medium priority - currency prefixed amounts
+    (r'₹\s*(\d{1,3}(?:[,\s]\d{3})*(?:\.\d{1,2})?)', 70, CURRENCY),  # ₹ symbol with formatted number
+    (r'₹\s*(\d+(?:\.\d{1,2})?)', 65, CURRENCY),  # ₹ symbol with simple number
+    (r'RS\.?\s*(\d{1,3}(?:[,\s]\d{3})*(?:\.\d{1,2})?)', 55, CURRENCY),  # RS.
+    (r'INR\s*(\d{1,3}(?:[,\s]\d{3})*(?:\.\d{1,2})?)', 55, CURRENCY),  # INR
+    (r'RS\.?\s*(\d+(?:\.\d{1,2})?)', 45, CURRENCY),  # Simple RS
+    (r'₹\s*(\d{1,3}(?:\.\d{3})*,\d{2})', 50, CURRENCY),  # European style: ₹1.234,56
+    (r'₹(\d{1,3}(?:,\d{3})*)', 68, CURRENCY),  # ₹1,750 (no space)
+    (r'₹(\d+)', 63, CURRENCY),  # ₹1750 (no space, no comma)
+    # Low priority - plain numbers with specific patterns
+    (r'(\d{1,3}(?:,\d{3})+\.\d{2})', 0, PLAIN),  # 1,234.56
+    (r'(\d{1,3}(?:,\d{3})+)', 0, PLAIN),  # 1,234 (large numbers with commas)
+    (r'(\d{3,}\.\d{2})', 0, PLAIN),  # 123.56 (at least 3 digits before decimal)
+]
+
+# Accepted value range per tier
+BOUNDS = {PRIORITY: (1, 10000000), CURRENCY: (10, 10000000), PLAIN: (50, 10000000)}
+
+# UPI receipts: OCR often reads the ₹ symbol as a leading "2" (₹1,750 -> 21,750)
+UPI_CONTEXT = re.compile(r'(?:PAID\s+TO|DEBITED|CREDITED|TRANSACTION|UPI|TRANSFER|UTR)')
+UPI_FIXES = [
+    re.compile(r'\b2([1-9],\d{3})(?![,\d])\b'),  # 21,750 -> 1,750 (not followed by more digits)
+    re.compile(r'\b2([1-9]\d{2,3})(?![,\d])\b'),  # 21750 -> 1750 (3-4 digits after 2)
+]
+
+Candidate = namedtuple('Candidate', 'value score tier pattern_id span')
+
+COMPILED = [(re.compile(pattern, re.IGNORECASE), score, tier) for pattern, score, tier in PATTERNS]
+
+# Every word a priority or currency pattern can start with. Each anchor match
+# consumes only the first character (the rest is a lookahead) so no start
+# position hides inside another word, e.g. "TOTAL" in "NETOTAL".
+ANCHOR_WORDS = ['TOTAL', 'GRAND', 'NET', 'AMOUNT', 'BILL', 'INVOICE', 'TO', 'PAYABLE', 'BALANCE',
+                'DUE', 'PAID', 'PAYMENT', 'RECEIVED', 'DEBITED', 'CREDITED', 'TRANSFERRED',
+                '₹', 'RS', 'INR']
+# The text is upper-cased by normalize(), so the anchor scan can skip
+# IGNORECASE (3x faster); İ is the one upper-case letter the patterns'
+# IGNORECASE still matches against an ASCII letter.
+_CASE_VARIANTS = {'I': '[Iİ]'}
+
+
+def _anchor_regex(words):
+    rests = {}
+    for word in words:
+        rests.setdefault(word[0], []).append(''.join(_CASE_VARIANTS.get(c, re.escape(c)) for c in word[1:]))
+    branches = []
+    for first, tails in rests.items():
+        head = _CASE_VARIANTS.get(first, re.escape(first))
+        if all(tails):
+            head += '(?=%s)' % '|'.join(sorted(tails, key=len, reverse=True))
+        branches.append(head)
+    return re.compile('|'.join(branches))
+
+
+ANCHORS = _anchor_regex(ANCHOR_WORDS)
+
+
+def _start_chars(pattern):
+    """First characters of the keyword alternatives a pattern opens with"""
+    group = re.match(r'\(\?:([^()]*)\)', pattern)
+    alternatives = group.group(1).split('|') if group else [pattern]
+    return {alt[0] for alt in alternatives}
+
+
+# tier -> first character -> ids of the patterns that may match there
+DISPATCH = {PRIORITY: {}, CURRENCY: {}}
+for _i, (_pattern, _, _tier) in enumerate(PATTERNS):
+    if _tier in DISPATCH:
+        for _char in sorted(_start_chars(_pattern)):
+            for _variant in {_char, _CASE_VARIANTS.get(_char, _char).strip('[]')[-1]}:
+                DISPATCH[_tier].setdefault(_variant, []).append(_i)
+
+
+def _parse(raw, tier):
+    if tier == CURRENCY and raw.count(',') == 1 and '.' in raw:
+        # European decimal format
+        cleaned = raw.replace('.', '').replace(',', '.').strip()
+    else:
+        cleaned = raw.replace(',', '').replace(' ', '').strip()
+    return float(cleaned)
+
+
+def normalize(text):
+    """Uppercase the text and undo the UPI ₹ -> '2' misread; returns (text, fixed)"""
+    upper = text.upper()
+    if not UPI_CONTEXT.search(upper):
+        return upper, False
+    fixed = upper
+    for fix in UPI_FIXES:
+        fixed = fix.sub(r'\1', fixed)
+    return fixed, fixed != upper
+
+
+def anchors(text):
+    """Positions in normalize()d text where a priority or currency pattern may start"""
+    return [m.start() for m in ANCHORS.finditer(text)]
+
+
+def _candidates_at(text, positions, tier):
+    """Tier's matches, trying only the patterns that can start at each anchor"""
+    found = []
+    low, high = BOUNDS[tier]
+    by_char = DISPATCH[tier]
+    next_allowed = {}
+    for pos in positions:
+        for i in by_char.get(text[pos], ()):
+            if pos < next_allowed.get(i, 0):
+                continue
+            m = COMPILED[i][0].match(text, pos)
+            if m is None:
+                continue
+            next_allowed[i] = m.end()
+            try:
+                value = _parse(m.group(1), tier)
+            except ValueError:
+                continue
+            if low <= value <= high:
+                found.append(Candidate(value, COMPILED[i][1], tier, i, m.span()))
+    # Same order as running each pattern's findall in turn
+    found.sort(key=lambda c: (c.pattern_id, c.span[0]))
+    return found
+
+
+def _plain_candidates(text):
+    found = []
+    low, high = BOUNDS[PLAIN]
+    for i, (regex, score, tier) in enumerate(COMPILED):
+        if tier != PLAIN:
+            continue
+        for m in regex.finditer(text):
+            try:
+                value = _parse(m.group(1), tier)
+            except ValueError:
+                continue
+            if low <= value <= high:
+                found.append(Candidate(value, score, tier, i, m.span()))
+    return found
+
+
+def scan(text, positions=None):
+    """Every amount candidate of every tier in already-normalized text"""
+    positions = anchors(text) if positions is None else positions
+    return (_candidates_at(text, positions, PRIORITY) +
+            _candidates_at(text, positions, CURRENCY) +
+            _plain_candidates(text))
+
+
+def rank(candidates, limit=5):
+    """
+    (value, score) pairs from the best non-empty tier: priority and
+    currency candidates by (score, value) descending, plain numbers as
+    distinct values, largest first (score 0).
+    """
+    for tier in (PRIORITY, CURRENCY):
+        scored = sorted(((c.value, c.score) for c in candidates if c.tier == tier),
+                        key=lambda x: (x[1], x[0]), reverse=True)
+        if scored:
+            return scored[:limit]
+    plain = sorted({c.value for c in candidates if c.tier == PLAIN}, reverse=True)
+    return [(value, 0) for value in plain[:limit]]
+
+
+def extract_normalized(text, limit=5, layout=False):
+    """
+    rank(scan(text)), but lower tiers are only scanned when needed. With
+    `layout`, multi-line text also gets layout_candidates() in the
+    priority tier.
+    """
+    positions = anchors(text)
+    for tier in (PRIORITY, CURRENCY):
+        found = _candidates_at(text, positions, tier)
+        if tier == PRIORITY and layout and '\n' in text:
+            found += layout_candidates(text, found)
+        if found:
+            return rank(found, limit)
+    return rank(_plain_candidates(text), limit)
+
+
+# Layout rule: the amount a keyword line ends with. It must look like money
+# (two decimals or a currency marker) so "TOTAL ITEMS 3" is not a total.
+LINE_AMOUNT = re.compile(r'(?:(?:RS\.?|₹|INR)\s*(\d+(?:,\d{3})*(?:\.\d{1,2})?)|(\d+(?:,\d{3})*\.\d{2}))\s*$')
+LAYOUT_PENALTY = 5  # ranks below a direct "KEYWORD amount" match of the same keyword
+LINE_KEYWORDS = [(re.compile(re.match(r'\(\?:[^()]*\)', pattern).group(0)), score, i)
+                 for i, (pattern, score, tier) in enumerate(PATTERNS) if tier == PRIORITY]
+
+
+def layout_candidates(text, found=()):
+    """
+    Priority candidates for lines of normalized text that contain a
+    keyword and end with an amount, skipping lines where a `found`
+    candidate already starts.
+    """
+    taken = sorted(c.span[0] for c in found)
+    low, high = BOUNDS[PRIORITY]
+    out = []
+    start = 0
+    for line in text.split('\n'):
+        end = start + len(line)
+        line_start, start = start, end + 1
+        if any(line_start <= pos < end for pos in taken):
+            continue
+        m = LINE_AMOUNT.search(line)
+        if m is None:
+            continue
+        best = None
+        for keyword, score, i in LINE_KEYWORDS:
+            if (best is None or score > best[0]) and keyword.search(line, 0, m.start()):
+                best = (score, i)
+        if best is None:
+            continue
+        group = 1 if m.group(1) is not None else 2
+        try:
+            value = _parse(m.group(group), PRIORITY)
+        except ValueError:
+            continue
+        if low <= value <= high:
+            out.append(Candidate(value, best[0] - LAYOUT_PENALTY, PRIORITY, best[1],
+                                 (line_start + m.start(group), line_start + m.end(group))))
+    return out
+
+
+def extract(text, limit=5):
+    """Ranked (value, score) pairs for raw OCR text"""
+    if not text:
+        return []
+    normalized, _ = normalize(text)
+    return extract_normalized(normalized, limit)
@@ -1,51 +1,47 @@
 """
-Fix the incorrect amount in data.json
+Fix the incorrect amount in the entries database
 The UPI receipt shows ₹1,750 not ₹21,750
 """
-import json
+from storage import Storage
+from prediction import predict_from_amounts
 
-# Load existing data
-with open('data.json', 'r') as f:
-    data = json.load(f)
+storage = Storage()
+storage.migrate_from_json('data.json')
 
-print("Fixing incorrect amounts in data.json")
+print("Fixing incorrect amounts in the entries database")
 print("=" * 80)
 
-fixed_count = 0
-for entry in data:
-    if 'filename' in entry and entry.get('filename') == 'Reciept.jpg':
+to_fix = []
+for entry in storage.iter_entries():
+    if entry.get('filename') == 'Reciept.jpg':
         old_amount = entry.get('amount') or entry.get('extracted_amount')
         if old_amount == 21750.0:
             print(f"\nFound incorrect entry:")
             print(f"  File: {entry['filename']}")
             print(f"  Old amount: ₹{old_amount:,.2f}")
             print(f"  New amount: ₹1,750.00")
-            
-            # Fix the amount
-            if 'amount' in entry:
-                entry['amount'] = 1750.0
-            if 'extracted_amount' in entry:
-                entry['extracted_amount'] = 1750.0
-            
-            # Recalculate predictions with correct amount
-            if 'predicted_annual_expense' in entry:
-                # Correct calculation: 1750 * 365 = 638,750
-                entry['predicted_annual_expense'] = 1750.0 * 365
-                entry['predicted_annual_savings'] = max(0.0, 100000.0 - entry['predicted_annual_expense'])
-                entry['distress_probability'] = min(1.0, entry['predicted_annual_expense'] / 100000.0)
-                
-                print(f"  Updated predictions:")
-                print(f"    Annual expense: ₹{entry['predicted_annual_expense']:,.2f}")
-                print(f"    Annual savings: ₹{entry['predicted_annual_savings']:,.2f}")
-                print(f"    Distress probability: {entry['distress_probability']:.1%}")
-            
-            fixed_count += 1
+            to_fix.append(entry)
+
+# Recalculate predictions for all corrected entries in one batch
+updates = []
+if to_fix:
+    preds = predict_from_amounts([1750.0] * len(to_fix))
+    for entry, pred in zip(to_fix, preds):
+        fields = {'extracted_amount': 1750.0}
+        if 'amount' in entry:
+            fields['amount'] = 1750.0
+        if 'predicted_annual_expense' in entry:
+            fields.update(pred)
+            print(f"  Updated predictions for entry {entry['id']}:")
+            print(f"    Annual expense: ₹{pred['predicted_annual_expense']:,.2f}")
+            print(f"    Annual savings: ₹{pred['predicted_annual_savings']:,.2f}")
+            print(f"    Distress probability: {pred['distress_probability']:.1%}")
+        updates.append((entry['id'], fields))
 
 # Save the corrected data
-if fixed_count > 0:
-    with open('data.json', 'w') as f:
-        json.dump(data, f, indent=2)
-    print(f"\n✓ Fixed {fixed_count} entry(ies) and saved to data.json")
+if updates:
+    storage.update_entries(updates)
+    print(f"\n✓ Fixed {len(updates)} entry(ies) and saved to the database")
 else:
     print("\nℹ️ No entries needed fixing")
 
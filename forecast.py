@@ -0,0 +1,295 @@
+"""
+Daily-spend forecasting for /predict.
+
+Entries are resampled into a calendar-day spend series (days without
+receipts count as zero spend) and fitted with a linear model of
+
+    trend + day-of-week + day-of-month (two Fourier terms + a 1st-of-month
+    indicator for rent and bills)
+
+The fit is kept as normal-equation sums (X'X, X'y), so a new entry only
+adds its amount times that day's feature row, and each new calendar day
+adds one outer product: updating is O(new data), never a rescan. The
+coefficients and the 365-day forecast are cached until the state changes.
+
+A user's state is built once from the daily aggregate table, then caught
+up from entries with a higher id on each request; a rebuild of the
+aggregates (after a rescore or a migration) starts it over. The series
+runs to today, so a gap since the last receipt counts as days without
+spend. Entries dated in the future wait in the state until their day comes,
+so an incrementally updated state stays equal to a fresh load. Entries with
+unreadable dates or dates more than MAX_HISTORY_DAYS back are left out of
+the fit.
+
+    python forecast.py backtest [--days N] [--horizon N]
+
+runs a rolling-origin backtest on a synthetic series with weekly and
+monthly seasonality and reports error and update latency against the
+old per-receipt average * 365 rule.
+"""
+import sys, json, time, math, logging, argparse, datetime, threading
+import numpy as np
+
+EPOCH = datetime.date(2020, 1, 1).toordinal()
+MIN_DAYS = 28  # below this the seasonal terms are noise; use the plain daily mean
+RIDGE = 1e-3
+HORIZON = 365
+N_FEATURES = 13
+MAX_HISTORY_DAYS = 10 * 366  # older entries don't shape next year's spend, and bound the series length
+
+log = logging.getLogger(__name__)
+
+
+def features(ordinals):
+    """Design matrix rows for an array of date ordinals"""
+    ordinals = np.asarray(ordinals, dtype=np.int64).reshape(-1)
+    n = ordinals.size
+    X = np.zeros((n, N_FEATURES))
+    X[:, 0] = 1.0
+    X[:, 1] = (ordinals - EPOCH) / 365.25
+    # date.fromordinal(1) is a Monday; Monday is the baseline day
+    weekday = (ordinals - 1) % 7
+    for day in range(1, 7):
+        X[:, 1 + day] = weekday == day
+    dates = [datetime.date.fromordinal(int(o)) for o in ordinals]
+    phase = np.array([2 * math.pi * (d.day - 1) / _month_length(d) for d in dates])
+    X[:, 8], X[:, 9] = np.sin(phase), np.cos(phase)
+    X[:, 10], X[:, 11] = np.sin(2 * phase), np.cos(2 * phase)
+    X[:, 12] = [d.day == 1 for d in dates]
+    return X
+
+
+def _month_length(d):
+    following = datetime.date(d.year + d.month // 12, d.month % 12 + 1, 1)
+    return (following - datetime.date(d.year, d.month, 1)).days
+
+
+class ForecastState:
+    """Sufficient statistics of the least-squares fit over one user's daily series"""
+
+    def __init__(self):
+        self.first = self.last = None  # ordinals covered by the series
+        self.days = {}  # ordinal -> total spend that day (only days with spend)
+        self.xtx = np.zeros((N_FEATURES, N_FEATURES))
+        self.xty = np.zeros(N_FEATURES)
+        self.yy = 0.0
+        self.pending = {}  # ordinal -> spend on days after the series' end (future-dated entries)
+        self.last_id = 0
+        self.generation = None
+        self._cached = None
+
+    def _cover(self, start, end):
+        """Add the feature rows of days start..end (inclusive) with zero spend"""
+        if end < start:
+            return
+        X = features(np.arange(start, end + 1))
+        self.xtx += X.T @ X
+
+    def add(self, day, amount):
+        """Fold `amount` spent on ordinal `day` into the fit"""
+        if self.first is None:
+            self.first = self.last = day
+            self._cover(day, day)
+        elif day < self.first:
+            self._cover(day, self.first - 1)
+            self.first = day
+        elif day > self.last:
+            self._cover(self.last + 1, day)
+            self.last = day
+        previous = self.days.get(day, 0.0)
+        self.days[day] = previous + amount
+        self.xty += amount * features([day])[0]
+        self.yy += 2 * amount * previous + amount * amount
+        self._cached = None
+
+    def add_dated(self, day, amount, today):
+        """add(), or keep the amount pending until extend_to() reaches a future `day`"""
+        if day > today:
+            self.pending[day] = self.pending.get(day, 0.0) + amount
+        else:
+            self.add(day, amount)
+
+    def extend_to(self, day):
+        """Stretch the series to ordinal `day`: pending spend up to it, zero spend for the rest"""
+        for pending_day in sorted(d for d in self.pending if d <= day):
+            self.add(pending_day, self.pending.pop(pending_day))
+        if self.first is not None and day > self.last:
+            self._cover(self.last + 1, day)
+            self.last = day
+            self._cached = None
+
+    @property
+    def n_days(self):
+        return 0 if self.first is None else self.last - self.first + 1
+
+    def coefficients(self):
+        penalty = RIDGE * np.eye(N_FEATURES)
+        penalty[0, 0] = 0.0  # leave the intercept unpenalised
+        return np.linalg.solve(self.xtx + penalty, self.xty)
+
+    def forecast(self, horizon=HORIZON):
+        """Cached forecast dict for the `horizon` days after the last day of the series"""
+        if self._cached is not None and self._cached['horizon_days'] == horizon:
+            return self._cached
+        if self.first is None:
+            return None
+        total = sum(self.days.values())
+        daily_mean = total / self.n_days
+        if self.n_days < MIN_DAYS:
+            daily = np.full(horizon, daily_mean)
+            model, resid_std = 'daily_mean', None
+        else:
+            beta = self.coefficients()
+            daily = np.maximum(0.0, features(np.arange(self.last + 1, self.last + 1 + horizon)) @ beta)
+            sse = max(0.0, self.yy - 2 * beta @ self.xty + beta @ self.xtx @ beta)
+            model = 'trend+weekly+monthly'
+            resid_std = math.sqrt(sse / max(1, self.n_days - N_FEATURES))
+        self._cached = {
+            "model": model,
+            "horizon_days": horizon,
+            "predicted_total": float(daily.sum()),
+            "next_30_days": float(daily[:30].sum()),
+            "daily_mean": daily_mean,
+            "daily_residual_std": resid_std,
+            "days_observed": self.n_days,
+            "last_day": datetime.date.fromordinal(self.last).isoformat(),
+            "last_entry_id": self.last_id,
+        }
+        return self._cached
+
+
+def today_ordinal():
+    return datetime.date.today().toordinal()
+
+
+def day_ordinal(date, today):
+    """Ordinal of an ISO entry date (future ones included), or None if unreadable or too old"""
+    try:
+        day = datetime.date.fromisoformat(date).toordinal()
+    except (TypeError, ValueError):
+        log.warning("forecast skips entry with bad date=%r", date)
+        return None
+    return day if day >= today - MAX_HISTORY_DAYS else None
+
+
+class Forecaster:
+    """Per-user ForecastStates over a Storage, kept current incrementally"""
+
+    def __init__(self, storage):
+        self.storage = storage
+        self._states = {}
+        self._lock = threading.Lock()
+
+    def state(self, user):
+        # Database reads happen outside the lock; only folding them in is serialised
+        today = today_ordinal()
+        generation = self.storage.aggregates_generation()
+        with self._lock:
+            state = self._states.get(user)
+            stale = state is None or state.generation != generation
+            last_id = None if stale else state.last_id
+        if stale:
+            loaded = self._load(user, today)
+            with self._lock:
+                state = self._states.get(user)
+                # Keep a state another request loaded meanwhile if it is at least as current
+                if state is None or state.generation != loaded.generation or state.last_id < loaded.last_id:
+                    state = self._states[user] = loaded
+        else:
+            # Entries added since (by this or another process): O(new entries)
+            rows = self.storage.entries_after(last_id, user=user)
+            with self._lock:
+                for entry_id, date, amount in rows:
+                    if entry_id <= state.last_id:
+                        continue  # already folded in by a concurrent request
+                    day = day_ordinal(date, today)
+                    if day is not None:
+                        # Amount-less entries still extend the series, as in the daily aggregates
+                        state.add_dated(day, amount or 0.0, today)
+                    state.last_id = entry_id
+        with self._lock:
+            state.extend_to(today)
+        return state
+
+    def _load(self, user, today):
+        totals, last_id, generation = self.storage.daily_series(user=user)
+        state = ForecastState()
+        for date, total in sorted(totals.items()):
+            day = day_ordinal(date, today)
+            if day is not None:
+                state.add_dated(day, total, today)
+        state.last_id = last_id
+        state.generation = generation
+        state.extend_to(today)
+        return state
+
+    def forecast(self, user, horizon=HORIZON):
+        """Forecast dict for `user`, or None without any spend history"""
+        state = self.state(user)
+        with self._lock:
+            return state.forecast(horizon)
+
+
+# Backtest
+
+def synthetic_series(days=730, seed=0):
+    """Daily spend with a trend, weekend peaks, rent on the 1st and noise"""
+    rng = np.random.RandomState(seed)
+    start = datetime.date(2023, 1, 1).toordinal()
+    ordinals = np.arange(start, start + days)
+    spend = []
+    for i, o in enumerate(ordinals):
+        d = datetime.date.fromordinal(int(o))
+        base = 400 + 0.3 * i + (350 if d.weekday() >= 5 else 0)
+        spend.append((max(0.0, base + rng.normal(0, 120)) if rng.rand() > 0.1 else 0.0)  # no receipts some days
+                     + (6000 if d.day == 1 else 0))
+    return ordinals, np.array(spend)
+
+
+def backtest(ordinals, spend, horizon=30, step=30, min_train=60):
+    """
+    Rolling-origin evaluation: feed the series day by day, and every `step`
+    days forecast the next `horizon` days' total and compare it with what
+    was actually spent. The old rule (mean amount per receipt, one receipt
+    per spend day, scaled to the horizon) is scored alongside.
+    """
+    state = ForecastState()
+    errors, baseline_errors, update_seconds, forecast_seconds = [], [], [], []
+    receipts = []
+    for i, (o, amount) in enumerate(zip(ordinals, spend)):
+        started = time.perf_counter()
+        if amount:
+            state.add(int(o), float(amount))
+            receipts.append(float(amount))
+        else:
+            state.extend_to(int(o))
+        update_seconds.append(time.perf_counter() - started)
+        if i + 1 >= min_train and (i + 1 - min_train) % step == 0 and i + horizon < len(spend):
+            started = time.perf_counter()
+            predicted = state.forecast(horizon)['predicted_total']
+            forecast_seconds.append(time.perf_counter() - started)
+            actual = float(spend[i + 1:i + 1 + horizon].sum())
+            errors.append(abs(predicted - actual) / max(actual, 1.0))
+            baseline_errors.append(abs(np.mean(receipts) * horizon - actual) / max(actual, 1.0))
+    return {
+        "origins": len(errors),
+        "horizon_days": horizon,
+        "mape": round(float(np.mean(errors)), 4) if errors else None,
+        "baseline_mape": round(float(np.mean(baseline_errors)), 4) if baseline_errors else None,
+        "update_us_p50": round(float(np.median(update_seconds)) * 1e6, 2),
+        "forecast_ms_p50": round(float(np.median(forecast_seconds)) * 1e3, 3) if forecast_seconds else None,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Forecast backtest on a synthetic daily-spend series")
+    parser.add_argument('command', choices=['backtest'])
+    parser.add_argument('--days', type=int, default=730)
+    parser.add_argument('--horizon', type=int, default=30)
+    args = parser.parse_args(argv)
+    print(json.dumps(backtest(*synthetic_series(args.days), horizon=args.horizon), indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
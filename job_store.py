@@ -0,0 +1,73 @@
+"""
+Job status shared between the server's worker processes.
+
+/upload and /upload/bulk answer with a job id that the client then polls,
+but under the pre-fork server (serve.py) a poll can land on any worker,
+not just the one running the job. With JOB_STATE_DIR set, the owning
+worker also writes each job snapshot to <JOB_STATE_DIR>/<job id>.json
+(atomically, on every state change), and a worker that doesn't know a job
+reads it from there. In a single process JOB_STATE_DIR is unset and
+nothing is written.
+"""
+import os, re, json, logging, tempfile
+
+JOB_STATE_DIR = os.environ.get('JOB_STATE_DIR')
+
+_JOB_ID = re.compile(r'^[0-9a-f]{32}$')  # uuid4().hex; anything else never touches the disk
+
+log = logging.getLogger(__name__)
+
+
+class JobStore:
+    """One JSON file per job: {"owner": ..., "job": snapshot}"""
+
+    def __init__(self, directory=JOB_STATE_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, job_id):
+        if not isinstance(job_id, str) or not _JOB_ID.match(job_id):
+            return None
+        return os.path.join(self.directory, f"{job_id}.json")
+
+    def put(self, job_id, job, owner=None):
+        """Publish the job's latest snapshot; failures are logged, never raised"""
+        path = self._path(job_id)
+        if path is None:
+            return
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump({"owner": owner, "job": job}, f, default=str)
+            os.replace(tmp, path)
+        except (OSError, TypeError, ValueError) as e:
+            log.warning("could not publish job %s: %s", job_id, e)
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+
+    def get(self, job_id, owner=None):
+        """The last published snapshot, or None if unknown or not owner's"""
+        path = self._path(job_id)
+        if path is None:
+            return None
+        try:
+            with open(path) as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return record.get('job') if record.get('owner') == owner else None
+
+    def delete(self, job_id):
+        path = self._path(job_id)
+        if path is not None:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+
+def default_store():
+    """A JobStore on JOB_STATE_DIR, or None when job status stays in-process"""
+    return JobStore(JOB_STATE_DIR) if JOB_STATE_DIR else None
@@ -0,0 +1,125 @@
+"""
+Latency histograms for each pipeline stage, served in the Prometheus text
+format at /metrics.
+
+Code times a stage with `with metrics.span('ocr.readtext', strategy='binary'):`
+and the duration lands in the stage_seconds histogram under those labels.
+Each process has its own registry. OCR pool workers send the observations
+of every job back with its result (drain() in the worker, merge() in the
+parent), so the web process's /metrics covers the work done in the pool too.
+METRICS=0 turns recording off.
+"""
+import os, time, bisect, threading
+from contextlib import contextmanager
+
+METRICS_ENABLED = os.environ.get('METRICS', '1') != '0'
+PREFIX = 'finance_'
+# Seconds; covers a regex call up to a full five-pass OCR of a large photo
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Histogram:
+    """Fixed-bucket histogram with one series per combination of label values"""
+
+    def __init__(self, name, help, labels, buckets=BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [per-bucket counts (last is +Inf), sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def drain(self):
+        """Every series as JSON-safe [labels, counts, sum, count] rows; resets the histogram"""
+        with self._lock:
+            series, self._series = self._series, {}
+        return [[list(key), counts, total, count] for key, (counts, total, count) in series.items()]
+
+    def merge(self, rows):
+        """Add rows produced by drain() in another process"""
+        with self._lock:
+            for key, counts, total, count in rows:
+                series = self._series.setdefault(tuple(key), [[0] * (len(self.buckets) + 1), 0.0, 0])
+                series[0] = [a + b for a, b in zip(series[0], counts)]
+                series[1] += total
+                series[2] += count
+
+    def snapshot(self):
+        """{label values: {"count", "sum", "buckets"}} with cumulative bucket counts"""
+        with self._lock:
+            series = {key: (list(counts), total, count) for key, (counts, total, count) in self._series.items()}
+        out = {}
+        for key, (counts, total, count) in sorted(series.items()):
+            cumulative, running = [], 0
+            for le, n in zip(self.buckets + (float('inf'),), counts):
+                running += n
+                cumulative.append((le, running))
+            out[key] = {"count": count, "sum": total, "buckets": cumulative}
+        return out
+
+    def render(self):
+        name = PREFIX + self.name
+        lines = [f"# HELP {name} {self.help}", f"# TYPE {name} histogram"]
+        for key, s in self.snapshot().items():
+            pairs = [f'{label}="{_escape(value)}"' for label, value in zip(self.labels, key) if value]
+            for le, n in s['buckets']:
+                bound = '+Inf' if le == float('inf') else repr(le)
+                bucket_labels = ','.join(pairs + ['le="%s"' % bound])
+                lines.append(f"{name}_bucket{{{bucket_labels}}} {n}")
+            labels = '{' + ','.join(pairs) + '}' if pairs else ''
+            lines.append(f"{name}_sum{labels} {s['sum']:.6f}")
+            lines.append(f"{name}_count{labels} {s['count']}")
+        return lines
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+stage_seconds = Histogram('stage_seconds', 'Time spent in each pipeline stage', ['stage', 'strategy'])
+request_seconds = Histogram('http_request_seconds', 'Request latency by route', ['method', 'route', 'status'])
+HISTOGRAMS = [stage_seconds, request_seconds]
+
+
+@contextmanager
+def span(stage, strategy=''):
+    """Record the duration of the enclosed block as `stage` in stage_seconds"""
+    if not METRICS_ENABLED:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stage_seconds.observe(time.perf_counter() - started, stage=stage, strategy=strategy)
+
+
+def drain():
+    """This process's observations since the last drain, for merge() in another process"""
+    return {h.name: h.drain() for h in HISTOGRAMS}
+
+
+def merge(drained):
+    if not drained:
+        return
+    for h in HISTOGRAMS:
+        h.merge(drained.get(h.name, []))
+
+
+def render():
+    """All histograms in the Prometheus text exposition format"""
+    lines = []
+    for h in HISTOGRAMS:
+        lines.extend(h.render())
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,208 @@
+"""
+Versioned store for the prediction models, with hot reload.
+
+Each version is a directory under MODEL_DIR/registry/ holding the
+regression and classification models as uncompressed joblib files plus a
+manifest. The CURRENT file names the active version and is replaced
+atomically, so every process switches to a new version on its next check
+(at most every MODEL_RELOAD_INTERVAL seconds) without a restart. Models
+are opened with mmap_mode='r': their numpy arrays are mapped from the
+page cache, so forked workers share them instead of each holding a copy.
+
+A missing or broken version is remembered too, so a process without
+models does not retry the disk on every prediction. Registries without a
+CURRENT file fall back to the legacy models/*.pkl pickles.
+
+    python model_registry.py list
+    python model_registry.py activate <version>
+"""
+import os, sys, json, time, pickle, logging, datetime, threading
+from collections import namedtuple
+
+MODEL_DIR = os.environ.get('MODEL_DIR', 'models')
+MODEL_RELOAD_INTERVAL = float(os.environ.get('MODEL_RELOAD_INTERVAL', 5))  # seconds between CURRENT checks
+LEGACY_FILES = ('regression_model.pkl', 'classification_model.pkl')
+ARTIFACTS = ('regression.joblib', 'classification.joblib')
+LEGACY_VERSION = 'legacy-pkl'
+
+log = logging.getLogger(__name__)
+
+
+class ModelSet(namedtuple('ModelSet', 'version regression classification')):
+    """The models of one version; either may be None"""
+
+    @property
+    def available(self):
+        return self.regression is not None and self.classification is not None
+
+
+MISSING = ModelSet(None, None, None)
+
+
+class ModelRegistry:
+    def __init__(self, root=MODEL_DIR, reload_interval=MODEL_RELOAD_INTERVAL):
+        self.root = root
+        self.directory = os.path.join(root, 'registry')
+        self.reload_interval = reload_interval
+        self._models = MISSING
+        self._marker = None  # what the loaded (or failed) set was read from
+        self._checked_at = None
+        self._loaded_at = None
+        self._error = None
+        self._lock = threading.Lock()
+
+    # Publishing
+
+    def versions(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(name for name in os.listdir(self.directory)
+                      if os.path.isfile(os.path.join(self.directory, name, 'manifest.json')))
+
+    def publish(self, regression, classification, version=None, metadata=None, activate=True):
+        """
+        Store a new version (written to a temporary directory and renamed
+        into place, so readers never see half of it); returns its name.
+        """
+        import joblib
+        version = version or datetime.datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+        target = os.path.join(self.directory, version)
+        if os.path.exists(target):
+            raise ValueError(f"model version {version!r} already exists")
+        tmp = os.path.join(self.directory, f".{version}.tmp")
+        os.makedirs(tmp)
+        for name, model in zip(ARTIFACTS, (regression, classification)):
+            if model is not None:
+                joblib.dump(model, os.path.join(tmp, name))  # uncompressed, so it can be memory-mapped
+        with open(os.path.join(tmp, 'manifest.json'), 'w') as f:
+            json.dump(dict(metadata or {}, version=version, created_at=time.time()), f, indent=2)
+        os.rename(tmp, target)
+        if activate:
+            self.activate(version)
+        return version
+
+    def activate(self, version):
+        """Point CURRENT at `version`; running processes pick it up on their next check"""
+        if version not in self.versions():
+            raise ValueError(f"unknown model version {version!r}")
+        tmp = os.path.join(self.directory, 'CURRENT.tmp')
+        with open(tmp, 'w') as f:
+            f.write(version)
+        os.replace(tmp, os.path.join(self.directory, 'CURRENT'))
+
+    def current_version(self):
+        try:
+            with open(os.path.join(self.directory, 'CURRENT')) as f:
+                return f.read().strip() or None
+        except OSError:
+            return None
+
+    # Loading
+
+    def _source(self):
+        """Marker for what current() should be serving: a registry version or the legacy pickles"""
+        version = self.current_version()
+        if version:
+            return ('registry', version)
+        mtimes = []
+        for name in LEGACY_FILES:
+            try:
+                mtimes.append(os.path.getmtime(os.path.join(self.root, name)))
+            except OSError:
+                mtimes.append(None)
+        return ('legacy', tuple(mtimes)) if any(mtimes) else ('missing',)
+
+    def load(self, version):
+        """ModelSet of a registry version, arrays memory-mapped read-only"""
+        import joblib
+        models = []
+        for name in ARTIFACTS:
+            path = os.path.join(self.directory, version, name)
+            models.append(joblib.load(path, mmap_mode='r') if os.path.exists(path) else None)
+        return ModelSet(version, *models)
+
+    def _load_legacy(self):
+        models = []
+        for name in LEGACY_FILES:
+            path = os.path.join(self.root, name)
+            if os.path.exists(path):
+                with open(path, 'rb') as f:
+                    models.append(pickle.load(f))
+            else:
+                models.append(None)
+        return ModelSet(LEGACY_VERSION, *models)
+
+    def current(self):
+        """
+        The active ModelSet (MISSING when there are no models). CURRENT is
+        looked at no more than every reload_interval seconds; a changed
+        version is loaded and swapped in whole, so a caller always gets
+        the models of a single version.
+        """
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < self.reload_interval:
+            return self._models
+        with self._lock:
+            if self._checked_at is not None and now - self._checked_at < self.reload_interval:
+                return self._models
+            self._refresh()
+            self._checked_at = time.monotonic()
+            return self._models
+
+    def reload(self):
+        """Check CURRENT now rather than at the next interval; returns the active ModelSet"""
+        with self._lock:
+            self._refresh()
+            self._checked_at = time.monotonic()
+            return self._models
+
+    def _refresh(self):
+        # Caller holds the lock
+        source = self._source()
+        if source == self._marker:
+            return  # unchanged - including "still missing" / "still broken"
+        self._marker = source
+        if source[0] == 'missing':
+            self._models, self._error = MISSING, None
+            return
+        try:
+            models = self.load(source[1]) if source[0] == 'registry' else self._load_legacy()
+        except Exception as e:
+            # Keep serving what we had; the failed version is not retried until CURRENT changes
+            log.error("could not load models from %s: %s", source, e)
+            self._error = f"{source}: {e}"
+            return
+        log.info("models loaded version=%s", models.version)
+        self._models, self._error, self._loaded_at = models, None, time.time()
+
+    def status(self):
+        models = self._models
+        return {
+            "version": models.version,
+            "regression": models.regression is not None,
+            "classification": models.classification is not None,
+            "loaded_at": self._loaded_at,
+            "error": self._error,
+            "current": self.current_version(),
+            "versions": self.versions(),
+        }
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    registry = ModelRegistry()
+    if argv == ['list']:
+        current = registry.current_version()
+        for version in registry.versions():
+            print(f"{'*' if version == current else ' '} {version}")
+        return 0
+    if len(argv) == 2 and argv[0] == 'activate':
+        registry.activate(argv[1])
+        print(f"Activated {argv[1]}")
+        return 0
+    print("usage: python model_registry.py list | activate <version>")
+    return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,562 @@
+"""
+OCR helpers: EasyOCR reader setup, the multi-strategy try_ocr() pass and
+amount extraction from the recognised text.
+
+Kept separate from app.py so OCR worker processes can import it without
+pulling in the Flask app.
+"""
+import os, json, time, logging, threading
+try:
+    import fcntl
+except ImportError:  # not on Windows: stats writes are then only safe within one process
+    fcntl = None
+import extraction
+import metrics
+import ocr_backends
+import ocr_layout
+import ocr_onnx
+import ocr_preprocess
+import ocr_pdf
+
+log = logging.getLogger(__name__)
+
+# Preprocessing + readtext for several image variants run concurrently on a
+# thread pool (OpenCV and torch release the GIL). OCR_TORCH_THREADS caps each
+# inference's intra-op threads so parallel variants don't oversubscribe cores.
+_CPUS = os.cpu_count() or 1
+OCR_PARALLEL = max(1, int(os.environ.get('OCR_PARALLEL', min(5, _CPUS))))
+OCR_TORCH_THREADS = max(1, int(os.environ.get('OCR_TORCH_THREADS', _CPUS // OCR_PARALLEL)))
+_variant_pool = None
+_pool_lock = threading.Lock()
+
+def _limit_torch_threads():
+    try:
+        import torch
+        torch.set_num_threads(OCR_TORCH_THREADS)
+    except Exception as e:
+        log.warning("could not set torch threads: %s", e)
+
+def get_variant_pool():
+    """Shared thread pool running the per-variant OCR passes"""
+    global _variant_pool
+    with _pool_lock:
+        if _variant_pool is None:
+            from concurrent.futures import ThreadPoolExecutor
+            _variant_pool = ThreadPoolExecutor(max_workers=OCR_PARALLEL, thread_name_prefix='ocr-variant')
+    return _variant_pool
+
+# Initialize EasyOCR reader (lazy loading)
+ocr_reader = None
+_reader_lock = threading.Lock()
+
+def get_ocr_reader():
+    """
+    Lazy initialization of EasyOCR reader. With OCR_ENGINE=onnx its networks
+    run on ONNX Runtime (see ocr_onnx.py), falling back to PyTorch if the
+    exported models can't be loaded.
+    """
+    global ocr_reader
+    with _reader_lock:
+        if ocr_reader is None:
+            try:
+                import easyocr
+                log.info("initializing EasyOCR reader")
+                _limit_torch_threads()
+                with metrics.span('ocr.reader_init'):
+                    ocr_reader = easyocr.Reader(['en'], gpu=False)  # Set gpu=True if you have CUDA
+                    if ocr_onnx.OCR_ENGINE == 'onnx':
+                        try:
+                            ocr_onnx.attach(ocr_reader, threads=OCR_TORCH_THREADS)
+                        except Exception as e:
+                            log.error("ONNX OCR engine unavailable, using PyTorch: %s", e)
+                log.info("EasyOCR reader initialized")
+            except Exception as e:
+                log.error("error initializing EasyOCR: %s", e)
+                ocr_reader = False
+    return ocr_reader if ocr_reader is not False else None
+
+def warm_up_ocr():
+    """
+    Load the reader and run one inference on a synthetic receipt so the
+    first real upload doesn't pay for model load and torch initialisation.
+    """
+    started = time.time()
+    fast = ocr_backends.fast_backend()
+    reader = get_ocr_reader()
+    loaded = time.time()
+    if reader is None:
+        return {"available": fast is not None, "fast_backend": fast and fast.name,
+                "reader_seconds": round(loaded - started, 3)}
+    import cv2
+    import numpy as np
+    img = np.full((80, 320), 255, dtype=np.uint8)
+    cv2.putText(img, 'TOTAL 123.45', (10, 50), cv2.FONT_HERSHEY_SIMPLEX, 1.0, 0, 2)
+    reader.readtext(img, detail=0, paragraph=False)
+    return {
+        "available": True,
+        "fast_backend": fast and fast.name,
+        "reader_seconds": round(loaded - started, 3),
+        "warmup_seconds": round(time.time() - loaded, 3),
+    }
+
+# Micro-batching of readtext calls (see ocr_batcher.py). Only pays off when
+# several OCR jobs share a process, so it defaults to on for the thread executor.
+OCR_BATCHING = os.environ.get('OCR_BATCHING', '1' if os.environ.get('OCR_EXECUTOR') == 'thread' else '0') != '0'
+ocr_batcher = None
+
+def get_ocr_batcher():
+    """Shared OCRBatcher around the reader, or None if batching is off / no reader"""
+    global ocr_batcher
+    if not OCR_BATCHING:
+        return None
+    reader = get_ocr_reader()
+    if reader is None:
+        return None
+    with _reader_lock:
+        if ocr_batcher is None:
+            from ocr_batcher import OCRBatcher
+            ocr_batcher = OCRBatcher(reader)
+    return ocr_batcher
+
+# Enhanced amount extraction from text
+def extract_amounts_from_text(text):
+    """Extract monetary amounts from text with improved patterns"""
+    return [amt for amt, score in extract_scored_amounts(text)]
+
+def extract_scored_amounts(text):
+    """
+    Same search as extract_amounts_from_text() but returns (amount, score)
+    pairs. Plain numbers found by the low-priority fallback score 0.
+    """
+    if not text:
+        return []
+    with metrics.span('extract'):
+        # CRITICAL FIX: OCR often misreads the ₹ symbol as "2" in UPI/payment
+        # receipts (₹1,750 -> 21,750); normalize() undoes that in UPI context only
+        text_upper, upi_fixed = extraction.normalize(text)
+        if upi_fixed:
+            log.debug("UPI context detected - fixed likely rupee symbol misread (₹ → '2')")
+        # OCR text is one line per receipt line; layout=True reads "TOTAL ... 123.45" lines
+        return extraction.extract_normalized(text_upper, layout=True)
+
+# Preprocessing strategies, each turning the loaded BGR image (and its
+# grayscale version) into the array handed to reader.readtext()
+def _enhanced(img, gray):
+    import cv2
+    blurred = cv2.GaussianBlur(gray, (3, 3), 0)
+    clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
+    enhanced = clahe.apply(blurred)
+    return cv2.adaptiveThreshold(
+        enhanced, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+        cv2.THRESH_BINARY, 11, 2
+    )
+
+def _grayscale(img, gray):
+    return gray
+
+def _original(img, gray):
+    return img
+
+def _inverted(img, gray):
+    # white text on dark background
+    import cv2
+    return cv2.bitwise_not(gray)
+
+def _binary(img, gray):
+    import cv2
+    _, binary = cv2.threshold(gray, 127, 255, cv2.THRESH_BINARY)
+    return binary
+
+# (name, description, function) in the default order
+OCR_STRATEGIES = [
+    ('enhanced', 'Enhanced preprocessing', _enhanced),
+    ('grayscale', 'Simple grayscale', _grayscale),
+    ('original', 'Original image', _original),
+    ('inverted', 'Inverted image', _inverted),
+    ('binary', 'Binary threshold', _binary),
+]
+
+# Cascade mode: run strategies best-first and stop once a keyword-backed
+# (TOTAL/PAID/...) amount has been found. OCR_MAX_PASSES caps passes either way.
+OCR_CASCADE = os.environ.get('OCR_CASCADE', '1') != '0'
+OCR_MAX_PASSES = int(os.environ.get('OCR_MAX_PASSES', len(OCR_STRATEGIES)))
+HIGH_CONFIDENCE_SCORE = 80  # lowest score of the priority (keyword) patterns
+OCR_STATS_FILE = os.environ.get('OCR_STATS_FILE', 'ocr_strategy_stats.json')
+OCR_TIER_STATS_FILE = os.environ.get('OCR_TIER_STATS_FILE', 'ocr_tier_stats.json')
+
+# Bump whenever preprocessing, strategy or extraction behaviour changes so
+# cached OCR results computed by older code are not reused
+OCR_PIPELINE_VERSION = 3
+
+def ocr_config_version():
+    """Short tag identifying the OCR pipeline code and settings"""
+    names = ','.join(name for name, _, _ in OCR_STRATEGIES)
+    mode = 'cascade' if OCR_CASCADE else 'full'
+    return (f"v{OCR_PIPELINE_VERSION}-{mode}{OCR_MAX_PASSES}-{names}-iou{ocr_layout.OCR_MERGE_IOU}-"
+            f"{ocr_backends.settings_tag()}-{ocr_onnx.settings_tag()}-{ocr_preprocess.settings_tag()}-"
+            f"{ocr_pdf.settings_tag()}")
+
+class StrategyStats:
+    """
+    Per-strategy run/win counts used to order the cascade. A strategy "wins"
+    when its pass is the one that produced the high-confidence amount.
+    Counts are kept in a JSON file; it is re-read when another process
+    updates it. Several processes may record at once (the pre-fork server's
+    workers, a CLI bulk import), so an update holds an exclusive lock on
+    <path>.lock and re-reads the file before adding its counts and writing.
+    """
+    def __init__(self, path=OCR_STATS_FILE):
+        self.path = path
+        self.counts = {}
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    def _refresh(self, force=False):
+        # Caller holds the lock
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return
+        if mtime == self._mtime and not force:
+            return
+        try:
+            with open(self.path, 'r') as f:
+                self.counts = json.load(f)
+            self._mtime = mtime
+        except (OSError, ValueError) as e:
+            log.warning("could not read OCR strategy stats: %s", e)
+
+    def hit_rate(self, name):
+        c = self.counts.get(name, {})
+        # Laplace smoothing so unseen strategies aren't written off
+        return (c.get('wins', 0) + 1) / (c.get('runs', 0) + 2)
+
+    def order(self, names):
+        """Strategy names sorted by hit rate, default order breaking ties"""
+        with self._lock:
+            self._refresh()
+            rank = {name: i for i, name in enumerate(names)}
+            return sorted(names, key=lambda n: (-self.hit_rate(n), rank[n]))
+
+    def _file_lock(self):
+        """Exclusive lock across processes, or None if it can't be taken"""
+        if fcntl is None:
+            return None
+        try:
+            fd = os.open(self.path + '.lock', os.O_RDWR | os.O_CREAT, 0o644)
+        except OSError as e:
+            log.warning("could not lock OCR strategy stats: %s", e)
+            return None
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        return fd
+
+    def record(self, tried, winner, seconds=None):
+        with self._lock:
+            fd = self._file_lock()
+            try:
+                self._record(tried, winner, seconds)
+            finally:
+                if fd is not None:
+                    os.close(fd)  # releases the flock
+
+    def _record(self, tried, winner, seconds):
+        # Caller holds both locks; another process may have written since the last read
+        self._refresh(force=True)
+        for name in tried:
+            c = self.counts.setdefault(name, {'runs': 0, 'wins': 0})
+            c['runs'] += 1
+            if seconds and name in seconds:
+                c['seconds'] = round(c.get('seconds', 0.0) + seconds[name], 4)
+        if winner in tried:
+            # once, even if the winner also ran on other PDF pages
+            self.counts[winner]['wins'] += 1
+        try:
+            tmp = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp, 'w') as f:
+                json.dump(self.counts, f, indent=2)
+            os.replace(tmp, self.path)
+            self._mtime = os.path.getmtime(self.path)
+        except OSError as e:
+            log.warning("could not save OCR strategy stats: %s", e)
+
+    def snapshot(self):
+        with self._lock:
+            self._refresh()
+            out = {}
+            for name, c in self.counts.items():
+                out[name] = dict(c, hit_rate=round(self.hit_rate(name), 3))
+                if 'seconds' in c:
+                    out[name]['mean_seconds'] = round(c['seconds'] / max(1, c['runs']), 4)
+            return out
+
+strategy_stats = StrategyStats()
+# Same counts per OCR tier (ocr_backends): a tier wins when its text is the
+# one returned, so the fast tier's hit rate is the share that never reaches torch
+tier_stats = StrategyStats(OCR_TIER_STATS_FILE)
+
+def record_outcome(details):
+    """Update strategy, tier and preprocessing stats from a try_ocr_detailed() result"""
+    if details.get('strategies_run'):
+        strategy_stats.record(details['strategies_run'], details['winner'])
+    if details.get('tiers_run'):
+        tier_stats.record(details['tiers_run'], details.get('tier'), details.get('tier_seconds'))
+    if details.get('preprocess'):
+        ocr_preprocess.totals.record(details['preprocess'])
+
+# OCR using EasyOCR with image preprocessing
+def try_ocr(filepath, use_cache=True):
+    """Extract text from image using EasyOCR with preprocessing and multiple strategies"""
+    cache = key = None
+    if use_cache:
+        from ocr_cache import default_cache
+        cache = default_cache()
+        try:
+            key = cache.key_for_file(filepath)
+            cached = cache.get(key)
+            if cached is not None:
+                log.debug("OCR cache hit path=%s", filepath)
+                return cached['text']
+        except OSError as e:
+            log.warning("OCR cache lookup failed: %s", e)
+            key = None
+    details = try_ocr_detailed(filepath)
+    record_outcome(details)
+    if key is not None and is_cacheable(details):
+        details['amounts'] = extract_amounts_from_text(details['text'])
+        cache.put(key, details)
+    return details['text']
+
+def is_cacheable(details):
+    """False for "OCR unavailable" results, which must not stick in the cache"""
+    return bool(details['strategies_run'] or details.get('tier') or (details.get('pdf') or {}).get('text_layer'))
+
+def load_image(source):
+    """
+    BGR image from a file path or from encoded image bytes (decoded in
+    memory with cv2.imdecode); None if it can't be decoded.
+    """
+    import cv2
+    import numpy as np
+    if isinstance(source, np.ndarray):
+        return source
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return cv2.imdecode(np.frombuffer(source, dtype=np.uint8), cv2.IMREAD_COLOR)
+    return cv2.imread(source)
+
+def _describe(source):
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return f"<{len(source)} bytes in memory>"
+    if hasattr(source, 'shape'):
+        return f"<rendered page {source.shape}>"
+    return source
+
+def _fast_tier(backend, gray, details):
+    """
+    One read of the prepared image by the fast backend; returns (segments,
+    accepted). Accepted means a keyword-backed amount and a median word
+    confidence of at least OCR_FAST_MIN_CONFIDENCE.
+    """
+    started = time.perf_counter()
+    try:
+        with metrics.span('ocr.tier', strategy=backend.name):
+            segments = ocr_layout.from_readtext(backend.readtext(gray, detail=1, paragraph=False), backend.name)
+    except Exception as e:
+        log.warning("%s pass failed: %s", backend.name, e)
+        segments = []
+    details['tiers_run'].append(backend.name)
+    details['tier_seconds'][backend.name] = round(time.perf_counter() - started, 4)
+    confidences = sorted(seg.confidence for seg in segments if seg.confidence is not None)
+    confidence = confidences[len(confidences) // 2] if confidences else 0.0
+    scored = extract_scored_amounts(ocr_layout.document(segments)[0]) if segments else []
+    accepted = bool(scored) and scored[0][1] >= HIGH_CONFIDENCE_SCORE and confidence >= ocr_backends.OCR_FAST_MIN_CONFIDENCE
+    log.debug("%s tier segments=%d confidence=%.2f amount=%s accepted=%s", backend.name,
+              len(segments), confidence, scored[0] if scored else None, accepted)
+    if accepted:
+        details['tier'] = backend.name
+    return segments, accepted
+
+def _easyocr_tier(img, gray, readtext, batcher, cascade, max_passes, parallel, all_segments, details):
+    """The EasyOCR strategy passes; appends to all_segments and fills in details"""
+    started = time.perf_counter()
+    strategies = {name: (desc, fn) for name, desc, fn in OCR_STRATEGIES}
+    names = [name for name, _, _ in OCR_STRATEGIES]
+    if cascade:
+        names = strategy_stats.order(names)
+    
+    run_names = names[:max_passes]
+    
+    def variant(name):
+        with metrics.span('preprocess.variant', strategy=name):
+            return strategies[name][1](img, gray)
+    
+    def run_pass(name):
+        image = variant(name)
+        with metrics.span('ocr.readtext', strategy=name):
+            return readtext(image, detail=1, paragraph=False)
+    
+    # Passes are started in waves; a cascade only needs the first
+    # one if the historically best strategy finds the amount
+    waves = [run_names[:1], run_names[1:]] if cascade else [run_names]
+    pool = get_variant_pool() if parallel > 1 else None
+    done = False
+    with metrics.span('ocr.tier', strategy=ocr_backends.EASYOCR_TIER):
+        for wave in waves:
+            if done or not wave:
+                break
+            futures = {}
+            pooled = len(wave) > 1 and pool is not None
+            if pooled:
+                # At most `parallel` passes in flight; the next one starts as each result is examined
+                futures = {name: pool.submit(run_pass, name) for name in wave[:parallel]}
+            elif len(wave) > 1 and batcher is not None:
+                # No pool - still hand the batcher the whole wave at once
+                futures = {name: batcher.submit(variant(name), detail=1, paragraph=False)
+                           for name in wave}
+            for j, name in enumerate(wave):
+                i = len(details['strategies_run']) + 1
+                future = futures.pop(name, None)
+                results = future.result() if future else run_pass(name)
+                all_segments.extend(ocr_layout.from_readtext(results, name))
+                details['strategies_run'].append(name)
+                log.debug("strategy pass=%d name=%s segments=%d", i, name, len(results))
+                
+                if cascade:
+                    scored = extract_scored_amounts(ocr_layout.document(all_segments)[0])
+                    if scored and scored[0][1] >= HIGH_CONFIDENCE_SCORE:
+                        details['winner'] = name
+                        log.debug("high-confidence amount=%s passes=%d - stopping", scored[0][0], i)
+                        for future in futures.values():
+                            future.cancel()  # passes already running finish, but nothing new starts
+                        done = True
+                        break
+                if pooled and j + parallel < len(wave):
+                    futures[wave[j + parallel]] = pool.submit(run_pass, wave[j + parallel])
+    tier = ocr_backends.EASYOCR_TIER
+    details['tiers_run'].append(tier)
+    details['tier_seconds'][tier] = round(time.perf_counter() - started, 4)
+    details['tier'] = tier
+
+def try_ocr_detailed(filepath, cascade=None, max_passes=None, parallel=None):
+    """
+    Run the OCR strategies on filepath - a path, the encoded image bytes or
+    a decoded image - and return a dict with the 'text', the
+    'strategies_run' (in order) and the 'winner' strategy that produced a
+    high-confidence amount (None if none did). The passes' detection boxes
+    are merged by ocr_layout, so 'text' holds each receipt line once, top
+    to bottom; 'segments' counts the boxes read and kept.
+
+    Up to `parallel` (default OCR_PARALLEL) passes run at once. In cascade
+    mode the best strategy runs alone first and the rest only if it missed,
+    started one by one as results come in, so none starts after an amount
+    is accepted;
+    results are examined in order either way, so the outcome is the same as
+    running the passes one after another.
+
+    With a fast backend (ocr_backends) that tier reads the image first and
+    the strategy passes only run when it misses. 'tiers_run' lists the
+    tiers tried, 'tier' the one whose text was kept and 'tier_seconds' the
+    time each took.
+
+    Does not update the stats; callers pass the result to record_outcome()
+    so that only one process writes the stats files.
+    """
+    cascade = OCR_CASCADE if cascade is None else cascade
+    max_passes = OCR_MAX_PASSES if max_passes is None else max_passes
+    parallel = OCR_PARALLEL if parallel is None else parallel
+    if ocr_pdf.is_pdf(filepath):
+        # Text layer if there is one, otherwise each rendered page through this function
+        return ocr_pdf.ocr_pdf(filepath, lambda page: try_ocr_detailed(page, cascade, max_passes, parallel))
+    details = {"text": "", "strategies_run": [], "winner": None, "preprocess": None,
+               "segments": {"read": 0, "kept": 0}, "tiers_run": [], "tier": None, "tier_seconds": {}}
+    try:
+        # The EasyOCR reader is only loaded up front when there is no fast tier
+        fast = ocr_backends.fast_backend()
+        reader = None
+        if fast is None:
+            reader = get_ocr_reader()
+            if reader is None:
+                log.warning("OCR reader not available - returning empty text")
+                return details
+        
+        source = _describe(filepath)
+        all_segments = []
+        
+        # Try to preprocess image for better OCR
+        try:
+            import cv2
+            
+            # Read image
+            with metrics.span('decode'):
+                img = load_image(filepath)
+            if img is None:
+                log.error("failed to read image source=%s", source)
+                return details
+            
+            log.debug("image loaded source=%s shape=%s", source, img.shape)
+            batcher = get_ocr_batcher() if fast is None else None
+            readtext = batcher.readtext if batcher is not None else (reader or fast).readtext
+            
+            # Shrink to a useful text size and crop to the receipt before any pass
+            with metrics.span('preprocess.prepare'):
+                img, prep = ocr_preprocess.prepare(img, readtext=readtext)
+            details['preprocess'] = prep
+            log.debug("preprocessed shape=%s pixel_ratio=%.3f seconds=%s",
+                      img.shape, prep['pixel_ratio'], prep['seconds'])
+            passes_started = time.perf_counter()
+            with metrics.span('preprocess.grayscale'):
+                gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+            
+            if fast is not None:
+                all_segments, accepted = _fast_tier(fast, gray, details)
+                if not accepted:
+                    reader = get_ocr_reader()
+                    if reader is None:
+                        log.warning("OCR reader not available - keeping the %s result", fast.name)
+                    else:
+                        all_segments = []
+                        batcher = get_ocr_batcher()
+                        readtext = batcher.readtext if batcher is not None else reader.readtext
+            
+            if reader is not None:
+                _easyocr_tier(img, gray, readtext, batcher, cascade, max_passes, parallel,
+                              all_segments, details)
+            
+            ocr_seconds = time.perf_counter() - passes_started
+            prep['ocr_seconds'] = round(ocr_seconds, 3)
+            prep['estimated_seconds_saved'] = ocr_preprocess.estimate_seconds_saved(prep, ocr_seconds)
+            
+        except Exception as preprocess_error:
+            log.exception("preprocessing failed: %s", preprocess_error)
+            # Fallback to original image
+            try:
+                reader = reader or get_ocr_reader()
+                if reader is None:
+                    raise RuntimeError("OCR reader not available")
+                with metrics.span('ocr.readtext', strategy='fallback'):
+                    results_fallback = reader.readtext(filepath, detail=1, paragraph=False)
+                all_segments.extend(ocr_layout.from_readtext(results_fallback, 'fallback'))
+                details['tier'] = ocr_backends.EASYOCR_TIER
+                log.info("fallback readtext on original source segments=%d", len(results_fallback))
+            except Exception as fallback_error:
+                log.error("fallback readtext also failed: %s", fallback_error)
+        
+        # One reading per detected region, rebuilt into ordered lines
+        with metrics.span('ocr.merge'):
+            final_text, lines = ocr_layout.document(all_segments)
+        details['text'] = final_text
+        details['segments'] = {"read": len(all_segments), "kept": sum(len(line) for line in lines)}
+        log.info("OCR done source=%s passes=%d winner=%s segments=%d/%d lines=%d chars=%d", source,
+                 len(details['strategies_run']), details['winner'], details['segments']['kept'],
+                 len(all_segments), len(lines), len(final_text))
+        
+        # Line by line for debugging; skipped entirely unless DEBUG is on
+        if log.isEnabledFor(logging.DEBUG):
+            for i, line in enumerate(final_text.split('\n')[:30], 1):  # first 30 lines
+                log.debug("  %2d. %s", i, line)
+            if len(lines) > 30:
+                log.debug("  ... and %d more lines", len(lines) - 30)
+        
+        return details
+    except Exception as e:
+        log.exception("OCR error: %s", e)
+        return details
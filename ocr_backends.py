@@ -0,0 +1,103 @@
+"""
+OCR engines behind try_ocr().
+
+An engine is anything with EasyOCR's readtext(image, detail=1,
+paragraph=False) -> [(box points, text, confidence 0-1), ...]; the EasyOCR
+reader itself is the last tier. A cheap first tier (OCR_FAST_BACKEND,
+default Tesseract) reads each prepared image once, and the result is kept
+when it holds a keyword-backed amount and its median word confidence is at
+least OCR_FAST_MIN_CONFIDENCE. Only the rest escalates to the EasyOCR
+strategy passes, so clean screenshots never load torch.
+
+OCR_FAST_BACKEND=none turns the fast tier off. Backends whose library or
+binary is missing report themselves unavailable and are skipped.
+"""
+import os, logging, threading
+
+OCR_FAST_BACKEND = os.environ.get('OCR_FAST_BACKEND', 'tesseract').strip().lower()
+OCR_FAST_MIN_CONFIDENCE = float(os.environ.get('OCR_FAST_MIN_CONFIDENCE', 0.75))
+OCR_TESSERACT_CONFIG = os.environ.get('OCR_TESSERACT_CONFIG', '--psm 6')  # one uniform block of text
+EASYOCR_TIER = 'easyocr'
+
+log = logging.getLogger(__name__)
+
+
+class OCRBackend:
+    """A fast-tier engine; subclasses implement load() and readtext()"""
+    name = None
+
+    def __init__(self):
+        self._available = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Import the library / check the binary; raise if the engine can't run"""
+        raise NotImplementedError
+
+    def available(self):
+        with self._lock:
+            if self._available is None:
+                try:
+                    self.load()
+                    self._available = True
+                    log.info("OCR backend %s available", self.name)
+                except Exception as e:
+                    log.warning("OCR backend %s unavailable: %s", self.name, e)
+                    self._available = False
+            return self._available
+
+    def readtext(self, image, detail=1, paragraph=False):
+        raise NotImplementedError
+
+
+class TesseractBackend(OCRBackend):
+    """Tesseract through pytesseract; word boxes with confidences scaled to 0-1"""
+    name = 'tesseract'
+
+    def __init__(self, config=OCR_TESSERACT_CONFIG):
+        super().__init__()
+        self.config = config
+
+    def load(self):
+        import pytesseract
+        pytesseract.get_tesseract_version()  # raises if the binary isn't installed
+
+    def readtext(self, image, detail=1, paragraph=False):
+        import pytesseract
+        data = pytesseract.image_to_data(image, config=self.config, output_type=pytesseract.Output.DICT)
+        results = []
+        for text, conf, x, y, w, h in zip(data['text'], data['conf'], data['left'],
+                                          data['top'], data['width'], data['height']):
+            conf = float(conf)
+            if conf < 0 or not text.strip():
+                continue  # -1 marks page/block/line rows, not words
+            results.append(([[x, y], [x + w, y], [x + w, y + h], [x, y + h]], text, conf / 100.0))
+        return results if detail else [text for _, text, _ in results]
+
+
+BACKENDS = {'tesseract': TesseractBackend}
+_instances = {}
+_instances_lock = threading.Lock()
+
+
+def get_backend(name):
+    """Shared instance of the named backend, or None if unknown or unavailable"""
+    if name not in BACKENDS:
+        if name not in ('', 'none', '0'):
+            log.warning("unknown OCR backend %r", name)
+        return None
+    with _instances_lock:
+        backend = _instances.get(name)
+        if backend is None:
+            backend = _instances[name] = BACKENDS[name]()
+    return backend if backend.available() else None
+
+
+def fast_backend():
+    """The configured first-tier backend, or None"""
+    return get_backend(OCR_FAST_BACKEND)
+
+
+def settings_tag():
+    """Part of the OCR config version: the fast tier decides which text is kept"""
+    return f"fast-{OCR_FAST_BACKEND or 'none'}{OCR_FAST_MIN_CONFIDENCE}"
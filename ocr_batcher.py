@@ -0,0 +1,150 @@
+"""
+Micro-batching front end for an EasyOCR reader.
+
+Callers submit preprocessed images from any thread; a single dispatcher
+thread collects whatever arrives within OCR_BATCH_WAIT_MS (up to
+OCR_BATCH_MAX images) and runs them through one reader.readtext_batched()
+call, then hands each caller its own result. Prepared receipts rarely have
+identical sizes, so images of similar size are padded on the bottom and
+right (with their border colour) to the largest one in their group; a group
+only grows while the padding adds at most OCR_BATCH_PAD_RATIO to the pixels
+read. Padding leaves the detection boxes where they were. Because all
+inference happens on the dispatcher thread, the reader is never used
+concurrently.
+"""
+import os, time, queue, logging, threading
+from concurrent.futures import Future
+
+OCR_BATCH_MAX = int(os.environ.get('OCR_BATCH_MAX', 8))
+OCR_BATCH_WAIT_MS = float(os.environ.get('OCR_BATCH_WAIT_MS', 10))
+OCR_BATCH_PAD_RATIO = float(os.environ.get('OCR_BATCH_PAD_RATIO', 1.3))  # padded / original pixels per batch
+
+log = logging.getLogger(__name__)
+
+
+class OCRBatcher:
+    def __init__(self, reader, max_batch=OCR_BATCH_MAX, max_wait_ms=OCR_BATCH_WAIT_MS,
+                 pad_ratio=OCR_BATCH_PAD_RATIO):
+        self.reader = reader
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.pad_ratio = pad_ratio
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stats = {"batches": 0, "images": 0, "batched_calls": 0, "padded_images": 0, "largest_batch": 0}
+
+    def submit(self, image, **kwargs):
+        """Queue one image for readtext(image, **kwargs); returns a Future"""
+        self._ensure_thread()
+        future = Future()
+        self._queue.put((image, kwargs, future))
+        return future
+
+    def readtext(self, image, **kwargs):
+        """Blocking drop-in for reader.readtext()"""
+        return self.submit(image, **kwargs).result()
+
+    def _ensure_thread(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name='ocr-batcher', daemon=True)
+                self._thread.start()
+
+    def _loop(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self._run(batch)
+            except Exception as e:
+                log.exception("OCR batch failed size=%d", len(batch))
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def _groups(self, batch):
+        """Lists of items that can share one readtext_batched call once padded"""
+        # Same options, channels and dtype; sizes close enough that padding stays within pad_ratio
+        by_kind = {}
+        for item in batch:
+            image, kwargs, _ = item
+            key = (image.shape[2:], image.dtype.str, tuple(sorted(kwargs.items())))
+            by_kind.setdefault(key, []).append(item)
+        for items in by_kind.values():
+            items.sort(key=lambda item: item[0].shape[:2])
+            group, height, width, area = [], 0, 0, 0
+            for item in items:
+                h, w = item[0].shape[:2]
+                grown = (max(height, h), max(width, w), area + h * w)
+                if group and grown[0] * grown[1] * (len(group) + 1) > self.pad_ratio * grown[2]:
+                    yield group
+                    group, grown = [], (h, w, h * w)
+                group.append(item)
+                height, width, area = grown
+            if group:
+                yield group
+
+    @staticmethod
+    def _pad(image, height, width):
+        """image on a height x width canvas of its median border colour, at the top left"""
+        import numpy as np
+        h, w = image.shape[:2]
+        if (h, w) == (height, width):
+            return image
+        border = np.concatenate([image[0], image[-1], image[:, 0], image[:, -1]])
+        canvas = np.empty((height, width) + image.shape[2:], dtype=image.dtype)
+        canvas[...] = np.median(border, axis=0).astype(image.dtype)
+        canvas[:h, :w] = image
+        return canvas
+
+    def _run(self, batch):
+        # A caller that already cancelled (an early cascade exit) needs no OCR
+        batch = [item for item in batch if item[2].set_running_or_notify_cancel()]
+        if not batch:
+            return
+        batched = hasattr(self.reader, 'readtext_batched')
+        for items in self._groups(batch):
+            kwargs = items[0][1]
+            if batched and len(items) > 1:
+                try:
+                    height = max(image.shape[0] for image, _, _ in items)
+                    width = max(image.shape[1] for image, _, _ in items)
+                    images = [self._pad(image, height, width) for image, _, _ in items]
+                    results = self.reader.readtext_batched(images, **kwargs)
+                    for (_, _, future), result in zip(items, results):
+                        future.set_result(result)
+                    with self._lock:
+                        self._stats["batched_calls"] += 1
+                        self._stats["padded_images"] += sum(a is not b for a, (b, _, _) in zip(images, items))
+                    continue
+                except Exception as e:
+                    log.warning("batched OCR failed, falling back to one image at a time: %s", e)
+            for image, kwargs, future in items:
+                if future.done():
+                    continue
+                try:
+                    future.set_result(self.reader.readtext(image, **kwargs))
+                except Exception as e:
+                    future.set_exception(e)
+
+        with self._lock:
+            self._stats["batches"] += 1
+            self._stats["images"] += len(batch)
+            self._stats["largest_batch"] = max(self._stats["largest_batch"], len(batch))
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats["avg_batch"] = round(stats["images"] / stats["batches"], 2) if stats["batches"] else None
+        stats["max_batch"] = self.max_batch
+        stats["max_wait_ms"] = self.max_wait * 1000
+        return stats
@@ -0,0 +1,139 @@
+"""
+Content-addressed cache of OCR results.
+
+Entries are keyed on the SHA-256 of the image bytes plus the OCR config
+version, so re-uploading the same receipt skips OCR entirely while a change
+to the preprocessing/cascade settings invalidates old results. Each entry is
+a small JSON file under OCR_CACHE_DIR; file mtimes carry the LRU order
+across restarts.
+
+Several processes may share the directory (server workers, the bulk CLI).
+A key missing from this process's index is still looked up on disk and
+adopted, and the index is rebuilt from the directory every
+max_entries / 10 writes, so eviction also covers the others' entries.
+"""
+import os, json, time, hashlib, logging, threading
+from collections import OrderedDict
+
+OCR_CACHE_DIR = os.environ.get('OCR_CACHE_DIR', 'ocr_cache')
+OCR_CACHE_SIZE = int(os.environ.get('OCR_CACHE_SIZE', 1000))  # max entries
+
+# Only these parts of an OCR result are worth keeping
+CACHED_FIELDS = ('text', 'amounts', 'strategies_run', 'winner')
+
+log = logging.getLogger(__name__)
+
+
+class OCRCache:
+    """Bounded LRU cache of OCR results persisted as one JSON file per entry"""
+
+    def __init__(self, directory=OCR_CACHE_DIR, max_entries=OCR_CACHE_SIZE):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._index = OrderedDict()  # key -> None, least recently used first
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._load_index()
+
+    def _load_index(self):
+        # Rebuilds the index from the directory, least recently used (oldest mtime) first
+        self._index = OrderedDict()
+        if not os.path.isdir(self.directory):
+            return
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.json'):
+                path = os.path.join(self.directory, name)
+                try:
+                    entries.append((os.path.getmtime(path), name[:-5]))
+                except OSError:
+                    pass
+        for _, key in sorted(entries):
+            self._index[key] = None
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.json')
+
+    def key_for(self, data):
+        """Cache key for raw image bytes under the current OCR config"""
+        return self.key_for_digest(hashlib.sha256(data).hexdigest())
+
+    def key_for_digest(self, digest):
+        """Cache key for image bytes whose SHA-256 hex digest is already known"""
+        from ocr import ocr_config_version
+        return f"{digest}-{ocr_config_version()}"
+
+    def key_for_file(self, filepath):
+        with open(filepath, 'rb') as f:
+            return self.key_for(f.read())
+
+    def get(self, key):
+        """Return the cached result for key (and mark it recently used), or None"""
+        with self._lock:
+            path = self._path(key)
+            value = None
+            # Not in the index may still mean written by another process
+            try:
+                with open(path, 'r') as f:
+                    value = json.load(f)
+                now = time.time()
+                os.utime(path, (now, now))
+                self._index[key] = None
+                self._index.move_to_end(key)
+            except (OSError, ValueError):
+                # Never written, evicted by another process or unreadable - a miss
+                self._index.pop(key, None)
+                value = None
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return value
+
+    def put(self, key, result):
+        """Store the cacheable fields of an OCR result, evicting LRU entries"""
+        value = {k: result.get(k) for k in CACHED_FIELDS}
+        with self._lock:
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                tmp = f"{self._path(key)}.{os.getpid()}.tmp"
+                with open(tmp, 'w') as f:
+                    json.dump(value, f)
+                os.replace(tmp, self._path(key))
+            except OSError as e:
+                log.warning("could not write OCR cache entry key=%s: %s", key, e)
+                return
+            self._writes += 1
+            if self._writes % max(1, self.max_entries // 10) == 0:
+                self._load_index()  # picks up the entries other processes wrote
+            self._index[key] = None
+            self._index.move_to_end(key)
+            while len(self._index) > self.max_entries:
+                old_key, _ = self._index.popitem(last=False)
+                try:
+                    os.remove(self._path(old_key))
+                except OSError:
+                    pass
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+                "size": len(self._index),
+                "max_entries": self.max_entries,
+            }
+
+
+_default_cache = None
+
+def default_cache():
+    """Process-wide cache instance, created on first use"""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = OCRCache()
+    return _default_cache
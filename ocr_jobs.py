@@ -0,0 +1,226 @@
+"""
+Background OCR job queue for /upload.
+
+Receipts are handed to a bounded pool of worker processes (each one builds
+its own EasyOCR reader once, on start-up) so the request thread can return a
+job id straight away. Clients poll /jobs/<id> for the result. With
+OCR_EXECUTOR=thread the pool is a thread pool sharing one reader instead.
+Given a JobStore (job_store.py), job snapshots are also published there so
+that other server processes can answer the polls.
+"""
+import os, time, uuid, logging, threading, multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import metrics
+
+# 'process': one EasyOCR reader per worker process (isolated, more memory).
+# 'thread': workers share this process's reader; pair with OCR batching so
+# concurrent uploads are recognised in batches (see ocr_batcher.py).
+OCR_EXECUTOR = os.environ.get('OCR_EXECUTOR', 'process')
+OCR_WORKERS = int(os.environ.get('OCR_WORKERS', 2))
+OCR_MAX_PENDING = int(os.environ.get('OCR_MAX_PENDING', 16))  # queued + running jobs
+JOB_TTL = 60 * 60  # seconds a finished job stays available for polling
+
+log = logging.getLogger(__name__)
+
+
+class QueueFull(Exception):
+    """Raised by OCRJobQueue.submit() when the pending-job limit is reached"""
+
+
+_worker_warmup = None
+
+def _init_worker():
+    # Load (and exercise) the reader when the worker starts rather than inside the first job
+    global _worker_warmup
+    from ocr import warm_up_ocr
+    try:
+        _worker_warmup = warm_up_ocr()
+    except Exception as e:
+        log.exception("OCR worker warm-up failed pid=%d", os.getpid())
+        _worker_warmup = {"available": False, "error": str(e)}
+
+
+def _worker_info():
+    # Runs after _init_worker in whichever worker picks it up
+    return dict(_worker_warmup or {}, pid=os.getpid())
+
+
+def _run_ocr(source):
+    """Job body executed in a worker: OCR the file (or image bytes) and extract amounts"""
+    from ocr import try_ocr_detailed, extract_amounts_from_text
+    started = time.time()
+    details = try_ocr_detailed(source)
+    ocr_done = time.time()
+    amounts = extract_amounts_from_text(details['text'])
+    # Pool processes ship their stage timings back for the parent's /metrics
+    worker_metrics = metrics.drain() if multiprocessing.parent_process() is not None else None
+    return {
+        "metrics": worker_metrics,
+        "text": details['text'],
+        "amounts": amounts,
+        "strategies_run": details['strategies_run'],
+        "winner": details['winner'],
+        "preprocess": details.get('preprocess'),
+        "pdf": details.get('pdf'),
+        "segments": details.get('segments'),
+        "tiers_run": details.get('tiers_run', []),
+        "tier": details.get('tier'),
+        "tier_seconds": details.get('tier_seconds', {}),
+        "started_at": started,
+        "ocr_seconds": round(ocr_done - started, 3),
+        "extract_seconds": round(time.time() - ocr_done, 3),
+    }
+
+
+class OCRJobQueue:
+    """Tracks OCR jobs and runs them on a process pool with a depth limit"""
+
+    def __init__(self, workers=OCR_WORKERS, max_pending=OCR_MAX_PENDING, executor=None, store=None):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor = executor
+        self.store = store  # JobStore shared with the other server processes, or None
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        # Created on first use so importing app.py doesn't fork workers
+        if self._executor is None:
+            pool = ThreadPoolExecutor if OCR_EXECUTOR == 'thread' else ProcessPoolExecutor
+            self._executor = pool(max_workers=self.workers, initializer=_init_worker)
+        return self._executor
+
+    def warm_up(self, timeout=600):
+        """
+        Start every worker and wait until each has loaded its reader.
+        Returns per-worker load timings for the readiness report.
+        """
+        executor = self._get_executor()
+        expected = 1 if isinstance(executor, ThreadPoolExecutor) else self.workers
+        workers = {}
+        deadline = time.time() + timeout
+        while len(workers) < expected and time.time() < deadline:
+            # Submitting a full round makes the pool spawn all its processes;
+            # any task result implies that worker's initializer has finished
+            futures = [executor.submit(_worker_info) for _ in range(self.workers)]
+            for f in futures:
+                info = f.result(timeout=max(1, deadline - time.time()))
+                workers[info['pid']] = info
+        infos = list(workers.values())
+        return {"available": any(i.get('available') for i in infos), "workers": infos}
+
+    def pending(self):
+        with self._lock:
+            return sum(1 for j in self._jobs.values() if j['status'] in ('queued', 'running'))
+
+    def submit(self, source, on_done=None, owner=None):
+        """
+        Queue OCR for source - a file path or the encoded image bytes - and
+        return the job id.
+
+        on_done(ocr_result) runs in the parent process once the worker
+        finishes; whatever it returns becomes the job's result. get() only
+        shows the job to the same `owner`.
+        """
+        now = time.time()
+        with self._lock:
+            self._prune(now)
+            pending = sum(1 for j in self._jobs.values() if j['status'] in ('queued', 'running'))
+            if pending >= self.max_pending:
+                raise QueueFull(f"{pending} OCR jobs pending (limit {self.max_pending})")
+            job_id = uuid.uuid4().hex
+            self._jobs[job_id] = {
+                "id": job_id,
+                "status": "queued",
+                "submitted_at": now,
+                "finished_at": None,
+                "timing": {},
+                "result": None,
+                "error": None,
+                "_future": None,
+                "_owner": owner,
+            }
+        try:
+            future = self._get_executor().submit(_run_ocr, source)
+        except Exception:
+            with self._lock:
+                del self._jobs[job_id]
+            raise
+        with self._lock:
+            self._jobs[job_id]['_future'] = future
+        self._publish(job_id)
+        future.add_done_callback(lambda f: self._finish(job_id, f, on_done))
+        return job_id
+
+    def _finish(self, job_id, future, on_done):
+        with self._lock:
+            submitted = self._jobs[job_id]['submitted_at']
+        result = error = None
+        timing = {}
+        try:
+            ocr_result = future.result()
+            metrics.merge(ocr_result.pop('metrics', None))
+            # Workers only read the stats files; the parent is their single writer
+            from ocr import record_outcome
+            record_outcome(ocr_result)
+            timing = {
+                "queue_seconds": round(max(0.0, ocr_result['started_at'] - submitted), 3),
+                "ocr_seconds": ocr_result['ocr_seconds'],
+                "extract_seconds": ocr_result['extract_seconds'],
+            }
+            result = on_done(ocr_result) if on_done else ocr_result
+        except Exception as e:
+            log.exception("OCR job failed job_id=%s", job_id)
+            error = str(e)
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job['status'] = 'failed' if error else 'done'
+            job['finished_at'] = time.time()
+            timing['total_seconds'] = round(job['finished_at'] - submitted, 3)
+            job['timing'] = timing
+            if not error and ocr_result.get('preprocess'):
+                job['preprocess'] = ocr_result['preprocess']
+            job['result'] = result
+            job['error'] = error
+            job['_future'] = None
+        self._publish(job_id)
+
+    def _publish(self, job_id):
+        if self.store is None:
+            return
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            owner = job['_owner']
+            snapshot = {k: v for k, v in job.items() if not k.startswith('_')}
+        self.store.put(job_id, snapshot, owner)
+
+    def get(self, job_id, owner=None):
+        """Return a JSON-safe snapshot of the job, or None if unknown or not owner's"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                if job['_owner'] != owner:
+                    return None
+                future = job['_future']
+                if job['status'] == 'queued' and future is not None and future.running():
+                    job['status'] = 'running'
+                return {k: v for k, v in job.items() if not k.startswith('_')}
+        # Submitted to another server process?
+        return self.store.get(job_id, owner) if self.store is not None else None
+
+    def _prune(self, now):
+        # Caller holds the lock
+        expired = [jid for jid, j in self._jobs.items()
+                   if j['finished_at'] is not None and now - j['finished_at'] > JOB_TTL]
+        for jid in expired:
+            del self._jobs[jid]
+            if self.store is not None:
+                self.store.delete(jid)
+
+    def shutdown(self, wait=True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
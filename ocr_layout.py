@@ -0,0 +1,105 @@
+"""
+Merging of the OCR passes by detection box, and line reconstruction.
+
+Every strategy reads the same prepared image, so the passes' boxes share
+one coordinate frame. Instead of keeping each distinct string (the same
+line read slightly differently by five passes survived five times), the
+segments of all passes are merged by spatial overlap: of the boxes that
+overlap by IoU >= OCR_MERGE_IOU only the most confident reading is kept.
+The survivors are grouped into lines by vertical position and ordered
+left to right, giving a compact document with one OCR line per text
+line - extraction can then take "the amount at the end of the TOTAL line".
+
+Readers that return plain strings (no boxes) are still accepted; those
+segments are de-duplicated by exact text and follow the boxed lines.
+"""
+import os
+from collections import namedtuple
+
+OCR_MERGE_IOU = float(os.environ.get('OCR_MERGE_IOU', 0.5))
+
+# box is (x0, y0, x1, y1) in prepared-image pixels, or None
+Segment = namedtuple('Segment', 'text confidence box strategy')
+
+
+def from_readtext(results, strategy=None):
+    """Segments from readtext() output: detail=1 (box, text, confidence) triples or plain strings"""
+    segments = []
+    for item in results:
+        if isinstance(item, str):
+            text, confidence, box = item, None, None
+        else:
+            points, text, confidence = item
+            xs = [float(p[0]) for p in points]
+            ys = [float(p[1]) for p in points]
+            box = (min(xs), min(ys), max(xs), max(ys))
+            confidence = float(confidence)
+        text = text.strip()
+        if text:
+            segments.append(Segment(text, confidence, box, strategy))
+    return segments
+
+
+def iou(a, b):
+    """Intersection over union of two (x0, y0, x1, y1) boxes"""
+    w = min(a[2], b[2]) - max(a[0], b[0])
+    h = min(a[3], b[3]) - max(a[1], b[1])
+    if w <= 0 or h <= 0:
+        return 0.0
+    inter = w * h
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def merge(segments, threshold=None):
+    """
+    One segment per region: boxed segments best-confidence first, each
+    dropped if it overlaps an already kept box by IoU >= threshold.
+    Boxless segments are kept once per distinct text, in arrival order.
+    """
+    threshold = OCR_MERGE_IOU if threshold is None else threshold
+    boxed = sorted((s for s in segments if s.box is not None), key=lambda s: -s.confidence)
+    kept = []
+    for seg in boxed:
+        if all(iou(seg.box, other.box) < threshold for other in kept):
+            kept.append(seg)
+    seen = set()
+    for seg in segments:
+        if seg.box is None and seg.text not in seen:
+            seen.add(seg.text)
+            kept.append(seg)
+    return kept
+
+
+def group_lines(segments):
+    """
+    Lists of segments, one per text line, top to bottom and left to right.
+    A segment joins the line above it when its vertical centre falls inside
+    that line's (average) band.
+    """
+    lines = []  # [segments, sum of tops, sum of bottoms]
+    boxed = sorted((s for s in segments if s.box is not None), key=lambda s: s.box[1] + s.box[3])
+    for seg in boxed:
+        centre = (seg.box[1] + seg.box[3]) / 2
+        if lines:
+            members, tops, bottoms = lines[-1]
+            if tops / len(members) <= centre <= bottoms / len(members):
+                members.append(seg)
+                lines[-1][1] += seg.box[1]
+                lines[-1][2] += seg.box[3]
+                continue
+        lines.append([[seg], seg.box[1], seg.box[3]])
+    ordered = [sorted(members, key=lambda s: s.box[0]) for members, _, _ in lines]
+    ordered.extend([seg] for seg in segments if seg.box is None)
+    return ordered
+
+
+def to_text(lines):
+    """One text line per OCR line, segments separated by spaces"""
+    return '\n'.join(' '.join(seg.text for seg in line) for line in lines)
+
+
+def document(segments, threshold=None):
+    """(text, lines) for the segments of every pass"""
+    lines = group_lines(merge(segments, threshold))
+    return to_text(lines), lines
@@ -0,0 +1,263 @@
+"""
+ONNX Runtime engine for the EasyOCR models, optionally int8-quantized.
+
+    python ocr_onnx.py export [--dir models/ocr_onnx]
+    python ocr_onnx.py check [--repeat 3] [--out report.json]
+
+`export` traces the reader's CRAFT detector and recognizer to ONNX and
+writes a dynamically int8-quantized copy of each (onnxruntime.quantization;
+weights are int8, activations are quantized on the fly, so no calibration
+set is needed). With OCR_ENGINE=onnx, get_ocr_reader() builds the normal
+easyocr.Reader - for its pre/post-processing and decoder - and swaps both
+networks for ONNX Runtime sessions; OCR_ONNX_PRECISION picks int8 (default)
+or fp32. If the files are missing or don't load, the PyTorch models stay.
+
+`check` is the accuracy gate and the cost comparison: the synthetic
+receipts and the ASCII extraction fixtures are drawn as images and read by
+the stock reader and both ONNX variants, each in a fresh process. It
+reports latency and resident memory per engine, and fails (exit 1) when
+an ONNX variant extracts a different amount than the stock reader from any
+receipt.
+"""
+import os, sys, json, time, logging, argparse
+
+OCR_ENGINE = os.environ.get('OCR_ENGINE', 'torch').strip().lower()  # 'torch' or 'onnx'
+OCR_ONNX_DIR = os.environ.get('OCR_ONNX_DIR', os.path.join('models', 'ocr_onnx'))
+OCR_ONNX_PRECISION = os.environ.get('OCR_ONNX_PRECISION', 'int8')  # 'int8' or 'fp32'
+LANGUAGES = ['en']
+OPSET = 17
+PRECISIONS = ('fp32', 'int8')
+
+log = logging.getLogger(__name__)
+
+
+def settings_tag():
+    """Part of the OCR config version: the engine can change what is read"""
+    return 'torch' if OCR_ENGINE != 'onnx' else f'onnx-{OCR_ONNX_PRECISION}'
+
+
+def model_path(directory, name, precision):
+    return os.path.join(directory, f"{name}.onnx" if precision == 'fp32' else f"{name}.{precision}.onnx")
+
+
+# Export
+
+def export(directory=OCR_ONNX_DIR, quantize=True):
+    """Write detector/recognizer .onnx files (plus int8 copies) and a manifest; returns the manifest"""
+    import torch
+    import easyocr
+    # Export from full-precision weights; easyocr's own torch quantization is not exportable
+    reader = easyocr.Reader(LANGUAGES, gpu=False, quantize=False, verbose=False)
+    os.makedirs(directory, exist_ok=True)
+
+    class Recognizer(torch.nn.Module):
+        # The CTC model ignores its `text` argument; export the image-only call
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, image):
+            return self.model(image, None)
+
+    detector, recognizer = reader.detector.eval(), Recognizer(reader.recognizer).eval()
+    with torch.no_grad():
+        torch.onnx.export(detector, torch.randn(1, 3, 320, 480), model_path(directory, 'detector', 'fp32'),
+                          input_names=['image'], output_names=['y', 'feature'], opset_version=OPSET,
+                          dynamic_axes={'image': {0: 'batch', 2: 'height', 3: 'width'},
+                                        'y': {0: 'batch', 1: 'h', 2: 'w'},
+                                        'feature': {0: 'batch', 2: 'h', 3: 'w'}})
+        torch.onnx.export(recognizer, torch.randn(1, 1, 64, 256), model_path(directory, 'recognizer', 'fp32'),
+                          input_names=['image'], output_names=['preds'], opset_version=OPSET,
+                          dynamic_axes={'image': {0: 'batch', 3: 'width'}, 'preds': {0: 'batch', 1: 'steps'}})
+    files = {name: {'fp32': os.path.basename(model_path(directory, name, 'fp32'))}
+             for name in ('detector', 'recognizer')}
+    if quantize:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        for name in files:
+            quantize_dynamic(model_path(directory, name, 'fp32'), model_path(directory, name, 'int8'),
+                             weight_type=QuantType.QInt8)
+            files[name]['int8'] = os.path.basename(model_path(directory, name, 'int8'))
+    manifest = {"easyocr": getattr(easyocr, '__version__', None), "languages": LANGUAGES,
+                "opset": OPSET, "files": files, "created_at": time.time()}
+    for name, variants in files.items():
+        for precision, filename in variants.items():
+            manifest.setdefault("sizes_mb", {})[f"{name}.{precision}"] = round(
+                os.path.getsize(os.path.join(directory, filename)) / 1e6, 2)
+    with open(os.path.join(directory, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+# Runtime
+
+class _Session:
+    """Stands in for a torch module inside easyocr: numpy in, torch tensors out"""
+
+    def __init__(self, path, threads):
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+        self.input = self.session.get_inputs()[0].name
+
+    def eval(self):
+        return self
+
+    def _run(self, image):
+        import torch
+        outputs = self.session.run(None, {self.input: image.detach().cpu().numpy()})
+        return [torch.from_numpy(out) for out in outputs]
+
+
+class OnnxDetector(_Session):
+    def __call__(self, image):
+        y, feature = self._run(image)
+        return y, feature
+
+
+class OnnxRecognizer(_Session):
+    def __call__(self, image, text=None):
+        return self._run(image)[0]
+
+
+def attach(reader, directory=OCR_ONNX_DIR, precision=OCR_ONNX_PRECISION, threads=1):
+    """Swap `reader`'s detector and recognizer for ONNX Runtime sessions; raises if they can't load"""
+    if precision not in PRECISIONS:
+        raise ValueError(f"unknown OCR_ONNX_PRECISION {precision!r}")
+    with open(os.path.join(directory, 'manifest.json')) as f:
+        manifest = json.load(f)
+    import easyocr
+    version = getattr(easyocr, '__version__', None)
+    if manifest.get('easyocr') != version:
+        log.warning("ONNX OCR models were exported with easyocr %s, running %s", manifest.get('easyocr'), version)
+    detector = OnnxDetector(model_path(directory, 'detector', precision), threads)
+    recognizer = OnnxRecognizer(model_path(directory, 'recognizer', precision), threads)
+    reader.detector, reader.recognizer = detector, recognizer
+    log.info("OCR engine onnx precision=%s dir=%s", precision, directory)
+    return reader
+
+
+def build_reader(engine, precision=OCR_ONNX_PRECISION, directory=OCR_ONNX_DIR, threads=1):
+    import easyocr
+    reader = easyocr.Reader(LANGUAGES, gpu=False, verbose=False)
+    if engine == 'onnx':
+        attach(reader, directory, precision, threads)
+    return reader
+
+
+# Accuracy / cost check
+
+def check_receipts():
+    """(image, expected amount) for the synthetic receipts and the drawable extraction fixtures"""
+    import extraction
+    from bench import SYNTHETIC_RECEIPTS, draw_receipt
+    from bench_extraction import load_fixtures
+    receipts = [(draw_receipt(lines), expected) for lines, expected in SYNTHETIC_RECEIPTS]
+    for text, _ in load_fixtures():
+        lines = text.split('\n')
+        # Hershey fonts are ASCII-only and the canvas fits ~30 characters a line
+        if text.isascii() and max(len(line) for line in lines) <= 30:
+            ranked = extraction.extract(text)
+            receipts.append((draw_receipt(lines), ranked[0][0] if ranked else None))
+    return receipts
+
+
+def _rss_mb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    import resource
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def evaluate(reader, receipts, repeat=3):
+    """Top amount and readtext latency per receipt for one reader"""
+    import cv2
+    import ocr, ocr_layout, ocr_preprocess
+    amounts, samples = [], []
+    for img, _ in receipts:
+        img, _ = ocr_preprocess.prepare(img)
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        results = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            results = reader.readtext(gray, detail=1, paragraph=False)
+            samples.append(time.perf_counter() - started)
+        text, _ = ocr_layout.document(ocr_layout.from_readtext(results))
+        found = ocr.extract_amounts_from_text(text)
+        amounts.append(found[0] if found else None)
+    samples.sort()
+    return {
+        "amounts": amounts,
+        "correct": sum(a == expected for a, (_, expected) in zip(amounts, receipts)),
+        "p50_ms": round(samples[len(samples) // 2] * 1000, 2) if samples else None,
+        "mean_ms": round(sum(samples) / len(samples) * 1000, 2) if samples else None,
+    }
+
+
+def _evaluate_engine(engine, precision, directory, repeat):
+    # Runs in a fresh process so the memory numbers belong to this engine alone
+    before = _rss_mb()
+    started = time.perf_counter()
+    reader = build_reader(engine, precision, directory)
+    load_seconds = time.perf_counter() - started
+    loaded = _rss_mb()
+    result = evaluate(reader, check_receipts(), repeat)
+    result.update(load_seconds=round(load_seconds, 2), rss_mb_loaded=loaded,
+                  rss_mb_models=round(loaded - before, 1), rss_mb_after=_rss_mb())
+    return result
+
+
+def regressions(stock, candidate):
+    """Receipt indexes where the candidate's top amount differs from the stock reader's"""
+    return [i for i, (a, b) in enumerate(zip(stock['amounts'], candidate['amounts'])) if a != b]
+
+
+def check(directory=OCR_ONNX_DIR, repeat=3):
+    import multiprocessing
+    context = multiprocessing.get_context('spawn')
+    engines = {'torch': ('torch', None)}
+    for precision in PRECISIONS:
+        if os.path.exists(model_path(directory, 'detector', precision)):
+            engines[f'onnx-{precision}'] = ('onnx', precision)
+    report = {"receipts": len(check_receipts()), "engines": {}}
+    for name, (engine, precision) in engines.items():
+        with context.Pool(1) as pool:
+            report["engines"][name] = pool.apply(_evaluate_engine, (engine, precision, directory, repeat))
+    stock = report["engines"]['torch']
+    report["regressions"] = {name: regressions(stock, result)
+                             for name, result in report["engines"].items() if name != 'torch'}
+    report["passed"] = len(engines) > 1 and not any(report["regressions"].values())
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export EasyOCR to ONNX / compare it with the stock reader")
+    parser.add_argument('command', choices=['export', 'check'])
+    parser.add_argument('--dir', default=OCR_ONNX_DIR)
+    parser.add_argument('--no-quantize', action='store_true', help='export fp32 models only')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--out', help='also write the check report to this JSON file')
+    args = parser.parse_args(argv)
+    if args.command == 'export':
+        print(json.dumps(export(args.dir, quantize=not args.no_quantize), indent=2))
+        return 0
+    report = check(args.dir, args.repeat)
+    print(json.dumps(report, indent=2))
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+    if not report["passed"]:
+        print("ONNX check failed: " + ("no exported models found" if len(report["engines"]) == 1
+                                       else f"amount regressions {report['regressions']}"))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
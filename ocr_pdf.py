@@ -0,0 +1,186 @@
+"""
+PDF receipts and statements.
+
+Digital PDFs usually carry a text layer; if they do it is used as-is and no
+OCR runs at all. Scanned PDFs are rasterised page by page at PDF_DPI and
+each page goes through the normal image pipeline (ocr.try_ocr_detailed).
+PyMuPDF holds the GIL while rendering and a document must not be shared
+between threads, so pages are rendered one at a time on the calling thread
+while earlier pages are OCR'd on a small thread pool; at most
+PDF_PAGE_WORKERS + 1 rendered pages are held in memory. A page whose
+render would exceed PDF_MAX_PIXELS (a poster-sized page) is rendered at a
+lower DPI instead. PDF_MAX_PAGES and PDF_TIME_LIMIT stop a long statement
+from tying up an OCR worker.
+
+PyMuPDF is optional: without it PDFs fall back to manual entry as before.
+"""
+import os, time, logging, threading
+from concurrent.futures import ThreadPoolExecutor
+import metrics
+
+log = logging.getLogger(__name__)
+
+PDF_DPI = int(os.environ.get('PDF_DPI', 200))
+PDF_MAX_PIXELS = int(os.environ.get('PDF_MAX_PIXELS', 16_000_000))  # per rendered page (A4 at 200 DPI is ~3.9M)
+PDF_MAX_PAGES = int(os.environ.get('PDF_MAX_PAGES', 10))
+PDF_TIME_LIMIT = float(os.environ.get('PDF_TIME_LIMIT', 60))  # seconds per document
+PDF_PAGE_WORKERS = max(1, int(os.environ.get('PDF_PAGE_WORKERS', 2)))
+PDF_MIN_TEXT_CHARS = int(os.environ.get('PDF_MIN_TEXT_CHARS', 20))  # below this the text layer is ignored
+
+_page_pool = None
+_pool_lock = threading.Lock()
+
+
+def _pymupdf():
+    try:
+        import pymupdf
+    except ImportError:
+        import fitz as pymupdf  # PyMuPDF < 1.24
+    return pymupdf
+
+
+def settings_tag():
+    return f"pdf{PDF_DPI}-{PDF_MAX_PAGES}-{PDF_MAX_PIXELS}"
+
+
+def is_pdf(source):
+    """True for PDF bytes or a path to a PDF (checked by magic number)"""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return bytes(source[:5]) == b'%PDF-'
+    if not isinstance(source, str):
+        return False
+    try:
+        with open(source, 'rb') as f:
+            return f.read(5) == b'%PDF-'
+    except OSError:
+        return False
+
+
+def _open(source):
+    pymupdf = _pymupdf()
+    if isinstance(source, str):
+        return pymupdf.open(source)
+    return pymupdf.open(stream=bytes(source), filetype='pdf')
+
+
+def _get_page_pool():
+    global _page_pool
+    with _pool_lock:
+        if _page_pool is None:
+            _page_pool = ThreadPoolExecutor(max_workers=PDF_PAGE_WORKERS, thread_name_prefix='pdf-page')
+    return _page_pool
+
+
+def text_layer(doc, max_pages):
+    """
+    Text of the first max_pages pages, or None if there is (almost) none.
+    Whitespace is collapsed within each line but the line breaks stay, as
+    the amount extraction looks for totals line by line.
+    """
+    lines = (' '.join(line.split()) for i in range(min(max_pages, doc.page_count))
+             for line in doc[i].get_text().splitlines())
+    text = '\n'.join(line for line in lines if line)
+    return text if len(text) >= PDF_MIN_TEXT_CHARS else None
+
+
+def page_dpi(page, dpi=None, max_pixels=None):
+    """dpi (PDF_DPI by default), lowered so the rendered page stays within max_pixels"""
+    dpi = dpi or PDF_DPI
+    max_pixels = PDF_MAX_PIXELS if max_pixels is None else max_pixels
+    area = page.rect.width * page.rect.height / 72 ** 2  # square inches
+    if area > 0 and area * dpi ** 2 > max_pixels:
+        dpi = max(1, int((max_pixels / area) ** 0.5))
+    return dpi
+
+
+def render_page(doc, index, dpi=None):
+    """Page `index` as a BGR uint8 array, at most PDF_MAX_PIXELS pixels"""
+    import numpy as np
+    page = doc[index]
+    dpi = page_dpi(page, dpi)
+    log.debug("rendering PDF page=%d dpi=%d", index + 1, dpi)
+    pix = page.get_pixmap(dpi=dpi, alpha=False)
+    rgb = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
+    return np.ascontiguousarray(rgb[:, :, 2::-1]) if pix.n >= 3 else np.repeat(rgb, 3, axis=2)
+
+
+def ocr_pdf(source, ocr_page, max_pages=None, time_limit=None):
+    """
+    Result dict shaped like ocr.try_ocr_detailed()'s for a PDF. ocr_page(img)
+    OCRs one rendered page and returns that same dict. A "pdf" key
+    describes what was done (pages, text_layer, truncated, seconds).
+    """
+    max_pages = PDF_MAX_PAGES if max_pages is None else max_pages
+    time_limit = PDF_TIME_LIMIT if time_limit is None else time_limit
+    started = time.perf_counter()
+    details = {"text": "", "strategies_run": [], "winner": None, "preprocess": None,
+               "tiers_run": [], "tier": None, "tier_seconds": {},
+               "pdf": {"available": True, "pages": 0, "pages_processed": 0, "text_layer": False,
+                       "truncated": False, "seconds": 0.0}}
+    info = details['pdf']
+    in_flight = []
+    try:
+        doc = _open(source)
+    except ImportError:
+        log.warning("PyMuPDF not installed - PDF receipts need manual entry")
+        info['available'] = False
+        return details
+    except Exception as e:
+        log.error("could not open PDF: %s", e)
+        info['available'] = False
+        return details
+
+    try:
+        info['pages'] = doc.page_count
+        limit = min(max_pages, doc.page_count)
+        info['truncated'] = doc.page_count > limit
+
+        text = text_layer(doc, limit)
+        if text is not None:
+            log.info("PDF text layer found chars=%d - skipping OCR", len(text))
+            details['text'] = text
+            info.update(text_layer=True, pages_processed=limit, seconds=round(time.perf_counter() - started, 3))
+            return details
+
+        # Render one page at a time; OCR runs on the pool meanwhile
+        pool = _get_page_pool()
+        page_results = []
+        deadline = started + time_limit
+        for index in range(limit):
+            if time.perf_counter() > deadline:
+                log.warning("PDF time limit reached limit_seconds=%s pages=%d", time_limit, index)
+                info['truncated'] = True
+                break
+            if len(in_flight) >= PDF_PAGE_WORKERS:
+                page_results.append(in_flight.pop(0).result())
+            with metrics.span('pdf.render'):
+                page = render_page(doc, index)
+            in_flight.append(pool.submit(ocr_page, page))
+        page_results.extend(f.result() for f in in_flight)
+    except Exception as e:
+        log.exception("PDF processing failed: %s", e)
+        for future in in_flight:
+            future.cancel()  # pages not yet started; running ones finish on their own
+        page_results = []
+    finally:
+        doc.close()
+
+    texts, page_tiers = [], []
+    for result in page_results:
+        if result['text']:
+            texts.append(result['text'])
+        details['strategies_run'].extend(result['strategies_run'])
+        details['winner'] = details['winner'] or result['winner']
+        for tier in result.get('tiers_run', []):
+            if tier not in details['tiers_run']:
+                details['tiers_run'].append(tier)
+            details['tier_seconds'][tier] = round(details['tier_seconds'].get(tier, 0.0)
+                                                  + result['tier_seconds'].get(tier, 0.0), 4)
+        page_tiers.append(result.get('tier'))
+    if page_tiers and None not in page_tiers:
+        # The document's tier is the most expensive one any page needed
+        details['tier'] = max(page_tiers, key=details['tiers_run'].index)
+    details['text'] = '\n'.join(texts)
+    info['pages_processed'] = len(page_results)
+    info['seconds'] = round(time.perf_counter() - started, 3)
+    return details
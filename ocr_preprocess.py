@@ -0,0 +1,204 @@
+"""
+Resolution normalisation and region-of-interest cropping before OCR.
+
+Phone photos of receipts are often 12+ megapixels, most of them table top,
+and EasyOCR's detector cost grows with pixel count. prepare() shrinks the
+image so its text is about OCR_TARGET_TEXT_HEIGHT pixels tall, crops to the
+receipt (the largest bright region), and - with OCR_KEYWORD_ROI=1 - runs one
+cheap low-resolution pass to find TOTAL / PAID TO / DEBITED and keeps only
+the bands around those hits. It returns the smaller image plus a report of
+the pixels processed.
+"""
+import os, re, time, threading
+
+OCR_TARGET_TEXT_HEIGHT = int(os.environ.get('OCR_TARGET_TEXT_HEIGHT', 28))  # px
+OCR_MAX_SIDE = int(os.environ.get('OCR_MAX_SIDE', 2560))  # EasyOCR's own canvas limit
+OCR_CROP_DOCUMENT = os.environ.get('OCR_CROP_DOCUMENT', '1') != '0'
+OCR_KEYWORD_ROI = os.environ.get('OCR_KEYWORD_ROI', '0') != '0'
+OCR_ROI_PASS_SIDE = int(os.environ.get('OCR_ROI_PASS_SIDE', 960))  # long side of the cheap pass
+
+ANALYSIS_SIDE = 1000  # images are analysed at this size, whatever their resolution
+MIN_SCALE = 0.2
+ROI_KEYWORDS = re.compile(r'TOTAL|PAID|PAYABLE|DEBITED|CREDITED|AMOUNT|BALANCE|DUE|₹|\bRS\b|INR', re.IGNORECASE)
+
+
+def settings_tag():
+    """Part of the OCR config version: preprocessing changes the OCR output"""
+    return (f"h{OCR_TARGET_TEXT_HEIGHT}-m{OCR_MAX_SIDE}-c{int(OCR_CROP_DOCUMENT)}"
+            f"-k{int(OCR_KEYWORD_ROI)}")
+
+
+def _analysis_copy(gray):
+    import cv2
+    h, w = gray.shape[:2]
+    factor = min(1.0, ANALYSIS_SIDE / max(h, w))
+    if factor < 1.0:
+        gray = cv2.resize(gray, (max(1, int(w * factor)), max(1, int(h * factor))), interpolation=cv2.INTER_AREA)
+    return gray, factor
+
+
+def estimate_text_height(gray):
+    """
+    Median height in pixels of character-sized blobs, or None when the image
+    has too few of them to tell.
+    """
+    import cv2
+    import numpy as np
+    small, factor = _analysis_copy(gray)
+    binary = cv2.adaptiveThreshold(small, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV, 31, 15)
+    count, _, stats, _ = cv2.connectedComponentsWithStats(binary, connectivity=8)
+    if count <= 1:
+        return None
+    widths, heights, areas = stats[1:, cv2.CC_STAT_WIDTH], stats[1:, cv2.CC_STAT_HEIGHT], stats[1:, cv2.CC_STAT_AREA]
+    # Glyph-like: a few pixels tall, not a long rule or a big blob, partly filled
+    glyphs = (heights >= 4) & (heights <= small.shape[0] / 8) & (widths <= heights * 3) & (areas >= 0.15 * widths * heights)
+    if glyphs.sum() < 10:
+        return None
+    return float(np.median(heights[glyphs])) / factor
+
+
+def find_document(gray):
+    """
+    (x, y, w, h) of the receipt/document - the largest bright region - or
+    None when it covers nearly the whole image or can't be found.
+    """
+    import cv2
+    small, factor = _analysis_copy(gray)
+    blurred = cv2.GaussianBlur(small, (7, 7), 0)
+    _, mask = cv2.threshold(blurred, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    # Close the gaps printed text leaves in the paper
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, cv2.getStructuringElement(cv2.MORPH_RECT, (15, 15)))
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if not contours:
+        return None
+    x, y, w, h = cv2.boundingRect(max(contours, key=cv2.contourArea))
+    area = small.shape[0] * small.shape[1]
+    if w * h < 0.15 * area or w * h > 0.9 * area:
+        return None
+    pad = 0.02 * max(small.shape[:2])
+    x0, y0 = max(0, int((x - pad) / factor)), max(0, int((y - pad) / factor))
+    x1 = min(gray.shape[1], int((x + w + pad) / factor))
+    y1 = min(gray.shape[0], int((y + h + pad) / factor))
+    return x0, y0, x1 - x0, y1 - y0
+
+
+def keyword_bands(detections, height, scale=1.0):
+    """
+    Vertical (top, bottom) bands around readtext(detail=1) boxes whose text
+    is an amount keyword, in the coordinates of an image `scale` times the
+    size of the one that was read. The band reaches one line above the
+    keyword and three below, where the amount usually sits.
+    """
+    bands = []
+    for box, text, _ in detections:
+        if not ROI_KEYWORDS.search(text):
+            continue
+        ys = [p[1] / scale for p in box]
+        top, bottom = min(ys), max(ys)
+        line = max(1.0, bottom - top)
+        bands.append((max(0, int(top - line)), min(height, int(bottom + 3 * line))))
+    merged = []
+    for top, bottom in sorted(bands):
+        if merged and top <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], bottom))
+        else:
+            merged.append((top, bottom))
+    return merged
+
+
+def prepare(img, readtext=None, target_text_height=None, crop=None, keyword_roi=None):
+    """
+    Return (image, report) where image is the resized/cropped copy to run
+    the OCR passes on. `readtext` (a reader.readtext-like callable) is only
+    needed for the keyword pass. The report holds the original and processed
+    pixel counts, the scale, the crop box and the preprocessing time.
+    """
+    import cv2
+    import numpy as np
+    target = OCR_TARGET_TEXT_HEIGHT if target_text_height is None else target_text_height
+    crop = OCR_CROP_DOCUMENT if crop is None else crop
+    keyword_roi = OCR_KEYWORD_ROI if keyword_roi is None else keyword_roi
+    started = time.perf_counter()
+    original_pixels = img.shape[0] * img.shape[1]
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+    report = {"original_shape": list(img.shape[:2]), "crop": None, "keyword_bands": None}
+
+    if crop:
+        box = find_document(gray)
+        if box is not None:
+            x, y, w, h = box
+            img = np.ascontiguousarray(img[y:y + h, x:x + w])
+            gray = np.ascontiguousarray(gray[y:y + h, x:x + w])
+            report["crop"] = list(box)
+
+    # Shrink (never enlarge) so text is ~target px tall and the long side fits OCR_MAX_SIDE
+    scale = 1.0
+    text_height = estimate_text_height(gray)
+    if text_height is not None and text_height > target:
+        scale = target / text_height
+    scale = max(MIN_SCALE, min(scale, OCR_MAX_SIDE / max(img.shape[:2])))
+    if scale < 1.0:
+        size = (max(1, int(img.shape[1] * scale)), max(1, int(img.shape[0] * scale)))
+        img = cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+        gray = cv2.resize(gray, size, interpolation=cv2.INTER_AREA)
+    report["text_height"] = round(text_height, 1) if text_height is not None else None
+    report["scale"] = round(min(scale, 1.0), 3)
+
+    if keyword_roi and readtext is not None:
+        pass_scale = min(1.0, OCR_ROI_PASS_SIDE / max(gray.shape[:2]))
+        small = gray if pass_scale == 1.0 else cv2.resize(
+            gray, (max(1, int(gray.shape[1] * pass_scale)), max(1, int(gray.shape[0] * pass_scale))),
+            interpolation=cv2.INTER_AREA)
+        bands = keyword_bands(readtext(small, detail=1, paragraph=False), gray.shape[0], pass_scale)
+        if bands:
+            img = np.concatenate([img[top:bottom] for top, bottom in bands], axis=0)
+            report["keyword_bands"] = [list(b) for b in bands]
+
+    processed_pixels = img.shape[0] * img.shape[1]
+    report.update({
+        "shape": list(img.shape[:2]),
+        "original_pixels": original_pixels,
+        "pixels_processed": processed_pixels,
+        "pixel_ratio": round(processed_pixels / original_pixels, 4) if original_pixels else 1.0,
+        "seconds": round(time.perf_counter() - started, 4),
+    })
+    return img, report
+
+
+def estimate_seconds_saved(report, ocr_seconds):
+    """
+    OCR time avoided, assuming pass cost scales with pixels (the detector
+    dominates) minus the time preprocessing itself took.
+    """
+    ratio = report.get("pixel_ratio") or 1.0
+    return round(ocr_seconds * (1.0 / ratio - 1.0) - report.get("seconds", 0.0), 3)
+
+
+class PreprocessTotals:
+    """Running pixel / time-saved totals for /ocr/stats"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals = {"images": 0, "original_pixels": 0, "pixels_processed": 0,
+                        "seconds": 0.0, "estimated_seconds_saved": 0.0}
+
+    def record(self, report):
+        if not report:
+            return
+        with self._lock:
+            self._totals["images"] += 1
+            self._totals["original_pixels"] += report.get("original_pixels", 0)
+            self._totals["pixels_processed"] += report.get("pixels_processed", 0)
+            self._totals["seconds"] += report.get("seconds", 0.0)
+            self._totals["estimated_seconds_saved"] += report.get("estimated_seconds_saved", 0.0)
+
+    def snapshot(self):
+        with self._lock:
+            totals = dict(self._totals)
+        totals["seconds"] = round(totals["seconds"], 3)
+        totals["estimated_seconds_saved"] = round(totals["estimated_seconds_saved"], 3)
+        totals["pixel_ratio"] = (round(totals["pixels_processed"] / totals["original_pixels"], 4)
+                                 if totals["original_pixels"] else None)
+        return totals
+
+
+totals = PreprocessTotals()
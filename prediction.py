@@ -0,0 +1,179 @@
+"""
+Expense / distress predictions from receipt amounts.
+
+predict_from_amounts() scores a whole array of amounts with one call to each
+model; predict_from_amount() is the single-amount wrapper used by the routes.
+
+Models come from the versioned registry (model_registry.py) and are swapped
+without a restart when a new version is activated; each prediction carries
+the model_version that produced it: the registry version, 'heuristic'
+without models, or '<version>+heuristic' when one of the two models was
+missing or failed and its part fell back to the heuristic.
+
+With PREDICT_EXECUTOR=process (the default) the models, and with them
+sklearn and numpy, live in one dedicated worker process: the web tier only
+sends it amounts, so it never imports the ML stack. 'inline' predicts in
+the calling process.
+
+Run `python prediction.py rescore` after retraining to re-score every stored
+entry in one batch.
+"""
+import os, sys, logging, threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import metrics
+from model_registry import ModelRegistry
+
+ASSUMED_INCOME = 100000.0  # placeholder annual income
+HEURISTIC_VERSION = 'heuristic'  # model_version of predictions made without models
+
+PREDICT_EXECUTOR = os.environ.get('PREDICT_EXECUTOR', 'process')  # 'process' or 'inline'
+PREDICT_TIMEOUT = float(os.environ.get('PREDICT_TIMEOUT', 30))  # seconds
+
+log = logging.getLogger(__name__)
+
+# Versioned models, hot-reloaded when a new version is activated
+registry = ModelRegistry()
+
+# The prediction worker: created on first use, so importing this module forks nothing
+_executor = None
+_executor_lock = threading.Lock()
+_in_worker = False
+
+def _init_worker():
+    global _in_worker
+    _in_worker = True
+
+def _use_worker():
+    return PREDICT_EXECUTOR == 'process' and not _in_worker
+
+def _call(fn, args):
+    # Runs in the worker; its stage timings travel back for the parent's /metrics
+    return fn(*args), metrics.drain()
+
+def _in_prediction_worker(fn, *args):
+    """fn(*args) in the prediction worker, restarting it once if it has died"""
+    global _executor
+    for attempt in (1, 2):
+        with _executor_lock:
+            if _executor is None:
+                _executor = ProcessPoolExecutor(max_workers=1, initializer=_init_worker)
+            executor = _executor
+        try:
+            result, drained = executor.submit(_call, fn, args).result(timeout=PREDICT_TIMEOUT)
+        except BrokenProcessPool:
+            log.error("prediction worker died - restarting it")
+            with _executor_lock:
+                if _executor is executor:
+                    _executor = None
+            if attempt == 2:
+                raise
+            continue
+        metrics.merge(drained)
+        return result
+
+def warm_up():
+    """Load the models and run one prediction so sklearn is fully initialised"""
+    if _use_worker():
+        return dict(_in_prediction_worker(warm_up), executor='process')
+    models = registry.reload()
+    predict_from_amounts([100.0])
+    return {"available": models.available, "version": models.version, "pid": os.getpid(),
+            "regression": models.regression is not None, "classification": models.classification is not None}
+
+def model_status():
+    """registry.status() of the process that serves predictions"""
+    if _use_worker():
+        return _in_prediction_worker(model_status)
+    return registry.status()
+
+def reload_models():
+    """Check for a newly activated model version now; returns model_status()"""
+    if _use_worker():
+        return _in_prediction_worker(reload_models)
+    registry.reload()
+    return registry.status()
+
+def predict_from_amount(amount):
+    return predict_from_amounts([amount])[0]
+
+def predict_from_amounts(amounts, models=None):
+    """Predictions for each amount, same fields as predict_from_amount()"""
+    if models is None and _use_worker():
+        return _in_prediction_worker(predict_from_amounts, [float(a) for a in amounts])
+    with metrics.span('predict'):
+        return _predict(amounts, registry.current() if models is None else models)
+
+def _predict(amounts, models):
+    import numpy as np
+    amounts = np.asarray(amounts, dtype=float).reshape(-1)
+    if amounts.size == 0:
+        return []
+    reg_model, clf_model = models.regression, models.classification
+    used_reg = used_clf = False
+    # Simple fallback prediction rules if models missing:
+    # assume daily amount * 365 gives yearly expense
+    predicted_annual = amounts * 365
+    if reg_model is not None:
+        try:
+            predicted_annual = np.asarray(reg_model.predict(amounts.reshape(-1, 1)), dtype=float).reshape(-1)
+            used_reg = True
+        except Exception:
+            predicted_annual = amounts * 365
+    # simple distress probability heuristic: if predicted annual expense > threshold
+    distress_prob = np.minimum(1.0, predicted_annual / 100000.0)
+    if clf_model is not None:
+        try:
+            features = np.column_stack([amounts, predicted_annual])
+            distress_prob = np.asarray(clf_model.predict_proba(features), dtype=float)[:, 1]
+            used_clf = True
+        except Exception:
+            distress_prob = np.minimum(1.0, predicted_annual / 100000.0)
+    version = _version_used(models.version, used_reg, used_clf)
+    # Simple savings estimate: assume fixed income (can be extended)
+    predicted_savings = np.maximum(0.0, ASSUMED_INCOME - predicted_annual)
+    return [
+        {
+            "predicted_annual_expense": round(float(annual),2),
+            "predicted_annual_savings": round(float(savings),2),
+            "distress_probability": round(float(prob),3),
+            "advice": generate_advice(annual, savings, prob),
+            "model_version": version
+        }
+        for annual, savings, prob in zip(predicted_annual, predicted_savings, distress_prob)
+    ]
+
+def _version_used(version, used_reg, used_clf):
+    """model_version for predictions that used the regression / classification model or not"""
+    if not version or not (used_reg or used_clf):
+        return HEURISTIC_VERSION
+    return version if used_reg and used_clf else f"{version}+{HEURISTIC_VERSION}"
+
+def generate_advice(predicted_annual, predicted_savings, distress_prob):
+    tips = []
+    if distress_prob > 0.6:
+        tips.append("High risk detected: consider immediately reviewing recurring subscriptions and non-essential spending.")
+    if predicted_savings < 0:
+        tips.append("Projected savings negative: prioritize reducing expenses or increasing income.")
+    if predicted_annual > 50000:
+        tips.append("Your projected annual expense seems high; try cutting discretionary spending by 10% to start.")
+    if not tips:
+        tips.append("Your finances look stable for now. Maintain an emergency fund of 3-6 months of expenses.")
+    return " ".join(tips)
+
+def rescore_history(storage):
+    """Recompute the stored predictions (and model_version) of every entry that has an amount"""
+    scored = [(e['id'], e['amount']) for e in storage.iter_entries() if e.get('amount') is not None]
+    if not scored:
+        return 0
+    ids, amounts = zip(*scored)
+    # One version for the whole batch, even if another is activated meanwhile
+    preds = predict_from_amounts(amounts, registry.reload())
+    return storage.update_entries(list(zip(ids, preds)))
+
+if __name__ == '__main__':
+    if sys.argv[1:] != ['rescore']:
+        print("usage: python prediction.py rescore")
+        sys.exit(1)
+    from storage import Storage
+    print(f"Re-scored {rescore_history(Storage())} entries")
@@ -0,0 +1,82 @@
+"""
+Start-up readiness tracking for /healthz and /readyz.
+
+Each heavy component (database, prediction models, OCR reader) is loaded by
+Readiness.run(), which records its state and load time. The process counts
+as ready once every component has finished loading - "unavailable" (e.g.
+EasyOCR not installed, no trained models) still counts, because the app
+falls back to manual entry / heuristic predictions in that case. So does
+"deferred", used when warm-up is switched off with APP_WARMUP=0, and so
+does "failed", for the same reason - except for components the process
+can't serve without (`required`, e.g. the database), which keep it unready
+until a retry succeeds.
+"""
+import time, logging, threading
+
+PENDING, LOADING, READY, UNAVAILABLE, FAILED = 'pending', 'loading', 'ready', 'unavailable', 'failed'
+DEFERRED = 'deferred'  # warm-up disabled; loaded on first use instead
+SETTLED = (READY, UNAVAILABLE, DEFERRED, FAILED)
+
+log = logging.getLogger(__name__)
+
+
+class Readiness:
+    def __init__(self, components, required=()):
+        self.started_at = time.time()
+        self.required = set(required)
+        self._lock = threading.Lock()
+        self._components = {name: {"state": PENDING, "seconds": None, "error": None, "details": None}
+                             for name in components}
+
+    def run(self, name, load):
+        """
+        Call load() and record the outcome for component `name`. load() may
+        return a dict of details; {"available": False} marks the component
+        unavailable rather than ready.
+        """
+        self._update(name, state=LOADING)
+        started = time.time()
+        try:
+            details = load() or {}
+            state = UNAVAILABLE if details.get('available') is False else READY
+            self._update(name, state=state, details=details, seconds=round(time.time() - started, 3))
+        except Exception as e:
+            log.exception("loading %s failed", name)
+            self._update(name, state=FAILED, error=str(e), seconds=round(time.time() - started, 3))
+
+    def defer(self, name):
+        self._update(name, state=DEFERRED)
+
+    def reset(self, name):
+        """Back to pending, e.g. in a forked worker that loads the component again"""
+        self._update(name, state=PENDING, seconds=None, error=None, details=None)
+
+    def _update(self, name, **fields):
+        with self._lock:
+            self._components[name].update(fields)
+
+    def _ready(self, components):
+        return all(c['state'] in SETTLED and not (c['state'] == FAILED and name in self.required)
+                   for name, c in components.items())
+
+    def is_ready(self):
+        with self._lock:
+            return self._ready(self._components)
+
+    def snapshot(self):
+        with self._lock:
+            components = {name: dict(c) for name, c in self._components.items()}
+        return {
+            "ready": self._ready(components),
+            "uptime_seconds": round(time.time() - self.started_at, 3),
+            "components": components,
+        }
+
+    def start_background(self, steps):
+        """Run [(name, load), ...] one after another on a daemon thread"""
+        def warm_up():
+            for name, load in steps:
+                self.run(name, load)
+        thread = threading.Thread(target=warm_up, name='warm-up', daemon=True)
+        thread.start()
+        return thread
@@ -0,0 +1,293 @@
+"""
+Production server: pre-forked workers sharing the preloaded models.
+
+    python serve.py [--bind 0.0.0.0:5000] [--workers 4] [--timeout 60] [--graceful-timeout 30]
+
+The master imports the app, loads the prediction models and the EasyOCR
+weights once, then forks SERVE_WORKERS workers that all accept on one
+listening socket. Forked memory is shared copy-on-write, so another worker
+costs its own private pages rather than another copy of the models (the
+registry's arrays are memory-mapped on top of that). Only weights are
+loaded before the fork; the first inference runs in the workers. Each
+worker predicts inline, without a prediction process of its own, and
+starts its OCR job pool after the fork, so the pool's processes inherit
+the loaded reader too.
+
+A worker serves one request at a time and beats a heartbeat between
+requests, and while a request body is being read (a large /upload/bulk can
+take longer than SERVE_TIMEOUT to arrive). One that stays silent longer than
+SERVE_TIMEOUT (a stuck request) is killed and replaced. SIGHUP restarts the
+workers gracefully: the master picks up a newly activated model version,
+forks fresh workers and lets the old ones finish their current request,
+queued OCR jobs and running bulk imports, for at most
+SERVE_GRACEFUL_TIMEOUT; bulk imports still running then are marked failed.
+SIGTERM / SIGINT stop the same way. Code changes need a full restart.
+
+Job polls (/jobs/<id>, /upload/bulk/<id>) can land on any worker, so job
+status is shared through JOB_STATE_DIR (a temporary directory, removed when
+the master exits, unless set; see job_store.py). The OCR cache directory
+and the strategy stats files are shared as well and safe to write from
+several workers. wsgi.py offers the same preloaded app to other servers.
+"""
+import os, sys, time, signal, socket, atexit, shutil, logging, argparse, tempfile, multiprocessing
+
+SERVE_BIND = os.environ.get('SERVE_BIND', '0.0.0.0:5000')
+SERVE_WORKERS = int(os.environ.get('SERVE_WORKERS', os.cpu_count() or 1))
+SERVE_TIMEOUT = float(os.environ.get('SERVE_TIMEOUT', 60))  # seconds one request may take
+SERVE_GRACEFUL_TIMEOUT = float(os.environ.get('SERVE_GRACEFUL_TIMEOUT', 30))  # to finish in-flight work
+SERVE_BACKLOG = 128
+HEARTBEAT_INTERVAL = 1.0  # seconds between heartbeats of an idle worker
+
+log = logging.getLogger('serve')
+
+_app_module = None
+_master_pid = None
+_warmup = True
+
+
+def preload():
+    """
+    Import the app and load what the workers should share; returns the WSGI
+    app. Call it in the process that forks the workers, before forking.
+    """
+    global _app_module, _master_pid, _warmup
+    if _app_module is not None:
+        return _app_module.app
+    _warmup = os.environ.get('APP_WARMUP', '1') != '0'
+    if 'JOB_STATE_DIR' not in os.environ:
+        job_dir = os.environ['JOB_STATE_DIR'] = tempfile.mkdtemp(prefix='finance-jobs-')
+        atexit.register(_remove_job_dir, job_dir, os.getpid())
+    # The app's own warm-up starts worker pools; those can't be carried across a fork
+    os.environ['APP_WARMUP'] = '0'
+    import app as app_module
+    import ocr, prediction
+    prediction.PREDICT_EXECUTOR = 'inline'
+    if _warmup:
+        app_module.readiness.run('models', prediction.warm_up)
+        started = time.time()
+        ocr.get_ocr_reader()
+        log.info("preloaded OCR reader seconds=%.2f", time.time() - started)
+    if app_module.storage is not None:  # None if the database failed to open; workers retry
+        app_module.storage.engine.dispose()  # no pooled SQLite connections across the fork
+    _app_module, _master_pid = app_module, os.getpid()
+    os.register_at_fork(after_in_child=_after_fork)
+    return app_module.app
+
+
+def _remove_job_dir(path, pid):
+    # atexit handlers are inherited by forked workers; only the process that created the directory removes it
+    if os.getpid() == pid:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def _after_fork():
+    # Runs after every fork in a descendant of the master; only its direct children are workers
+    if os.getppid() != _master_pid:
+        return
+    import metrics
+    metrics.drain()  # the master's load timings stay out of every worker's /metrics
+    if _app_module.storage is not None:
+        _app_module.storage.engine.dispose(close=False)
+    if _warmup:
+        _app_module.readiness.reset('ocr')
+        _app_module.readiness.start_background([('ocr', _app_module.ocr_jobs.warm_up)])
+
+
+class _BeatingInput:
+    """Request body stream that beats the heartbeat on every read"""
+
+    def __init__(self, stream, beat):
+        self._stream = stream
+        self._beat = beat
+
+    def read(self, *args):
+        self._beat()
+        return self._stream.read(*args)
+
+    def readline(self, *args):
+        self._beat()
+        return self._stream.readline(*args)
+
+    def readinto(self, buffer):
+        self._beat()
+        return self._stream.readinto(buffer)
+
+    def __iter__(self):
+        return iter(self.readline, b'')
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+def _serve(listener, slot, heartbeats, timeout, graceful_timeout=SERVE_GRACEFUL_TIMEOUT):
+    """Worker main loop: one request at a time until SIGTERM"""
+    from werkzeug.serving import WSGIRequestHandler, make_server
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.append(signum))
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl-C reaches the whole group; the master decides
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    # Socket reads and writes time out as well, so a slow client can't hold the worker
+    handler = type('RequestHandler', (WSGIRequestHandler,), {'timeout': timeout})
+    host, port = listener.getsockname()[:2]
+
+    def beat():
+        heartbeats[slot] = time.monotonic()
+
+    def application(environ, start_response):
+        # A body still arriving is progress, not a stuck request; the app can beat too
+        environ['wsgi.input'] = _BeatingInput(environ['wsgi.input'], beat)
+        environ['serve.heartbeat'] = beat
+        return _app_module.app(environ, start_response)
+
+    server = make_server(host, port, application, request_handler=handler, fd=listener.fileno())
+    # The server's dup of the listener has no Python-level timeout, so handle_request() waits up
+    # to server.timeout; a worker that loses the accept() race gets EAGAIN and just goes round again
+    server.timeout = HEARTBEAT_INTERVAL
+    log.info("worker started pid=%d slot=%d", os.getpid(), slot)
+    while not stopping:
+        beat()
+        server.handle_request()
+    # The master kills this worker graceful_timeout after its SIGTERM; leave a second to spare
+    deadline = time.monotonic() + graceful_timeout - HEARTBEAT_INTERVAL
+    server.server_close()
+    # Accepted uploads still get their OCR and their entry
+    _app_module.ocr_jobs.shutdown(wait=True)
+    _app_module.upload_store.shutdown(wait=True)
+    # Bulk imports ran on meanwhile; the ones that can't finish in time are marked failed
+    _app_module.shutdown_bulk_imports(max(0.0, deadline - time.monotonic()))
+
+
+class Master:
+    """Forks the workers, restarts dead or stuck ones, and handles HUP/TERM/INT"""
+
+    def __init__(self, listener, workers=SERVE_WORKERS, timeout=SERVE_TIMEOUT,
+                 graceful_timeout=SERVE_GRACEFUL_TIMEOUT):
+        self.listener = listener
+        self.size = max(1, workers)
+        self.timeout = timeout
+        self.graceful_timeout = graceful_timeout
+        # Twice the slots: during a restart the old generation is still finishing
+        self.heartbeats = multiprocessing.RawArray('d', 2 * self.size)
+        self.workers = {}  # pid -> slot
+        self.retiring = {}  # pid -> (slot, deadline)
+        self._signals = []
+
+    def spawn(self):
+        used = set(self.workers.values()) | {slot for slot, _ in self.retiring.values()}
+        slot = next(i for i in range(len(self.heartbeats)) if i not in used)
+        self.heartbeats[slot] = time.monotonic()
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                _serve(self.listener, slot, self.heartbeats, self.timeout, self.graceful_timeout)
+            except BaseException:
+                log.exception("worker failed pid=%d", os.getpid())
+                code = 1
+            finally:
+                os._exit(code)
+        self.workers[pid] = slot
+        return pid
+
+    def reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            if self.retiring.pop(pid, None) is None and self.workers.pop(pid, None) is not None:
+                log.warning("worker exited pid=%d status=%d - replacing it", pid, os.waitstatus_to_exitcode(status))
+
+    def kill_stuck(self):
+        now = time.monotonic()
+        for pid, slot in list(self.workers.items()):
+            if now - self.heartbeats[slot] > self.timeout:
+                log.error("worker timed out pid=%d silent_seconds=%.0f - killing it", pid, now - self.heartbeats[slot])
+                self._kill(pid, signal.SIGKILL)
+        for pid, (slot, deadline) in list(self.retiring.items()):
+            if now > deadline:
+                log.warning("worker did not stop in time pid=%d - killing it", pid)
+                self._kill(pid, signal.SIGKILL)
+
+    def _kill(self, pid, sig):
+        try:
+            os.kill(pid, sig)
+        except ProcessLookupError:
+            pass
+
+    def retire(self, pids):
+        deadline = time.monotonic() + self.graceful_timeout
+        for pid in pids:
+            self.retiring[pid] = (self.workers.pop(pid), deadline)
+            self._kill(pid, signal.SIGTERM)
+
+    def restart(self):
+        """New workers first, then the old ones finish their requests and exit"""
+        import prediction
+        old = list(self.workers)
+        prediction.reload_models()  # the new generation inherits a newly activated version
+        for _ in range(self.size):
+            self.spawn()
+        self.retire(old)
+        log.info("restarting workers old=%s", old)
+
+    def stop(self):
+        self.retire(list(self.workers))
+        while self.retiring:
+            self.reap()
+            self.kill_stuck()
+            time.sleep(0.1)
+        log.info("server stopped")
+
+    def run(self):
+        for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+            signal.signal(sig, lambda signum, frame: self._signals.append(signum))
+        while True:
+            self.reap()
+            while self._signals:
+                sig = self._signals.pop(0)
+                if sig == signal.SIGHUP:
+                    self.restart()
+                else:
+                    self.stop()
+                    return
+            self.kill_stuck()
+            while len(self.workers) < self.size:
+                self.spawn()
+            time.sleep(0.5)
+
+
+def listen(bind):
+    """Listening socket for 'host:port'; non-blocking, since the workers race for each accept()"""
+    host, _, port = bind.rpartition(':')
+    host = host.strip('[]') or '0.0.0.0'
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    listener = socket.create_server((host, int(port)), family=family, backlog=SERVE_BACKLOG)
+    listener.setblocking(False)
+    return listener
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pre-fork production server")
+    parser.add_argument('--bind', default=SERVE_BIND, help='host:port to listen on')
+    parser.add_argument('--workers', type=int, default=SERVE_WORKERS)
+    parser.add_argument('--timeout', type=float, default=SERVE_TIMEOUT,
+                        help='seconds a request may run before its worker is replaced')
+    parser.add_argument('--graceful-timeout', type=float, default=SERVE_GRACEFUL_TIMEOUT,
+                        help='seconds stopping workers get to finish on HUP/TERM')
+    args = parser.parse_args(argv)
+    listener = listen(args.bind)
+    preload()
+    os.makedirs(_app_module.UPLOAD_FOLDER, exist_ok=True)
+    log.info("serving bind=%s workers=%d pid=%d", args.bind, args.workers, os.getpid())
+    try:
+        Master(listener, args.workers, args.timeout, args.graceful_timeout).run()
+    finally:
+        listener.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,95 @@
+// Incremental history on the result page: the server renders the first
+// page, further pages are streamed from /history as NDJSON and appended
+// row by row as they arrive.
+(function () {
+  const list = document.getElementById('historyList');
+  if (!list) {
+    return;
+  }
+  const button = document.getElementById('historyMore');
+  const pageSize = list.dataset.pageSize || 20;
+  let cursor = list.dataset.nextCursor;
+  let loading = false;
+
+  function renderEntry(item) {
+    const li = document.createElement('li');
+    const label = document.createElement('span');
+    const category = document.createElement('strong');
+    category.textContent = item.category || 'Misc';
+    label.appendChild(category);
+    const subtitles = [item.date || 'N/A'];
+    if (item.filename) {
+      subtitles.push(`📎 ${item.filename}`);
+    }
+    subtitles.forEach(text => {
+      const small = document.createElement('small');
+      small.className = 'category-subtitle';
+      small.textContent = text;
+      label.appendChild(document.createElement('br'));
+      label.appendChild(small);
+    });
+    const value = document.createElement('span');
+    value.className = 'info-value';
+    value.textContent = `₹${Number(item.amount || item.extracted_amount || 0).toFixed(2)}`;
+    li.appendChild(label);
+    li.appendChild(value);
+    list.appendChild(li);
+  }
+
+  async function loadMore() {
+    if (loading || !cursor) {
+      return;
+    }
+    loading = true;
+    if (button) {
+      button.disabled = true;
+      button.textContent = 'Loading...';
+    }
+    try {
+      const res = await fetch(`/history?limit=${pageSize}&cursor=${encodeURIComponent(cursor)}`);
+      if (!res.ok) {
+        throw new Error(`History error: ${res.status} ${res.statusText}`);
+      }
+      cursor = res.headers.get('X-Next-Cursor');
+      // Parse the NDJSON stream line by line as chunks arrive
+      const reader = res.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      while (true) {
+        const {value, done} = await reader.read();
+        buffer += decoder.decode(value || new Uint8Array(), {stream: !done});
+        const lines = buffer.split('\n');
+        buffer = lines.pop();
+        lines.filter(line => line.trim()).forEach(line => renderEntry(JSON.parse(line)));
+        if (done) {
+          break;
+        }
+      }
+      if (buffer.trim()) {
+        renderEntry(JSON.parse(buffer));
+      }
+    } catch (error) {
+      console.error(error);
+    } finally {
+      loading = false;
+      if (button) {
+        button.disabled = false;
+        button.textContent = 'Load more';
+        button.style.display = cursor ? '' : 'none';
+      }
+    }
+  }
+
+  button?.addEventListener('click', loadMore);
+
+  // Load the next page when the bottom of the list scrolls into view
+  const sentinel = document.getElementById('historySentinel');
+  if (sentinel && 'IntersectionObserver' in window) {
+    const observer = new IntersectionObserver(entries => {
+      if (entries.some(e => e.isIntersecting)) {
+        loadMore();
+      }
+    }, {root: document.getElementById('historyScroll')});
+    observer.observe(sentinel);
+  }
+})();
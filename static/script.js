@@ -15,11 +15,18 @@ document.getElementById('uploadForm')?.addEventListener('submit', async function
       body: data
     });
     
+    if (res.status === 429) {
+      throw new Error('Server is busy processing other receipts. Please try again in a few seconds.');
+    }
     if (!res.ok) {
       throw new Error(`Server error: ${res.status} ${res.statusText}`);
     }
     
-    const json = await res.json();
+    let json = await res.json();
+    if (json.status === 'queued') {
+      btn.innerHTML = '<span class="loading"></span> Reading receipt...';
+      json = await waitForJob(json.status_url);
+    }
     const out = document.getElementById('uploadResult');
     
     if (json.need_manual_amount) {
@@ -103,6 +110,24 @@ document.getElementById('uploadForm')?.addEventListener('submit', async function
   }
 });
 
+// Poll an OCR job until it finishes and return the upload result
+async function waitForJob(statusUrl, intervalMs = 1000) {
+  while (true) {
+    await new Promise(resolve => setTimeout(resolve, intervalMs));
+    const res = await fetch(statusUrl);
+    if (!res.ok) {
+      throw new Error(`Job status error: ${res.status} ${res.statusText}`);
+    }
+    const job = await res.json();
+    if (job.status === 'done') {
+      return job.result;
+    }
+    if (job.status === 'failed') {
+      throw new Error(job.error || 'Receipt processing failed');
+    }
+  }
+}
+
 // Add smooth scrolling for anchor links
 document.querySelectorAll('a[href^="#"]').forEach(anchor => {
   anchor.addEventListener('click', function (e) {
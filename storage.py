@@ -0,0 +1,515 @@
+"""
+Entry storage backed by SQLite (through SQLAlchemy Core).
+
+Replaces the old data.json flat file: entries are appended with a single
+INSERT, reads are indexed queries on date/category, and the legacy JSON file
+is imported once on first start.
+
+Daily, monthly and per-category running totals are kept in their own tables
+and updated in the same transaction as each insert, so the dashboard never
+has to scan history. They are rebuilt from the entries table after a
+migration or when they no longer add up.
+
+Every entry belongs to a user (user_id; 0 is the anonymous/default user
+that owns pre-account history). Indexes and aggregate tables are keyed by
+user first, so a request reads one user's rows only, and per-user usage
+counters enforce the OCR-text and upload quotas.
+
+Entries are exchanged as plain dicts in the same shape data.json used; keys
+whose value is NULL are left out, so `entry.get('category', 'Misc')` style
+lookups keep working.
+"""
+import os, json, time, base64, logging, datetime
+import metrics
+from sqlalchemy import (create_engine, event, inspect, text, MetaData, Table, Column,
+                        Integer, Float, String, Text, JSON, Index, select, func, insert,
+                        update, delete, bindparam, and_, or_)
+
+DATABASE_URL = os.environ.get('DATABASE_URL', 'sqlite:///finance.db')
+DEFAULT_USER = 0  # anonymous requests and legacy data.json history
+USER_OCR_TEXT_QUOTA = int(os.environ.get('USER_OCR_TEXT_QUOTA', 1_000_000))  # chars of stored OCR text
+USER_UPLOAD_QUOTA = int(os.environ.get('USER_UPLOAD_QUOTA', 500 * 1024 * 1024))  # bytes of receipts
+
+log = logging.getLogger(__name__)
+
+
+class QuotaExceeded(Exception):
+    """Raised by Storage.record_upload() when a user is out of upload space"""
+
+metadata = MetaData()
+
+entries = Table(
+    'entries', metadata,
+    Column('id', Integer, primary_key=True, autoincrement=True),
+    Column('user_id', Integer, nullable=False, default=DEFAULT_USER, server_default=str(DEFAULT_USER)),
+    Column('date', String(10), nullable=False),
+    Column('amount', Float),
+    Column('extracted_amount', Float),
+    Column('category', String(100)),
+    Column('source', String(20)),
+    Column('filename', String(255)),
+    Column('ocr_text', Text),
+    Column('all_detected_amounts', JSON),
+    Column('predicted_annual_expense', Float),
+    Column('predicted_annual_savings', Float),
+    Column('distress_probability', Float),
+    Column('advice', Text),
+    Column('model_version', String(64)),  # registry version that produced the prediction
+    Column('extra', JSON),  # any keys not covered by a column
+    Index('ix_entries_user_date', 'user_id', 'date'),
+    Index('ix_entries_user_category', 'user_id', 'category'),
+)
+
+users = Table(
+    'users', metadata,
+    Column('id', Integer, primary_key=True, autoincrement=True),
+    Column('username', String(80), nullable=False, unique=True),
+    Column('password_hash', String(255), nullable=False),
+    Column('created_at', Float),
+)
+
+# Running per-user totals the quotas are checked against
+usage = Table(
+    'user_usage', metadata,
+    Column('user_id', Integer, primary_key=True),
+    Column('ocr_text_chars', Integer, nullable=False, default=0),
+    Column('upload_bytes', Integer, nullable=False, default=0),
+    Column('uploads', Integer, nullable=False, default=0),
+)
+
+meta = Table(
+    'meta', metadata,
+    Column('key', String(50), primary_key=True),
+    Column('value', Text),
+)
+
+
+def _aggregate_table(name, key, key_type):
+    return Table(
+        name, metadata,
+        Column('user_id', Integer, primary_key=True),
+        Column(key, key_type, primary_key=True),
+        Column('total', Float, nullable=False, default=0.0),
+        Column('amount_count', Integer, nullable=False, default=0),  # entries with an amount
+        Column('entry_count', Integer, nullable=False, default=0),
+        Column('first_id', Integer),  # id of the first entry in the bucket
+    )
+
+daily_agg = _aggregate_table('daily_totals', 'date', String(10))
+monthly_agg = _aggregate_table('monthly_totals', 'month', String(7))
+category_agg = _aggregate_table('category_totals', 'category', String(100))
+
+AGGREGATE_TABLES = (daily_agg, monthly_agg, category_agg)
+ENTRY_FIELDS = [c.name for c in entries.columns if c.name not in ('id', 'user_id', 'extra')]
+
+
+def entry_to_row(entry, user=DEFAULT_USER):
+    row = {k: entry.get(k) for k in ENTRY_FIELDS}
+    if not row['date']:
+        row['date'] = datetime.date.today().isoformat()
+    extra = {k: v for k, v in entry.items() if k not in ENTRY_FIELDS and k not in ('id', 'user_id')}
+    row['extra'] = extra or None
+    row['user_id'] = user
+    return row
+
+
+def row_to_entry(row):
+    entry = {k: v for k, v in row._mapping.items() if k not in ('extra', 'user_id') and v is not None}
+    if row.extra:
+        entry.update(row.extra)
+    return entry
+
+
+def encode_cursor(entry):
+    """Opaque keyset cursor for the history page that ends with `entry`"""
+    raw = f"{entry['date']}|{entry['id']}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """(date, id) from encode_cursor(); ValueError if it is malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        day, entry_id = raw.split('|')
+        datetime.date.fromisoformat(day)
+        return day, int(entry_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"invalid cursor: {cursor!r}") from e
+
+
+def _aggregate_keys(row):
+    """(table, key column, key) buckets an entry row contributes to"""
+    return [
+        (daily_agg, 'date', row['date']),
+        (monthly_agg, 'month', row['date'][:7]),
+        (category_agg, 'category', row['category'] or 'Misc'),
+    ]
+
+
+class Storage:
+    def __init__(self, url=DATABASE_URL):
+        self.engine = create_engine(url, future=True)
+        if self.engine.dialect.name == 'sqlite':
+            event.listen(self.engine, 'connect', _sqlite_pragmas)
+        self._upgrade_schema()
+        metadata.create_all(self.engine)
+        self.ensure_aggregates()
+
+    def _upgrade_schema(self):
+        """
+        Bring an older database up to the current layout. A single-user
+        database moves to per-user partitions: existing entries go to
+        DEFAULT_USER and the aggregate tables are recreated
+        (ensure_aggregates() then rebuilds them). Nullable entry columns
+        added since are appended with ALTER TABLE.
+        """
+        inspector = inspect(self.engine)
+        if not inspector.has_table('entries'):
+            return
+        existing = {c['name'] for c in inspector.get_columns('entries')}
+        if 'user_id' not in existing:
+            log.warning("upgrading storage to per-user partitions")
+            with self.engine.begin() as conn:
+                conn.execute(text(f"ALTER TABLE entries ADD COLUMN user_id INTEGER NOT NULL DEFAULT {DEFAULT_USER}"))
+                for name in ('ix_entries_date', 'ix_entries_category'):
+                    conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+                for index in entries.indexes:
+                    index.create(conn, checkfirst=True)
+                for table in AGGREGATE_TABLES:
+                    table.drop(conn, checkfirst=True)
+        missing = [c for c in entries.columns if c.name not in existing and c.name != 'user_id']
+        if missing:
+            with self.engine.begin() as conn:
+                for column in missing:
+                    column_type = column.type.compile(dialect=self.engine.dialect)
+                    conn.execute(text(f"ALTER TABLE entries ADD COLUMN {column.name} {column_type}"))
+
+    # Writes
+
+    def add_entry(self, entry, user=DEFAULT_USER):
+        """Append one entry for `user`; returns its id"""
+        row = entry_to_row(entry, user)
+        with metrics.span('storage.write'), self.engine.begin() as conn:
+            self._fit_ocr_text(conn, user, [row])
+            result = conn.execute(insert(entries).values(**row))
+            entry_id = result.inserted_primary_key[0]
+            self._apply_aggregates(conn, [(entry_id, row)])
+            return entry_id
+
+    def add_entries(self, new_entries, user=DEFAULT_USER):
+        """Append many entries for `user` in one transaction"""
+        rows = [entry_to_row(e, user) for e in new_entries]
+        if rows:
+            with metrics.span('storage.write'), self.engine.begin() as conn:
+                self._fit_ocr_text(conn, user, rows)
+                # Insert one by one so each row's id is known for first_id
+                ids = [conn.execute(insert(entries).values(**row)).inserted_primary_key[0] for row in rows]
+                self._apply_aggregates(conn, list(zip(ids, rows)))
+        return len(rows)
+
+    def update_entries(self, updates):
+        """
+        Apply (entry id, {field: value}) updates in one transaction, e.g. to
+        re-score history after a model retrain. Aggregates are rebuilt if an
+        update touches amount, date or category.
+        """
+        groups = {}
+        for entry_id, fields in updates:
+            fields = {k: v for k, v in fields.items() if k in ENTRY_FIELDS}
+            if fields:
+                groups.setdefault(tuple(sorted(fields)), []).append(dict(fields, _id=entry_id))
+        if not groups:
+            return 0
+        with self.engine.begin() as conn:
+            for keys, params in groups.items():
+                stmt = (update(entries).where(entries.c.id == bindparam('_id'))
+                        .values({k: bindparam(k) for k in keys}))
+                conn.execute(stmt, params)
+        if any({'amount', 'date', 'category'} & set(keys) for keys in groups):
+            self.rebuild_aggregates()
+        return sum(len(params) for params in groups.values())
+
+    def _apply_aggregates(self, conn, id_rows):
+        """Fold newly inserted (id, row) pairs into the aggregate tables"""
+        deltas = {}
+        for entry_id, row in id_rows:
+            amount = row['amount']
+            for table, key_col, key in _aggregate_keys(row):
+                d = deltas.setdefault((table.name, row['user_id'], key),
+                                      [table, key_col, 0.0, 0, 0, entry_id])
+                if amount is not None:
+                    d[2] += amount
+                    d[3] += 1
+                d[4] += 1
+        for (_, user, key), (table, key_col, total, amount_count, entry_count, first_id) in deltas.items():
+            key_clause = and_(table.c.user_id == user, table.c[key_col] == key)
+            updated = conn.execute(update(table).where(key_clause).values(
+                total=table.c.total + total,
+                amount_count=table.c.amount_count + amount_count,
+                entry_count=table.c.entry_count + entry_count,
+            ))
+            if updated.rowcount == 0:
+                conn.execute(insert(table).values(**{
+                    'user_id': user, key_col: key, 'total': total, 'amount_count': amount_count,
+                    'entry_count': entry_count, 'first_id': first_id,
+                }))
+
+    # Quotas
+
+    def usage(self, user=DEFAULT_USER):
+        """{'ocr_text_chars', 'upload_bytes', 'uploads'} stored so far by `user`"""
+        with self.engine.connect() as conn:
+            return self._usage(conn, user)
+
+    def _usage(self, conn, user):
+        row = conn.execute(select(usage).where(usage.c.user_id == user)).first()
+        if row is None:
+            return {'ocr_text_chars': 0, 'upload_bytes': 0, 'uploads': 0}
+        return {k: row._mapping[k] for k in ('ocr_text_chars', 'upload_bytes', 'uploads')}
+
+    def _add_usage(self, conn, user, **deltas):
+        updated = conn.execute(update(usage).where(usage.c.user_id == user).values(
+            {k: usage.c[k] + v for k, v in deltas.items()}))
+        if updated.rowcount == 0:
+            conn.execute(insert(usage).values(
+                dict({'ocr_text_chars': 0, 'upload_bytes': 0, 'uploads': 0}, user_id=user, **deltas)))
+
+    def _fit_ocr_text(self, conn, user, rows, quota=None):
+        """Trim the rows' OCR text to what is left of the user's quota, and charge it"""
+        quota = USER_OCR_TEXT_QUOTA if quota is None else quota
+        left = max(0, quota - self._usage(conn, user)['ocr_text_chars'])
+        charged = 0
+        for row in rows:
+            if row['ocr_text']:
+                row['ocr_text'] = row['ocr_text'][:left - charged] or None
+                charged += len(row['ocr_text'] or '')
+        if charged:
+            self._add_usage(conn, user, ocr_text_chars=charged)
+
+    def record_upload(self, user, nbytes, quota=None):
+        """Charge an upload of nbytes to `user`; QuotaExceeded if it doesn't fit"""
+        quota = USER_UPLOAD_QUOTA if quota is None else quota
+        with self.engine.begin() as conn:
+            used = self._usage(conn, user)['upload_bytes']
+            if used + nbytes > quota:
+                raise QuotaExceeded(f"upload quota of {quota} bytes reached ({used} used)")
+            self._add_usage(conn, user, upload_bytes=nbytes, uploads=1)
+
+    def release_upload(self, user, nbytes):
+        """Take back a record_upload() charge for an upload that was not kept"""
+        with self.engine.begin() as conn:
+            self._add_usage(conn, user, upload_bytes=-nbytes, uploads=-1)
+
+    # Users
+
+    def create_user(self, username, password_hash):
+        """New account; returns its id (ValueError if the name is taken)"""
+        with self.engine.begin() as conn:
+            if conn.execute(select(users.c.id).where(users.c.username == username)).first():
+                raise ValueError(f"user {username!r} already exists")
+            result = conn.execute(insert(users).values(username=username, password_hash=password_hash,
+                                                       created_at=time.time()))
+            return result.inserted_primary_key[0]
+
+    def get_user(self, user_id=None, username=None):
+        """User dict by id or by name, or None"""
+        clause = users.c.id == user_id if username is None else users.c.username == username
+        with self.engine.connect() as conn:
+            row = conn.execute(select(users).where(clause)).first()
+        return dict(row._mapping) if row else None
+
+    # Reads
+
+    def entries_on(self, day, user=DEFAULT_USER):
+        return self._select(select(entries).where(entries.c.user_id == user, entries.c.date == day)
+                            .order_by(entries.c.id))
+
+    def latest(self, user=DEFAULT_USER):
+        rows = self._select(select(entries).where(entries.c.user_id == user)
+                            .order_by(entries.c.id.desc()).limit(1))
+        return rows[0] if rows else {}
+
+    def recent(self, limit=10, user=DEFAULT_USER):
+        """Most recently added entries, newest first"""
+        return self._select(select(entries).where(entries.c.user_id == user)
+                            .order_by(entries.c.id.desc()).limit(limit))
+
+    def history(self, limit=20, cursor=None, user=DEFAULT_USER):
+        """
+        One page of `user`'s history, newest date first (ties by newest id),
+        and the cursor of the next page (None on the last one). Keyset
+        pagination: each page is a range scan of the (user_id, date) index
+        from the cursor, whatever the depth.
+        """
+        stmt = (select(entries).where(entries.c.user_id == user)
+                .order_by(entries.c.date.desc(), entries.c.id.desc()).limit(limit + 1))
+        if cursor is not None:
+            day, entry_id = decode_cursor(cursor)
+            stmt = stmt.where(and_(entries.c.date <= day,
+                                   or_(entries.c.date < day, entries.c.id < entry_id)))
+        page = self._select(stmt)
+        if len(page) > limit:
+            return page[:limit], encode_cursor(page[limit - 1])
+        return page, None
+
+    def iter_entries(self, batch_size=500, user=None):
+        """Entries in insertion order, fetched in batches; every user's unless `user` is given"""
+        last_id = 0
+        while True:
+            stmt = (select(entries).where(entries.c.id > last_id)
+                    .order_by(entries.c.id).limit(batch_size))
+            if user is not None:
+                stmt = stmt.where(entries.c.user_id == user)
+            with self.engine.connect() as conn:
+                rows = conn.execute(stmt).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield row_to_entry(row)
+            last_id = rows[-1].id
+
+    def day_total(self, day, user=DEFAULT_USER):
+        return self._aggregate_total(daily_agg, 'date', day, user)
+
+    def month_total(self, day, user=DEFAULT_USER):
+        """Total for the month containing `day` (ISO date string)"""
+        return self._aggregate_total(monthly_agg, 'month', day[:7], user)
+
+    def category_totals(self, user=DEFAULT_USER):
+        """{category: total amount}, categories in order of first appearance"""
+        stmt = (select(category_agg.c.category, category_agg.c.total)
+                .where(category_agg.c.user_id == user).order_by(category_agg.c.first_id))
+        with self.engine.connect() as conn:
+            return {row.category: row.total for row in conn.execute(stmt)}
+
+    def amount_stats(self, user=DEFAULT_USER):
+        """(count, average) over `user`'s entries that have an amount"""
+        stmt = (select(func.sum(monthly_agg.c.amount_count), func.sum(monthly_agg.c.total))
+                .where(monthly_agg.c.user_id == user))
+        with self.engine.connect() as conn:
+            count, total = conn.execute(stmt).one()
+        if not count:
+            return 0, None
+        return count, total / count
+
+    def daily_series(self, user=DEFAULT_USER):
+        """
+        ({ISO date: total}, highest entry id, aggregates generation) for
+        `user`, read in one transaction so the three agree. Incremental
+        consumers (the forecaster) pick up later inserts with entries_after().
+        """
+        with self.engine.connect() as conn:
+            if self.engine.dialect.name == 'sqlite':
+                # pysqlite only opens a transaction before writes; without BEGIN each SELECT
+                # would see its own snapshot and an insert in between would be lost or doubled
+                conn.exec_driver_sql('BEGIN')
+            totals = {row.date: row.total for row in conn.execute(
+                select(daily_agg.c.date, daily_agg.c.total).where(daily_agg.c.user_id == user))}
+            last_id = conn.execute(select(func.max(entries.c.id)).where(entries.c.user_id == user)).scalar()
+            generation = conn.execute(select(meta.c.value).where(meta.c.key == 'aggregates_generation')).scalar()
+        return totals, last_id or 0, generation
+
+    def entries_after(self, last_id, user=DEFAULT_USER):
+        """(id, date, amount) of `user`'s entries with id > last_id, oldest first"""
+        stmt = (select(entries.c.id, entries.c.date, entries.c.amount)
+                .where(entries.c.id > last_id, entries.c.user_id == user).order_by(entries.c.id))
+        with self.engine.connect() as conn:
+            return [tuple(row) for row in conn.execute(stmt)]
+
+    def aggregates_generation(self):
+        """Bumped by every rebuild: cached state derived from entries is stale when it changes"""
+        return self.get_meta('aggregates_generation')
+
+    def _aggregate_total(self, table, key_col, key, user):
+        with self.engine.connect() as conn:
+            total = conn.execute(select(table.c.total).where(
+                table.c.user_id == user, table.c[key_col] == key)).scalar()
+        return total or 0.0
+
+    def count(self, user=None):
+        """Number of entries; every user's unless `user` is given"""
+        stmt = select(func.count()).select_from(entries)
+        if user is not None:
+            stmt = stmt.where(entries.c.user_id == user)
+        with self.engine.connect() as conn:
+            return conn.execute(stmt).scalar()
+
+    def _select(self, stmt):
+        with self.engine.connect() as conn:
+            return [row_to_entry(row) for row in conn.execute(stmt)]
+
+    # Migration
+
+    def get_meta(self, key):
+        with self.engine.connect() as conn:
+            return conn.execute(select(meta.c.value).where(meta.c.key == key)).scalar()
+
+    def migrate_from_json(self, path):
+        """
+        Import a legacy data.json once, as DEFAULT_USER's history. Returns
+        the number of entries imported (0 if already migrated or the file
+        doesn't exist). The JSON file itself is left in place.
+        """
+        if self.get_meta('migrated_from_json') or not os.path.exists(path):
+            return 0
+        with open(path, 'r') as f:
+            legacy = json.load(f)
+        rows = [entry_to_row(e) for e in legacy]
+        with self.engine.begin() as conn:
+            if rows:
+                conn.execute(insert(entries), rows)
+            conn.execute(insert(meta).values(key='migrated_from_json', value=os.path.abspath(path)))
+        log.info("migrated entries=%d from=%s", len(rows), path)
+        self.rebuild_aggregates()
+        return len(rows)
+
+    # Aggregates
+
+    def aggregates_consistent(self):
+        """Cheap sanity check: every entry is counted once in each aggregate table"""
+        with self.engine.connect() as conn:
+            n = conn.execute(select(func.count()).select_from(entries)).scalar()
+            for table in AGGREGATE_TABLES:
+                counted = conn.execute(select(func.coalesce(func.sum(table.c.entry_count), 0))).scalar()
+                if counted != n:
+                    return False
+        return True
+
+    def ensure_aggregates(self):
+        if not self.aggregates_consistent():
+            log.warning("spending aggregates out of sync with entries - rebuilding")
+            self.rebuild_aggregates()
+
+    def rebuild_aggregates(self):
+        """Recompute all aggregate tables from the entries table"""
+        buckets = [
+            (daily_agg, 'date', entries.c.date),
+            (monthly_agg, 'month', func.substr(entries.c.date, 1, 7)),
+            (category_agg, 'category', func.coalesce(entries.c.category, 'Misc')),
+        ]
+        with self.engine.begin() as conn:
+            for table, key_col, key_expr in buckets:
+                conn.execute(delete(table))
+                stmt = (select(entries.c.user_id, key_expr.label('key'),
+                               func.coalesce(func.sum(entries.c.amount), 0.0).label('total'),
+                               func.count(entries.c.amount).label('amount_count'),
+                               func.count().label('entry_count'),
+                               func.min(entries.c.id).label('first_id'))
+                        .group_by(entries.c.user_id, key_expr))
+                rows = [{'user_id': r.user_id, key_col: r.key, 'total': r.total,
+                         'amount_count': r.amount_count, 'entry_count': r.entry_count,
+                         'first_id': r.first_id}
+                        for r in conn.execute(stmt)]
+                if rows:
+                    conn.execute(insert(table), rows)
+            generation = int(conn.execute(select(meta.c.value).where(meta.c.key == 'aggregates_generation')).scalar() or 0)
+            conn.execute(delete(meta).where(meta.c.key == 'aggregates_generation'))
+            conn.execute(insert(meta).values(key='aggregates_generation', value=str(generation + 1)))
+
+
+def _sqlite_pragmas(dbapi_conn, conn_record):
+    # WAL lets readers proceed while a write is in progress; wait on locks instead of failing
+    cursor = dbapi_conn.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA busy_timeout=5000')
+    cursor.close()
@@ -0,0 +1,56 @@
+"""
+Test the benchmark suite on tiny inputs
+"""
+import bench
+from storage import Storage
+
+
+def test_percentiles():
+    stats = bench.percentiles([0.004, 0.001, 0.002, 0.003])
+    assert stats['n'] == 4
+    assert stats['max_ms'] == 4.0
+    assert stats['p50_ms'] in (2.0, 3.0)
+    assert bench.percentiles([]) == {}
+
+
+def test_seed_history_builds_aggregates(tmp_path):
+    storage = Storage(f"sqlite:///{tmp_path / 'bench.db'}")
+    bench.seed_history(storage, 250, chunk=100)
+    assert storage.count() == 250
+    assert storage.aggregates_consistent()
+    assert set(storage.category_totals()) <= set(bench.CATEGORIES)
+
+
+def test_extraction_and_prediction_sections():
+    report = bench.run(['extraction', 'prediction'], iterations=2)
+    assert report['extraction']['corpus']['texts'] > 0
+    assert report['prediction']['amounts'] == 1000
+    assert 'commit' in report['meta']
+
+
+def test_compare_reports():
+    before = {"meta": {"commit": "a"}, "extraction": {"long": {"calls_per_sec": 100.0}}, "ocr": {"available": False}}
+    after = {"meta": {"commit": "b"}, "extraction": {"long": {"calls_per_sec": 150.0}}}
+    assert bench.compare(before, after) == [("extraction.long.calls_per_sec", 100.0, 150.0, 50.0)]
+
+
+def test_parse_importtime():
+    stderr = "\n".join([
+        "import time: self [us] | cumulative | imported package",
+        "import time:       120 |        120 |   json.decoder",
+        "import time:       300 |        420 | json",
+        "import time:       900 |        900 |   flask",
+        "import time:        50 |         50 |     werkzeug",
+        "import time:       100 |       1500 |   storage",
+        "import time:       200 |       2600 | app",
+    ])
+    total, slowest = bench.parse_importtime(stderr)
+    assert total == 2.6
+    assert slowest == {'storage': 1.5, 'flask': 0.9}
+
+
+def test_startup_loads_no_heavy_libraries():
+    report = bench.run(['startup'])['startup']
+    assert report['app_import_ms'] > 0
+    for name in ('torch', 'cv2', 'sklearn', 'easyocr'):
+        assert name not in report['heavy_after_serving']
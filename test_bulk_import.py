@@ -0,0 +1,130 @@
+"""
+Test chunked, resumable bulk import with a fake OCR reader
+"""
+import os, datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+import pytest
+
+import ocr
+import ocr_backends
+from bulk_import import BulkImporter, Checkpoint, checkpoint_path, find_receipts
+from ocr_jobs import _init_worker
+from storage import Storage
+
+
+class FakeReader:
+    def readtext(self, image, detail=0, paragraph=False):
+        return ["TOTAL 120.00"]
+
+
+@pytest.fixture
+def receipts_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(ocr, 'get_ocr_reader', lambda: FakeReader())
+    monkeypatch.setattr(ocr_backends, 'OCR_FAST_BACKEND', 'none')
+    monkeypatch.setattr(ocr, 'strategy_stats', ocr.StrategyStats(str(tmp_path / 'stats.json')))
+    monkeypatch.setattr(ocr, 'tier_stats', ocr.StrategyStats(str(tmp_path / 'tiers.json')))
+    directory = tmp_path / 'receipts'
+    (directory / '2023').mkdir(parents=True)
+    for i in range(5):
+        img = np.full((40, 60, 3), 200 + i, dtype=np.uint8)  # distinct bytes per file
+        cv2.imwrite(str(directory / '2023' / f'r{i}.png'), img)
+    (directory / 'notes.txt').write_text('not a receipt')
+    return directory
+
+
+def run_import(directory, tmp_path, chunk_size=2):
+    storage = Storage(f"sqlite:///{tmp_path / 'bulk.db'}")
+    progress = []
+    with ThreadPoolExecutor(max_workers=2, initializer=_init_worker) as executor:
+        importer = BulkImporter(storage, chunk_size=chunk_size, executor=executor,
+                                checkpoint=Checkpoint(str(tmp_path / 'checkpoint.json')),
+                                on_progress=progress.append)
+        result = importer.run(find_receipts(str(directory)))
+    return storage, result, progress
+
+
+def test_import_in_chunks_with_batched_writes(receipts_dir, tmp_path):
+    assert len(find_receipts(str(receipts_dir))) == 5
+    storage, result, progress = run_import(receipts_dir, tmp_path)
+    assert result['status'] == 'done'
+    assert (result['imported'], result['failed'], result['chunks']) == (5, 0, 3)
+    assert result['receipts_per_sec'] > 0
+    assert storage.count() == 5
+    entry = storage.latest()
+    assert entry['amount'] == 120.0 and entry['source'] == 'bulk'
+    assert 'predicted_annual_expense' in entry
+    assert [p['processed'] for p in progress if p['status'] == 'running'][-1] == 5
+
+
+def test_resume_skips_imported_receipts(receipts_dir, tmp_path):
+    run_import(receipts_dir, tmp_path)
+    storage, result, _ = run_import(receipts_dir, tmp_path)
+    assert (result['imported'], result['skipped']) == (0, 5)
+    assert storage.count() == 5
+
+
+def test_failures_are_reported_per_file(receipts_dir, tmp_path):
+    os.symlink(str(tmp_path / 'missing.png'), str(receipts_dir / 'broken.png'))
+    storage, result, _ = run_import(receipts_dir, tmp_path)
+    assert result['imported'] == 5 and result['failed'] == 1
+    assert result['failures'][0]['file'] == 'broken.png'
+
+
+def test_stop_marks_the_import_failed(receipts_dir, tmp_path):
+    storage = Storage(f"sqlite:///{tmp_path / 'bulk.db'}")
+    progress = []
+
+    def on_progress(p):
+        progress.append(p)
+        if p['chunks'] == 1 and p['status'] == 'running':
+            importer.stop("server stopped")
+
+    with ThreadPoolExecutor(max_workers=2, initializer=_init_worker) as executor:
+        importer = BulkImporter(storage, chunk_size=2, executor=executor, on_progress=on_progress)
+        result = importer.run(find_receipts(str(receipts_dir)))
+    assert importer.wait(0)
+    assert result['status'] == 'failed' and result['error'] == "server stopped"
+    assert result['finished_at'] is not None
+    assert storage.count() == 2  # the running chunk finished, no later one started
+
+
+def test_duplicates_within_one_run_are_imported_once(receipts_dir, tmp_path):
+    data = (receipts_dir / '2023' / 'r0.png').read_bytes()
+    (receipts_dir / '2023' / 'copy.png').write_bytes(data)
+    storage, result, _ = run_import(receipts_dir, tmp_path, chunk_size=10)
+    assert (result['imported'], result['skipped']) == (5, 1)
+    assert storage.count() == 5
+
+
+def test_entries_are_dated_by_the_receipt(receipts_dir, tmp_path):
+    stamp = datetime.datetime(2021, 3, 4, 12, 0).timestamp()
+    os.utime(receipts_dir / '2023' / 'r0.png', (stamp, stamp))
+    storage = Storage(f"sqlite:///{tmp_path / 'dated.db'}")
+    with ThreadPoolExecutor(max_workers=1, initializer=_init_worker) as executor:
+        BulkImporter(storage, executor=executor).run(find_receipts(str(receipts_dir)))
+        dates = sorted(e['date'] for e in storage.iter_entries())
+        assert dates[0] == '2021-03-04'
+        BulkImporter(storage, executor=executor, date='2019-12-31').run(
+            [('zip/a.png', str(receipts_dir / '2023' / 'r1.png'), '2020-01-01')])
+    # An explicit date wins over the receipt's own
+    assert '2019-12-31' in {e['date'] for e in storage.iter_entries()}
+
+
+def test_checkpoint_is_kept_per_user(tmp_path):
+    path = str(tmp_path / 'checkpoint.json')
+    assert checkpoint_path(path, 0) == path
+    assert checkpoint_path(path, 7) == str(tmp_path / 'checkpoint.u7.json')
+    assert checkpoint_path('', 7) == ''
+
+
+def test_checkpoint_saves_merge_with_other_imports(tmp_path):
+    path = str(tmp_path / 'checkpoint.json')
+    first, second = Checkpoint(path), Checkpoint(path)
+    first.done.add('a')
+    first.save()
+    second.done.add('b')
+    second.save()
+    assert Checkpoint(path).done == {'a', 'b'}
@@ -0,0 +1,43 @@
+"""
+Test the single-pass extraction engine against the old regex cascade
+"""
+import contextlib, io
+
+import extraction
+from bench_extraction import load_fixtures, legacy_extract_scored_amounts
+
+
+def legacy(text):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return legacy_extract_scored_amounts(text)
+
+
+def test_matches_legacy_ranking_on_fixtures():
+    texts = [text for text, _ in load_fixtures()]
+    assert texts
+    for text in texts + [' '.join(texts)]:
+        assert extraction.extract(text) == legacy(text), text
+
+
+def test_edge_cases_match_legacy():
+    for text in ['', 'no numbers here', 'total 1,234.50', 'NETOTAL 45', 'İNR 500', 'PAİD 300',
+                 'Paid to Cafe 21,750 UPI', '₹1.234,56', 'Items 120.00 75.50 1,999']:
+        assert extraction.extract(text) == legacy(text), text
+
+
+def test_scan_reports_spans_and_pattern_ids():
+    text, _ = extraction.normalize('Subtotal 90.00 Grand Total: Rs. 1,250.50')
+    candidates = extraction.scan(text)
+    for c in candidates:
+        regex = extraction.COMPILED[c.pattern_id][0]
+        assert regex.fullmatch(text, *c.span), c
+        assert c.tier == extraction.PATTERNS[c.pattern_id][2]
+    best = extraction.rank(candidates)[0]
+    assert best == (1250.5, 100)
+
+
+def test_upi_misread_is_corrected():
+    text, fixed = extraction.normalize('Paid to Store 21,750 UPI ref')
+    assert fixed
+    assert '1,750' in text and '21,750' not in text
+    assert extraction.extract('Paid to Store 21,750 UPI ref')[0][0] == 1750.0
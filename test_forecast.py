@@ -0,0 +1,93 @@
+"""
+Test the incremental spend forecaster against a from-scratch fit
+"""
+import datetime
+
+import numpy as np
+import pytest
+
+import forecast
+from storage import Storage
+
+
+def test_incremental_sums_match_batch_fit():
+    ordinals, spend = forecast.synthetic_series(120)
+    state = forecast.ForecastState()
+    # Out of order, several receipts per day: the sums must not care
+    for i in np.random.RandomState(1).permutation(len(spend)):
+        for part in (0.25, 0.75):
+            state.add(int(ordinals[i]), float(spend[i]) * part)
+    X = forecast.features(ordinals)
+    assert np.allclose(state.xtx, X.T @ X)
+    assert np.allclose(state.xty, X.T @ spend)
+    assert state.yy == pytest.approx(float(spend @ spend))
+    assert state.forecast()['model'] == 'trend+weekly+monthly'
+
+
+def test_short_history_uses_daily_mean():
+    state = forecast.ForecastState()
+    start = datetime.date(2025, 10, 1).toordinal()
+    state.add(start, 100.0)
+    state.add(start + 9, 100.0)  # two receipts over ten calendar days
+    fc = state.forecast()
+    assert fc['model'] == 'daily_mean'
+    assert fc['predicted_total'] == pytest.approx(20.0 * 365)
+
+
+def test_backtest_beats_per_receipt_average():
+    result = forecast.backtest(*forecast.synthetic_series(400))
+    assert result['origins'] > 5
+    assert result['mape'] < result['baseline_mape']
+
+
+def test_forecaster_catches_up_and_reloads(tmp_path):
+    storage = Storage(f"sqlite:///{tmp_path / 'test.db'}")
+    forecaster = forecast.Forecaster(storage)
+    today = datetime.date.today()
+    day = lambda n: (today - datetime.timedelta(days=n)).isoformat()
+    storage.add_entries([{"date": day(20), "amount": 50.0}, {"date": day(16), "amount": 30.0}])
+    first = forecaster.forecast(0)
+    assert first['days_observed'] == 21  # through today
+    storage.add_entry({"date": day(11), "amount": 20.0})
+    storage.add_entry({"date": day(11), "amount": 5.0}, user=7)  # another user's
+    state = forecaster.state(0)
+    assert state.days[(today - datetime.timedelta(days=11)).toordinal()] == 20.0
+    assert forecaster.forecast(0)['predicted_total'] != first['predicted_total']
+    storage.update_entries([(1, {"amount": 500.0})])  # rebuilds aggregates -> state reloaded
+    assert forecaster.state(0).days[(today - datetime.timedelta(days=20)).toordinal()] == 500.0
+    assert forecaster.forecast(3) is None
+
+
+def test_series_runs_to_today_and_skips_bad_dates(tmp_path):
+    storage = Storage(f"sqlite:///{tmp_path / 'dates.db'}")
+    today = datetime.date.today()
+    storage.add_entries([{"date": (today - datetime.timedelta(days=40)).isoformat(), "amount": 50.0},
+                         {"date": "not-a-date", "amount": 10.0},
+                         {"date": "9999-12-31", "amount": 10.0}])
+    forecaster = forecast.Forecaster(storage)
+    state = forecaster.state(0)
+    assert state.n_days == 41  # padded with zero days up to today
+    assert sum(state.days.values()) == 50.0
+    storage.add_entry({"date": "0001-01-01", "amount": 7.0})
+    state = forecaster.state(0)
+    assert sum(state.days.values()) == 50.0 and state.last_id == 4
+    assert forecaster.forecast(0)['last_day'] == today.isoformat()
+
+
+def test_future_entries_join_the_fit_when_their_day_comes(tmp_path, monkeypatch):
+    storage = Storage(f"sqlite:///{tmp_path / 'rollover.db'}")
+    today = datetime.date.today()
+    day = lambda n: (today + datetime.timedelta(days=n)).isoformat()
+    storage.add_entries([{"date": day(-30), "amount": 40.0}, {"date": day(2), "amount": 70.0}])
+    incremental = forecast.Forecaster(storage)
+    assert sum(incremental.state(0).days.values()) == 40.0
+    storage.add_entry({"date": day(1), "amount": 15.0})  # caught up while still in the future
+    assert sum(incremental.state(0).days.values()) == 40.0
+
+    monkeypatch.setattr(forecast, 'today_ordinal', lambda: today.toordinal() + 3)
+    state = incremental.state(0)
+    fresh = forecast.Forecaster(storage).state(0)
+    assert state.days == fresh.days and sum(state.days.values()) == 125.0
+    assert (state.first, state.last) == (fresh.first, fresh.last)
+    assert np.allclose(state.xtx, fresh.xtx) and np.allclose(state.xty, fresh.xty)
+    assert state.yy == pytest.approx(fresh.yy)
@@ -0,0 +1,44 @@
+"""
+Test stage histograms, cross-process merging and the Prometheus rendering
+"""
+import metrics
+
+
+def test_histogram_buckets_and_render():
+    h = metrics.Histogram('test_seconds', 'Test stage', ['stage', 'strategy'], buckets=(0.01, 0.1))
+    h.observe(0.005, stage='ocr.readtext', strategy='binary')
+    h.observe(0.05, stage='ocr.readtext', strategy='binary')
+    h.observe(5.0, stage='extract')
+    snap = h.snapshot()
+    assert snap[('ocr.readtext', 'binary')]['buckets'] == [(0.01, 1), (0.1, 2), (float('inf'), 2)]
+    assert snap[('extract', '')]['count'] == 1
+    text = '\n'.join(h.render())
+    assert '# TYPE finance_test_seconds histogram' in text
+    assert 'finance_test_seconds_bucket{stage="ocr.readtext",strategy="binary",le="0.1"} 2' in text
+    assert 'finance_test_seconds_bucket{stage="extract",le="+Inf"} 1' in text
+    assert 'finance_test_seconds_count{stage="extract"} 1' in text
+
+
+def test_drain_and_merge_between_registries():
+    worker = metrics.Histogram('w', 'worker side', ['stage'], buckets=(1.0,))
+    parent = metrics.Histogram('w', 'parent side', ['stage'], buckets=(1.0,))
+    worker.observe(0.5, stage='decode')
+    worker.observe(2.0, stage='decode')
+    parent.observe(0.1, stage='decode')
+    parent.merge(worker.drain())
+    assert worker.snapshot() == {}
+    snap = parent.snapshot()[('decode',)]
+    assert snap['count'] == 3
+    assert snap['buckets'] == [(1.0, 2), (float('inf'), 3)]
+
+
+def test_span_records_stage(monkeypatch):
+    h = metrics.Histogram('stage_seconds', 'stages', ['stage', 'strategy'])
+    monkeypatch.setattr(metrics, 'stage_seconds', h)
+    with metrics.span('predict'):
+        pass
+    assert h.snapshot()[('predict', '')]['count'] == 1
+    monkeypatch.setattr(metrics, 'METRICS_ENABLED', False)
+    with metrics.span('predict'):
+        pass
+    assert h.snapshot()[('predict', '')]['count'] == 1
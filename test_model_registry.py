@@ -0,0 +1,70 @@
+"""
+Test publishing, hot reload and negative caching in the model registry
+"""
+import os
+import pickle
+
+import numpy as np
+import pytest
+from sklearn.linear_model import LinearRegression
+
+from model_registry import ModelRegistry, LEGACY_VERSION
+
+
+def regression(slope):
+    x = np.arange(10, dtype=float).reshape(-1, 1)
+    return LinearRegression().fit(x, slope * x.ravel())
+
+
+def test_publish_and_hot_swap(tmp_path):
+    registry = ModelRegistry(str(tmp_path), reload_interval=0)
+    assert registry.current().version is None
+    registry.publish(regression(2), None, version='v1')
+    models = registry.current()
+    assert models.version == 'v1'
+    assert models.regression.predict([[3.0]])[0] == pytest.approx(6.0)
+    assert isinstance(models.regression.coef_, np.memmap)  # mapped, not copied
+    registry.publish(regression(5), None, version='v2')
+    assert registry.current().regression.predict([[3.0]])[0] == pytest.approx(15.0)
+    # Roll back
+    registry.activate('v1')
+    assert registry.current().version == 'v1'
+    assert registry.versions() == ['v1', 'v2']
+    with pytest.raises(ValueError):
+        registry.activate('v3')
+    with pytest.raises(ValueError):
+        registry.publish(None, None, version='v1')
+
+
+def test_reload_interval_and_negative_cache(tmp_path, monkeypatch):
+    registry = ModelRegistry(str(tmp_path), reload_interval=3600)
+    loads = []
+    monkeypatch.setattr(registry, '_source', lambda: loads.append(1) or ('missing',))
+    for _ in range(5):
+        assert registry.current().version is None
+    assert len(loads) == 1  # "no models" is not re-checked on every prediction
+    monkeypatch.undo()
+    ModelRegistry(str(tmp_path)).publish(regression(2), None, version='v1')
+    assert registry.current().version is None  # until the interval passes ...
+    assert registry.reload().version == 'v1'  # ... or a reload is asked for
+
+
+def test_broken_version_keeps_previous_models(tmp_path):
+    registry = ModelRegistry(str(tmp_path), reload_interval=0)
+    registry.publish(regression(2), None, version='v1')
+    assert registry.current().version == 'v1'
+    registry.publish(regression(3), None, version='v2', activate=False)
+    with open(os.path.join(registry.directory, 'v2', 'regression.joblib'), 'wb') as f:
+        f.write(b'not a model')
+    registry.activate('v2')
+    assert registry.current().version == 'v1'
+    assert 'v2' in registry.status()['error']
+
+
+def test_legacy_pickles(tmp_path):
+    with open(tmp_path / 'regression_model.pkl', 'wb') as f:
+        pickle.dump(regression(2), f)
+    models = ModelRegistry(str(tmp_path), reload_interval=0).current()
+    assert models.version == LEGACY_VERSION
+    assert models.regression is not None and models.classification is None
+    assert not models.available
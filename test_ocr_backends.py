@@ -0,0 +1,119 @@
+"""
+Test the fast OCR tier and escalation to the EasyOCR passes
+"""
+import sys, types
+
+import cv2
+import numpy as np
+import pytest
+
+import ocr
+import ocr_backends
+
+
+def box(x0, y0, x1, y1):
+    return [[x0, y0], [x1, y0], [x1, y1], [x0, y1]]
+
+
+class FastBackend(ocr_backends.OCRBackend):
+    name = 'fake'
+    results = []
+
+    def load(self):
+        pass
+
+    def readtext(self, image, detail=1, paragraph=False):
+        return list(self.results)
+
+
+class EasyReader:
+    def __init__(self):
+        self.calls = 0
+
+    def readtext(self, image, detail=0, paragraph=False):
+        self.calls += 1
+        return [(box(10, 10, 100, 30), 'TOTAL', 0.9), (box(120, 10, 200, 30), '88.50', 0.9)]
+
+
+@pytest.fixture
+def setup(tmp_path, monkeypatch):
+    path = tmp_path / 'receipt.png'
+    cv2.imwrite(str(path), np.full((40, 80, 3), 255, dtype=np.uint8))
+    monkeypatch.setattr(ocr, 'strategy_stats', ocr.StrategyStats(str(tmp_path / 'stats.json')))
+    monkeypatch.setattr(ocr, 'tier_stats', ocr.StrategyStats(str(tmp_path / 'tiers.json')))
+    monkeypatch.setitem(ocr_backends.BACKENDS, 'fake', FastBackend)
+    monkeypatch.setattr(ocr_backends, '_instances', {})
+    monkeypatch.setattr(ocr_backends, 'OCR_FAST_BACKEND', 'fake')
+    reader = EasyReader()
+    monkeypatch.setattr(ocr, 'get_ocr_reader', lambda: reader)
+    return str(path), reader
+
+
+def test_confident_fast_read_skips_easyocr(setup, monkeypatch):
+    path, reader = setup
+    monkeypatch.setattr(FastBackend, 'results', [(box(10, 10, 100, 30), 'TOTAL', 0.93),
+                                                 (box(120, 10, 200, 30), '42.00', 0.91)])
+    details = ocr.try_ocr_detailed(path)
+    assert reader.calls == 0
+    assert details['tiers_run'] == ['fake'] and details['tier'] == 'fake'
+    assert details['strategies_run'] == []
+    assert details['text'] == 'TOTAL 42.00'
+    assert ocr.is_cacheable(details)
+
+
+@pytest.mark.parametrize('results', [
+    [(box(10, 10, 100, 30), 'TOTAL', 0.40), (box(120, 10, 200, 30), '42.00', 0.30)],  # unsure
+    [(box(10, 10, 100, 30), 'Coffee', 0.99), (box(120, 10, 200, 30), '42.00', 0.99)],  # no keyword
+])
+def test_escalates_to_easyocr(setup, monkeypatch, results):
+    path, reader = setup
+    monkeypatch.setattr(FastBackend, 'results', results)
+    details = ocr.try_ocr_detailed(path, cascade=True, parallel=1)
+    assert reader.calls == 1
+    assert details['tiers_run'] == ['fake', 'easyocr'] and details['tier'] == 'easyocr'
+    assert details['text'] == 'TOTAL 88.50'  # the fast tier's reading is dropped
+    assert set(details['tier_seconds']) == {'fake', 'easyocr'}
+
+
+def test_keeps_fast_text_without_easyocr(setup, monkeypatch):
+    path, _ = setup
+    monkeypatch.setattr(ocr, 'get_ocr_reader', lambda: None)
+    monkeypatch.setattr(FastBackend, 'results', [(box(10, 10, 100, 30), 'Coffee 42.00', 0.5)])
+    details = ocr.try_ocr_detailed(path)
+    assert details['text'] == 'Coffee 42.00'
+    assert details['tier'] is None and not ocr.is_cacheable(details)
+
+
+def test_tier_stats(setup, monkeypatch):
+    path, _ = setup
+    monkeypatch.setattr(FastBackend, 'results', [(box(10, 10, 100, 30), 'TOTAL 42.00', 0.95)])
+    ocr.record_outcome(ocr.try_ocr_detailed(path))
+    monkeypatch.setattr(FastBackend, 'results', [])
+    ocr.record_outcome(ocr.try_ocr_detailed(path, cascade=True, parallel=1))
+    stats = ocr.tier_stats.snapshot()
+    assert stats['fake']['runs'] == 2 and stats['fake']['wins'] == 1
+    assert stats['easyocr']['runs'] == 1 and stats['easyocr']['wins'] == 1
+    assert 'mean_seconds' in stats['fake']
+
+
+def test_unavailable_backend_is_skipped(monkeypatch):
+    class Missing(FastBackend):
+        def load(self):
+            raise ImportError('no such engine')
+    monkeypatch.setitem(ocr_backends.BACKENDS, 'missing', Missing)
+    monkeypatch.setattr(ocr_backends, '_instances', {})
+    assert ocr_backends.get_backend('missing') is None
+    assert ocr_backends.get_backend('none') is None
+
+
+def test_tesseract_results_are_easyocr_shaped(monkeypatch):
+    data = {'text': ['', 'TOTAL', '42.00'], 'conf': ['-1', '91.5', 88],
+            'left': [0, 10, 120], 'top': [0, 10, 12], 'width': [300, 90, 80], 'height': [50, 20, 20]}
+    fake = types.SimpleNamespace(image_to_data=lambda image, config, output_type: data,
+                                 get_tesseract_version=lambda: '5.3', Output=types.SimpleNamespace(DICT='dict'))
+    monkeypatch.setitem(sys.modules, 'pytesseract', fake)
+    backend = ocr_backends.TesseractBackend()
+    assert backend.available()
+    results = backend.readtext(np.zeros((50, 300), dtype=np.uint8))
+    assert results == [(box(10, 10, 100, 30), 'TOTAL', 0.915), (box(120, 12, 200, 32), '42.00', 0.88)]
+    assert backend.readtext(None, detail=0) == ['TOTAL', '42.00']
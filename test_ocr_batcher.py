@@ -0,0 +1,76 @@
+"""
+Test micro-batching of concurrent readtext calls
+"""
+import threading
+
+import numpy as np
+
+from ocr_batcher import OCRBatcher
+
+
+class FakeReader:
+    """Echoes each image's fill value so results can be matched to callers"""
+    def __init__(self):
+        self.batch_sizes = []
+        self.shapes = []
+        self.single_calls = 0
+
+    def readtext(self, image, detail=0, paragraph=False):
+        self.single_calls += 1
+        return [str(int(image.flat[0]))]
+
+    def readtext_batched(self, images, detail=0, paragraph=False):
+        self.batch_sizes.append(len(images))
+        self.shapes.append([img.shape for img in images])
+        return [[str(int(img.flat[0]))] for img in images]
+
+
+def test_concurrent_calls_share_batches():
+    reader = FakeReader()
+    batcher = OCRBatcher(reader, max_batch=8, max_wait_ms=200)
+    results = {}
+    start = threading.Barrier(8)
+
+    def worker(i):
+        start.wait()
+        results[i] = batcher.readtext(np.full((20, 30), i, dtype=np.uint8), detail=0, paragraph=False)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(5)
+    assert results == {i: [str(i)] for i in range(8)}
+    assert sum(reader.batch_sizes) + reader.single_calls == 8
+    assert len(reader.batch_sizes) + reader.single_calls < 8
+    assert batcher.stats()["images"] == 8
+
+
+def test_similar_sizes_are_padded_into_one_batch():
+    reader = FakeReader()
+    batcher = OCRBatcher(reader, max_batch=4, max_wait_ms=100, pad_ratio=1.3)
+    futures = [batcher.submit(np.full(shape, 7, dtype=np.uint8), detail=0)
+               for shape in [(10, 10), (10, 10), (12, 10), (40, 40)]]
+    assert [f.result(5) for f in futures] == [["7"]] * 4
+    assert reader.batch_sizes == [3]
+    assert reader.shapes == [[(12, 10)] * 3]
+    assert reader.single_calls == 1  # padding the 40x40 one in would more than double the pixels
+    assert batcher.stats()["padded_images"] == 2
+
+
+def test_pad_keeps_the_image_at_the_top_left():
+    image = np.full((2, 3, 3), 255, dtype=np.uint8)
+    image[0, 0] = 0
+    padded = OCRBatcher._pad(image, 4, 5)
+    assert padded.shape == (4, 5, 3)
+    assert (padded[:2, :3] == image).all() and (padded[2:] == 255).all()
+
+
+def test_cancelled_calls_are_skipped():
+    reader = FakeReader()
+    batcher = OCRBatcher(reader, max_batch=4, max_wait_ms=200)
+    futures = [batcher.submit(np.full((10, 10), i, dtype=np.uint8), detail=0) for i in range(3)]
+    assert futures[2].cancel()
+    assert futures[0].result(5) == ["0"] and futures[1].result(5) == ["1"]
+    assert reader.batch_sizes == [2] and reader.single_calls == 0
+    assert batcher.stats()["images"] == 2
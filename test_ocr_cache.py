@@ -0,0 +1,54 @@
+"""
+Test the content-hash OCR result cache
+"""
+from ocr_cache import OCRCache
+
+
+def result(text):
+    return {"text": text, "amounts": [], "strategies_run": ["enhanced"], "winner": None, "ocr_seconds": 3.2}
+
+
+def test_hit_and_miss_counters(tmp_path):
+    cache = OCRCache(str(tmp_path), max_entries=10)
+    key = cache.key_for(b"receipt bytes")
+    assert cache.get(key) is None
+    cache.put(key, result("TOTAL 10"))
+    assert cache.get(key)['text'] == "TOTAL 10"
+    assert 'ocr_seconds' not in cache.get(key)  # only the cacheable fields are kept
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['size']) == (2, 1, 1)
+
+
+def test_key_depends_on_content(tmp_path):
+    cache = OCRCache(str(tmp_path))
+    assert cache.key_for(b"a") != cache.key_for(b"b")
+    assert cache.key_for(b"a") == cache.key_for(b"a")
+
+
+def test_lru_eviction(tmp_path):
+    cache = OCRCache(str(tmp_path), max_entries=2)
+    cache.put('a', result("a"))
+    cache.put('b', result("b"))
+    cache.get('a')  # 'b' is now least recently used
+    cache.put('c', result("c"))
+    assert cache.get('b') is None
+    assert cache.get('a') is not None and cache.get('c') is not None
+
+
+def test_survives_restart(tmp_path):
+    OCRCache(str(tmp_path)).put('k', result("persisted"))
+    reopened = OCRCache(str(tmp_path))
+    assert reopened.stats()['size'] == 1
+    assert reopened.get('k')['text'] == "persisted"
+
+
+def test_shared_directory_between_processes(tmp_path):
+    # Two instances on one directory stand in for two server workers
+    writer, reader = OCRCache(str(tmp_path), max_entries=10), OCRCache(str(tmp_path), max_entries=10)
+    writer.put('k', result("from the other worker"))
+    assert reader.get('k')['text'] == "from the other worker"
+    assert reader.stats()['size'] == 1
+    for i in range(20):
+        writer.put(f'w{i}', result("w"))
+        reader.put(f'r{i}', result("r"))
+    assert len([n for n in tmp_path.iterdir() if n.suffix == '.json']) <= 10 + 1
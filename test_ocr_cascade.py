@@ -0,0 +1,169 @@
+"""
+Test the early-exit OCR strategy cascade with a fake reader
+"""
+import threading, time, multiprocessing
+
+import cv2
+import numpy as np
+import pytest
+
+import ocr
+import ocr_backends
+
+
+class FakeReader:
+    """Returns canned segments per call, in call order"""
+    def __init__(self, per_call):
+        self.per_call = list(per_call)
+        self.calls = 0
+
+    def readtext(self, image, detail=0, paragraph=False):
+        self.calls += 1
+        return self.per_call.pop(0) if self.per_call else []
+
+
+@pytest.fixture
+def receipt(tmp_path, monkeypatch):
+    path = tmp_path / 'receipt.png'
+    cv2.imwrite(str(path), np.full((40, 80, 3), 255, dtype=np.uint8))
+    monkeypatch.setattr(ocr_backends, 'OCR_FAST_BACKEND', 'none')
+    monkeypatch.setattr(ocr, 'strategy_stats', ocr.StrategyStats(str(tmp_path / 'stats.json')))
+    return str(path)
+
+
+def test_cascade_stops_on_priority_amount(receipt, monkeypatch):
+    reader = FakeReader([["Grand Total", "Rs. 1,250.00"], ["never read"]])
+    monkeypatch.setattr(ocr, 'get_ocr_reader', lambda: reader)
+    details = ocr.try_ocr_detailed(receipt, cascade=True)
+    assert reader.calls == 1
+    assert details['winner'] == details['strategies_run'][0]
+    assert ocr.extract_amounts_from_text(details['text'])[0] == 1250.0
+
+
+def test_cascade_respects_max_passes(receipt, monkeypatch):
+    reader = FakeReader([["no amount"], ["still none"], ["nothing"]])
+    monkeypatch.setattr(ocr, 'get_ocr_reader', lambda: reader)
+    details = ocr.try_ocr_detailed(receipt, cascade=True, max_passes=2)
+    assert reader.calls == 2
+    assert details['winner'] is None
+
+
+def test_full_mode_runs_every_strategy(receipt, monkeypatch):
+    reader = FakeReader([["TOTAL 99.00"]])
+    monkeypatch.setattr(ocr, 'get_ocr_reader', lambda: reader)
+    details = ocr.try_ocr_detailed(receipt, cascade=False)
+    assert reader.calls == len(ocr.OCR_STRATEGIES)
+    assert details['strategies_run'] == [name for name, _, _ in ocr.OCR_STRATEGIES]
+
+
+def test_stats_reorder_strategies(tmp_path):
+    stats = ocr.StrategyStats(str(tmp_path / 'stats.json'))
+    for _ in range(3):
+        stats.record(['enhanced', 'grayscale', 'binary'], 'binary')
+    names = [name for name, _, _ in ocr.OCR_STRATEGIES]
+    assert stats.order(names)[0] == 'binary'
+    # a fresh instance picks the counts up from disk
+    assert ocr.StrategyStats(str(tmp_path / 'stats.json')).order(names)[0] == 'binary'
+
+
+def _record_many(path, times):
+    stats = ocr.StrategyStats(path)
+    for _ in range(times):
+        stats.record(['enhanced'], 'enhanced')
+
+
+def test_stats_writers_in_several_processes_add_up(tmp_path):
+    path = str(tmp_path / 'stats.json')
+    ctx = multiprocessing.get_context('fork')
+    procs = [ctx.Process(target=_record_many, args=(path, 50)) for _ in range(3)]
+    for proc in procs:
+        proc.start()
+    for proc in procs:
+        proc.join(30)
+    assert ocr.StrategyStats(path).snapshot()['enhanced']['runs'] == 150
+
+
+class SlowReader:
+    """Sleeps per call like a real inference; thread-safe call counting"""
+    def __init__(self, delay, segments):
+        self.delay = delay
+        self.segments = segments
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def readtext(self, image, detail=0, paragraph=False):
+        with self.lock:
+            self.calls += 1
+        time.sleep(self.delay)
+        return list(self.segments)
+
+
+def test_parallel_passes_cut_wall_clock(receipt, monkeypatch):
+    reader = SlowReader(0.2, ["no amount"])
+    monkeypatch.setattr(ocr, 'get_ocr_reader', lambda: reader)
+    monkeypatch.setattr(ocr, '_variant_pool', None)
+    monkeypatch.setattr(ocr, 'OCR_PARALLEL', len(ocr.OCR_STRATEGIES))
+    started = time.monotonic()
+    details = ocr.try_ocr_detailed(receipt, cascade=False, parallel=len(ocr.OCR_STRATEGIES))
+    elapsed = time.monotonic() - started
+    assert reader.calls == len(ocr.OCR_STRATEGIES)
+    assert details['strategies_run'] == [name for name, _, _ in ocr.OCR_STRATEGIES]
+    assert elapsed < 0.2 * len(ocr.OCR_STRATEGIES) / 2
+
+
+def test_parallel_cascade_matches_sequential(receipt, monkeypatch):
+    # The first pass misses; the rest run as one wave but are examined in order
+    per_strategy = {'enhanced': ["nothing"], 'grayscale': ["Total 450.00"], 'original': ["Paid 999"]}
+
+    class ByImage:
+        def readtext(self, image, detail=0, paragraph=False):
+            return per_strategy.get(image_names[id(image)], [])
+
+    image_names = {}
+
+    def tagged(name, fn):
+        def run(img, gray):
+            out = fn(img, gray).copy()
+            image_names[id(out)] = name
+            return out
+        return run
+
+    monkeypatch.setattr(ocr, 'OCR_STRATEGIES', [(n, d, tagged(n, f)) for n, d, f in ocr.OCR_STRATEGIES])
+    monkeypatch.setattr(ocr, 'get_ocr_reader', lambda: ByImage())
+    sequential = ocr.try_ocr_detailed(receipt, cascade=True, parallel=1)
+    parallel = ocr.try_ocr_detailed(receipt, cascade=True, parallel=4)
+    for key in ('text', 'strategies_run', 'winner'):
+        assert sequential[key] == parallel[key]
+    assert parallel['strategies_run'] == ['enhanced', 'grayscale']
+    assert parallel['winner'] == 'grayscale'
+
+
+def test_parallel_cascade_stops_submitting_after_a_hit(receipt, monkeypatch):
+    reads = []
+    lock = threading.Lock()
+
+    class ByImage:
+        def readtext(self, image, detail=0, paragraph=False):
+            name = image_names[id(image)]
+            with lock:
+                reads.append(name)
+            time.sleep(0.05)
+            return ["Total 450.00"] if name == 'grayscale' else ["nothing"]
+
+    image_names = {}
+
+    def tagged(name, fn):
+        def run(img, gray):
+            out = fn(img, gray).copy()
+            image_names[id(out)] = name
+            return out
+        return run
+
+    monkeypatch.setattr(ocr, 'OCR_STRATEGIES', [(n, d, tagged(n, f)) for n, d, f in ocr.OCR_STRATEGIES])
+    monkeypatch.setattr(ocr, 'get_ocr_reader', lambda: ByImage())
+    monkeypatch.setattr(ocr, '_variant_pool', None)
+    details = ocr.try_ocr_detailed(receipt, cascade=True, parallel=2)
+    assert details['winner'] == 'grayscale'
+    # enhanced alone, then at most grayscale and original in flight; the hit stops inverted and binary
+    assert reads[:2] == ['enhanced', 'grayscale'] or sorted(reads[1:3]) == ['grayscale', 'original']
+    assert not {'inverted', 'binary'} & set(reads)
@@ -0,0 +1,78 @@
+"""
+Test the background OCR job queue (runs jobs on threads with a fake OCR)
+"""
+import threading, time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import ocr
+from ocr_jobs import OCRJobQueue, QueueFull
+from job_store import JobStore
+
+
+def fake_ocr(text):
+    return lambda path: {"text": text, "strategies_run": [], "winner": None}
+
+
+def wait_for(queue, job_id, timeout=5, owner=None):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = queue.get(job_id, owner=owner)
+        if job['status'] in ('done', 'failed'):
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+def test_job_runs_and_reports_result(monkeypatch):
+    monkeypatch.setattr(ocr, 'try_ocr_detailed', fake_ocr("TOTAL: Rs. 450.00"))
+    queue = OCRJobQueue(max_pending=2, executor=ThreadPoolExecutor(1))
+    job_id = queue.submit('receipt.jpg', on_done=lambda res: {"amount": res['amounts'][0]})
+    job = wait_for(queue, job_id)
+    assert job['status'] == 'done'
+    assert job['result'] == {"amount": 450.0}
+    assert set(job['timing']) == {'queue_seconds', 'ocr_seconds', 'extract_seconds', 'total_seconds'}
+
+
+def test_queue_full_raises(monkeypatch):
+    release = threading.Event()
+    monkeypatch.setattr(ocr, 'try_ocr_detailed', lambda path: release.wait(5) and fake_ocr("")(path))
+    queue = OCRJobQueue(max_pending=1, executor=ThreadPoolExecutor(1))
+    first = queue.submit('a.jpg')
+    with pytest.raises(QueueFull):
+        queue.submit('b.jpg')
+    release.set()
+    wait_for(queue, first)
+    queue.submit('c.jpg')  # capacity is back once the first job is done
+
+
+def test_failed_callback_marks_job_failed(monkeypatch):
+    monkeypatch.setattr(ocr, 'try_ocr_detailed', fake_ocr(""))
+
+    def boom(res):
+        raise ValueError("storage unavailable")
+
+    queue = OCRJobQueue(executor=ThreadPoolExecutor(1))
+    job = wait_for(queue, queue.submit('a.jpg', on_done=boom))
+    assert job['status'] == 'failed'
+    assert job['error'] == "storage unavailable"
+
+
+def test_unknown_job():
+    assert OCRJobQueue(executor=ThreadPoolExecutor(1)).get('missing') is None
+
+
+def test_jobs_visible_to_other_processes_through_the_store(monkeypatch, tmp_path):
+    # Two queues on one JobStore stand in for two server workers
+    monkeypatch.setattr(ocr, 'try_ocr_detailed', fake_ocr("TOTAL: Rs. 450.00"))
+    store = JobStore(str(tmp_path))
+    submitting = OCRJobQueue(executor=ThreadPoolExecutor(1), store=store)
+    polling = OCRJobQueue(executor=ThreadPoolExecutor(1), store=store)
+    job_id = submitting.submit('a.jpg', owner=7, on_done=lambda res: {"amount": res['amounts'][0]})
+    wait_for(submitting, job_id, owner=7)
+    job = polling.get(job_id, owner=7)
+    assert job['status'] == 'done'
+    assert job['result'] == {"amount": 450.0}
+    assert polling.get(job_id, owner=8) is None
+    assert polling.get('../secret', owner=7) is None
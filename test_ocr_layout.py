@@ -0,0 +1,78 @@
+"""
+Test merging OCR passes by detection box and rebuilding ordered lines
+"""
+import cv2
+import numpy as np
+import pytest
+
+import extraction
+import ocr
+import ocr_backends
+import ocr_layout
+
+
+def box(x0, y0, x1, y1):
+    return [[x0, y0], [x1, y0], [x1, y1], [x0, y1]]
+
+
+# Two passes over a three-line receipt; each reads the lines a little differently
+PASS_A = [(box(10, 10, 120, 30), 'Coffee House', 0.95),
+          (box(10, 50, 60, 70), 'T0TAL', 0.40),
+          (box(150, 52, 230, 70), '1,250.00', 0.90),
+          (box(10, 90, 80, 110), 'Cash', 0.80)]
+PASS_B = [(box(12, 11, 121, 31), 'Coffee Hause', 0.60),
+          (box(11, 49, 61, 69), 'TOTAL', 0.97),
+          (box(70, 51, 140, 71), '(incl. GST)', 0.85),
+          (box(151, 51, 229, 71), '1,250.00', 0.88)]
+
+
+def test_iou():
+    assert ocr_layout.iou((0, 0, 10, 10), (0, 0, 10, 10)) == 1.0
+    assert ocr_layout.iou((0, 0, 10, 10), (5, 0, 15, 10)) == pytest.approx(1 / 3)
+    assert ocr_layout.iou((0, 0, 10, 10), (20, 20, 30, 30)) == 0.0
+
+
+def test_merge_keeps_best_reading_per_region():
+    segments = ocr_layout.from_readtext(PASS_A, 'a') + ocr_layout.from_readtext(PASS_B, 'b')
+    text, lines = ocr_layout.document(segments)
+    assert text == 'Coffee House\nTOTAL (incl. GST) 1,250.00\nCash'
+    assert [seg.strategy for seg in lines[1]] == ['b', 'b', 'a']
+    assert sum(len(line) for line in lines) == 5  # of 8 segments read
+
+
+def test_plain_string_results_are_deduplicated():
+    segments = ocr_layout.from_readtext(['TOTAL 99.00', ' ', 'Cash']) + ocr_layout.from_readtext(['TOTAL 99.00'])
+    assert ocr_layout.document(segments)[0] == 'TOTAL 99.00\nCash'
+
+
+def test_layout_amount_at_end_of_keyword_line():
+    text, _ = extraction.normalize('Coffee House\nTOTAL (incl. GST) 1,250.00\nCash 2,000.00\nTotal items 3')
+    assert extraction.extract_normalized(text) == [(2000.0, 0), (1250.0, 0), (250.0, 0)]
+    assert extraction.extract_normalized(text, layout=True) == [(1250.0, 100 - extraction.LAYOUT_PENALTY)]
+    # A direct "KEYWORD amount" match on the line wins over the layout rule
+    text, _ = extraction.normalize('TOTAL 1,100.00 (incl. GST) 1,250.00')
+    assert extraction.extract_normalized(text, layout=True) == [(1100.0, 100)]
+
+
+class BoxReader:
+    def __init__(self, passes):
+        self.passes = list(passes)
+
+    def readtext(self, image, detail=0, paragraph=False):
+        assert detail == 1
+        return self.passes.pop(0) if self.passes else []
+
+
+def test_try_ocr_merges_passes(tmp_path, monkeypatch):
+    path = tmp_path / 'receipt.png'
+    cv2.imwrite(str(path), np.full((40, 80, 3), 255, dtype=np.uint8))
+    monkeypatch.setattr(ocr_backends, 'OCR_FAST_BACKEND', 'none')
+    monkeypatch.setattr(ocr, 'strategy_stats', ocr.StrategyStats(str(tmp_path / 'stats.json')))
+    monkeypatch.setattr(ocr, 'get_ocr_reader', lambda: BoxReader([PASS_A, PASS_B]))
+    details = ocr.try_ocr_detailed(str(path), cascade=True, parallel=1)
+    # The first pass has no keyword-backed amount (T0TAL), the merged second one does
+    assert details['strategies_run'] == [name for name, _, _ in ocr.OCR_STRATEGIES][:2]
+    assert details['winner'] == details['strategies_run'][1]
+    assert details['segments'] == {"read": 8, "kept": 5}
+    assert details['text'].splitlines()[1] == 'TOTAL (incl. GST) 1,250.00'
+    assert ocr.extract_scored_amounts(details['text'])[0] == (1250.0, 95)
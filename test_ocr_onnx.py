@@ -0,0 +1,44 @@
+"""
+Test the ONNX engine's accuracy check with stand-in readers
+"""
+import os
+
+import pytest
+
+import ocr_onnx
+
+
+class ConstantReader:
+    """Reads the same text from every image"""
+    def __init__(self, text):
+        self.text = text
+
+    def readtext(self, image, detail=1, paragraph=False):
+        return [([[0, 0], [200, 0], [200, 30], [0, 30]], self.text, 0.9)]
+
+
+def test_check_receipts_cover_fixtures():
+    receipts = ocr_onnx.check_receipts()
+    assert len(receipts) > 3  # the synthetic receipts plus drawable fixtures
+    assert receipts[0][1] == 155.0
+    assert all(img.ndim == 3 for img, _ in receipts)
+
+
+def test_evaluate_and_regressions():
+    receipts = ocr_onnx.check_receipts()[:3]
+    stock = ocr_onnx.evaluate(ConstantReader('GRAND TOTAL 155.00'), receipts, repeat=1)
+    assert stock['amounts'] == [155.0] * 3
+    assert stock['correct'] == 1
+    assert stock['p50_ms'] is not None
+    same = ocr_onnx.evaluate(ConstantReader('Grand Total 155.00'), receipts, repeat=1)
+    worse = ocr_onnx.evaluate(ConstantReader('GRAND TOTAL 185.00'), receipts, repeat=1)
+    assert ocr_onnx.regressions(stock, same) == []
+    assert ocr_onnx.regressions(stock, worse) == [0, 1, 2]
+
+
+def test_attach_requires_exported_models(tmp_path):
+    with pytest.raises(ValueError):
+        ocr_onnx.attach(object(), str(tmp_path), precision='int4')
+    with pytest.raises(OSError):
+        ocr_onnx.attach(object(), str(tmp_path))
+    assert ocr_onnx.model_path('m', 'detector', 'int8') == os.path.join('m', 'detector.int8.onnx')
@@ -0,0 +1,118 @@
+"""
+Test PDF receipts: text layer first, rendered pages through OCR otherwise
+"""
+import threading
+
+import cv2
+import numpy as np
+import pytest
+
+pymupdf = pytest.importorskip("pymupdf")
+
+import ocr
+import ocr_backends
+import ocr_pdf
+
+
+def text_pdf(lines):
+    doc = pymupdf.open()
+    page = doc.new_page()
+    for i, line in enumerate(lines):
+        page.insert_text((72, 72 + 20 * i), line)
+    return doc.tobytes()
+
+
+def scanned_pdf(pages):
+    """Image-only pages - no text layer"""
+    doc = pymupdf.open()
+    img = np.full((200, 300, 3), 255, dtype=np.uint8)
+    cv2.putText(img, 'TOTAL 42.00', (10, 100), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (0, 0, 0), 2)
+    png = cv2.imencode('.png', img)[1].tobytes()
+    for _ in range(pages):
+        page = doc.new_page(width=300, height=200)
+        page.insert_image(page.rect, stream=png)
+    return doc.tobytes()
+
+
+class PageReader:
+    def __init__(self):
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def readtext(self, image, detail=0, paragraph=False):
+        with self.lock:
+            self.calls += 1
+        return ["TOTAL 42.00"]
+
+
+@pytest.fixture
+def reader(tmp_path, monkeypatch):
+    reader = PageReader()
+    monkeypatch.setattr(ocr, 'get_ocr_reader', lambda: reader)
+    monkeypatch.setattr(ocr_backends, 'OCR_FAST_BACKEND', 'none')
+    monkeypatch.setattr(ocr, 'strategy_stats', ocr.StrategyStats(str(tmp_path / 'stats.json')))
+    return reader
+
+
+def test_text_layer_skips_ocr(reader):
+    data = text_pdf(['Coffee House', 'Grand Total: Rs. 1,250.50'])
+    assert ocr_pdf.is_pdf(data)
+    details = ocr.try_ocr_detailed(data)
+    assert reader.calls == 0
+    assert details['pdf']['text_layer'] is True
+    assert ocr.is_cacheable(details)
+    assert ocr.extract_amounts_from_text(details['text'])[0] == 1250.5
+
+
+def test_text_layer_keeps_lines():
+    doc = pymupdf.open(stream=text_pdf(['Coffee   House', 'Grand Total: Rs. 1,250.50']), filetype='pdf')
+    assert ocr_pdf.text_layer(doc, 1) == 'Coffee House\nGrand Total: Rs. 1,250.50'
+
+
+def test_scanned_pages_are_rendered_and_ocrd(reader):
+    details = ocr.try_ocr_detailed(scanned_pdf(3), cascade=True)
+    assert details['pdf']['text_layer'] is False
+    assert details['pdf']['pages_processed'] == 3
+    assert reader.calls == 3  # one cascade pass per page
+    assert details['winner'] is not None
+    assert ocr.extract_amounts_from_text(details['text'])[0] == 42.0
+
+
+def test_page_and_time_limits(reader):
+    seen = []
+    details = ocr_pdf.ocr_pdf(scanned_pdf(5), lambda img: seen.append(img.shape) or
+                              {"text": "", "strategies_run": [], "winner": None}, max_pages=2)
+    assert len(seen) == 2
+    assert details['pdf']['truncated'] and details['pdf']['pages'] == 5
+
+    details = ocr_pdf.ocr_pdf(scanned_pdf(5), lambda img: {"text": "", "strategies_run": [], "winner": None},
+                              time_limit=0)
+    assert details['pdf']['truncated'] and details['pdf']['pages_processed'] == 0
+
+
+def test_render_page_dpi():
+    doc = pymupdf.open(stream=scanned_pdf(1), filetype='pdf')
+    img = ocr_pdf.render_page(doc, 0, dpi=144)
+    assert img.shape == (400, 600, 3) and img.dtype == np.uint8
+
+
+def test_render_page_pixel_cap(monkeypatch):
+    doc = pymupdf.open()
+    doc.new_page(width=72 * 40, height=72 * 40)  # 40 x 40 inches
+    doc = pymupdf.open(stream=doc.tobytes(), filetype='pdf')
+    monkeypatch.setattr(ocr_pdf, 'PDF_MAX_PIXELS', 1_000_000)
+    assert ocr_pdf.page_dpi(doc[0]) == 25
+    img = ocr_pdf.render_page(doc, 0)
+    assert img.shape[0] * img.shape[1] <= 1_000_000
+
+
+def test_failed_page_cancels_pending_pages(reader):
+    started = []
+
+    def ocr_page(img):
+        started.append(1)
+        raise RuntimeError("boom")
+
+    details = ocr_pdf.ocr_pdf(scanned_pdf(8), ocr_page)
+    assert details['pdf']['pages_processed'] == 0
+    assert len(started) < 8
@@ -0,0 +1,55 @@
+"""
+Test resolution normalisation and receipt cropping before OCR
+"""
+import cv2
+import numpy as np
+
+import ocr_preprocess
+
+
+def photo_of_receipt():
+    """A 2400x1800 'photo': dark table, white receipt, ~70px tall text"""
+    img = np.full((2400, 1800, 3), 60, dtype=np.uint8)
+    cv2.rectangle(img, (500, 300), (1300, 2100), (245, 245, 245), -1)
+    for i, line in enumerate(['STORE 42', 'MILK 45.00', 'BREAD 30.00', 'EGGS 60.00', 'TOTAL 135.00']):
+        cv2.putText(img, line, (540, 450 + i * 250), cv2.FONT_HERSHEY_SIMPLEX, 2.2, (0, 0, 0), 5)
+    return img
+
+
+def test_prepare_crops_and_downscales():
+    img, report = ocr_preprocess.prepare(photo_of_receipt(), keyword_roi=False)
+    x, y, w, h = report['crop']
+    assert 400 <= x <= 520 and 200 <= y <= 320
+    assert 780 <= w <= 1000 and 1750 <= h <= 2000
+    assert report['scale'] < 1.0
+    assert report['pixels_processed'] == img.shape[0] * img.shape[1]
+    assert report['pixel_ratio'] < 0.25
+    assert report['original_pixels'] == 2400 * 1800
+
+
+def test_small_clean_image_is_left_alone():
+    img = np.full((200, 400, 3), 255, dtype=np.uint8)
+    cv2.putText(img, 'TOTAL 99.00', (10, 100), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 0), 1)
+    out, report = ocr_preprocess.prepare(img, keyword_roi=False)
+    assert out.shape == img.shape
+    assert report['crop'] is None and report['scale'] == 1.0
+
+
+def test_keyword_bands_from_cheap_pass():
+    calls = []
+
+    def readtext(image, detail=0, paragraph=False):
+        calls.append(image.shape)
+        # One keyword box at y 100-120 of the pass image, one unrelated line
+        return [([[0, 100], [50, 100], [50, 120], [0, 120]], 'Grand Total', 0.9),
+                ([[0, 10], [50, 10], [50, 30], [0, 30]], 'Coffee House', 0.9)]
+
+    img = np.full((400, 300, 3), 255, dtype=np.uint8)
+    out, report = ocr_preprocess.prepare(img, readtext=readtext, crop=False, keyword_roi=True)
+    assert calls and report['keyword_bands'] == [[80, 180]]
+    assert out.shape[:2] == (100, 300)
+
+
+def test_estimate_seconds_saved():
+    report = {"pixel_ratio": 0.25, "seconds": 0.05}
+    assert ocr_preprocess.estimate_seconds_saved(report, 1.0) == 2.95
@@ -0,0 +1,106 @@
+"""
+Test batch predictions against the single-amount path
+"""
+import os
+
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.linear_model import LinearRegression
+
+import prediction
+from model_registry import ModelRegistry
+from storage import Storage
+
+
+def scalar_reference(amount, reg, clf, version='heuristic'):
+    """The pre-batch predict_from_amount() logic, one model call per amount"""
+    annual = float(reg.predict([[amount]])[0]) if reg is not None else amount * 365
+    if clf is not None:
+        prob = float(clf.predict_proba([[amount, annual]])[0][1])
+    else:
+        prob = min(1.0, annual / 100000.0)
+    savings = max(0.0, 100000.0 - annual)
+    return {
+        "predicted_annual_expense": round(annual, 2),
+        "predicted_annual_savings": round(savings, 2),
+        "distress_probability": round(prob, 3),
+        "advice": prediction.generate_advice(annual, savings, prob),
+        "model_version": version,
+    }
+
+
+@pytest.fixture
+def models():
+    rng = np.random.RandomState(0)
+    daily = rng.gamma(2.0, 200.0, 300)
+    annual = daily * 365 + rng.normal(0, 2000, size=daily.shape)
+    reg = LinearRegression().fit(daily.reshape(-1, 1), annual)
+    clf = RandomForestClassifier(n_estimators=10, random_state=0).fit(
+        np.column_stack([daily, annual]), (annual > 80000).astype(int))
+    return reg, clf
+
+
+AMOUNTS = [12.5, 122.0, 1000.0, 1750.0, 50000.0]
+
+
+@pytest.fixture(autouse=True)
+def inline(monkeypatch):
+    # Predict in this process so the tests' registries are the ones used
+    monkeypatch.setattr(prediction, 'PREDICT_EXECUTOR', 'inline')
+
+
+@pytest.fixture
+def no_models(tmp_path, monkeypatch):
+    monkeypatch.setattr(prediction, 'registry', ModelRegistry(str(tmp_path / 'models')))
+
+
+def test_batch_matches_scalar_with_models(models, tmp_path, monkeypatch):
+    reg, clf = models
+    registry = ModelRegistry(str(tmp_path / 'models'))
+    registry.publish(reg, clf, version='v1')
+    monkeypatch.setattr(prediction, 'registry', registry)
+    expected = [scalar_reference(a, reg, clf, 'v1') for a in AMOUNTS]
+    assert prediction.predict_from_amounts(np.array(AMOUNTS)) == expected
+
+
+class BrokenClassifier:
+    def predict_proba(self, features):
+        raise ValueError("bad model")
+
+
+def test_version_names_the_heuristic_part(models, tmp_path, monkeypatch):
+    reg, _ = models
+    registry = ModelRegistry(str(tmp_path / 'models'))
+    registry.publish(reg, BrokenClassifier(), version='v2')
+    monkeypatch.setattr(prediction, 'registry', registry)
+    expected = scalar_reference(122.0, reg, None, 'v2+heuristic')
+    assert prediction.predict_from_amount(122.0) == expected
+
+
+def test_batch_heuristic_without_models(no_models):
+    assert prediction.predict_from_amounts(AMOUNTS) == [scalar_reference(a, None, None) for a in AMOUNTS]
+    assert prediction.predict_from_amount(122.0) == scalar_reference(122.0, None, None)
+    assert prediction.predict_from_amounts([]) == []
+
+
+def test_rescore_history(tmp_path, no_models):
+    storage = Storage(f"sqlite:///{tmp_path / 'test.db'}")
+    storage.add_entries([
+        {"date": "2025-10-08", "amount": 100.0, "predicted_annual_expense": 1.0, "model_version": "old"},
+        {"date": "2025-10-08", "filename": "unreadable.jpg"},
+    ])
+    assert prediction.rescore_history(storage) == 1
+    entry = next(storage.iter_entries())
+    assert entry['predicted_annual_expense'] == 36500.0
+    assert entry['model_version'] == 'heuristic'
+
+
+def test_predictions_in_worker_process(monkeypatch):
+    monkeypatch.setattr(prediction, 'PREDICT_EXECUTOR', 'process')
+    monkeypatch.setattr(prediction, 'registry', ModelRegistry('/nonexistent'))
+    assert prediction.predict_from_amounts(np.array([122.0, 12.5])) == [
+        scalar_reference(122.0, None, None), scalar_reference(12.5, None, None)]
+    info = prediction.warm_up()
+    assert info['executor'] == 'process' and info['pid'] != os.getpid()
+    assert prediction.model_status()['version'] is None
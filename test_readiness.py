@@ -0,0 +1,39 @@
+"""
+Test start-up readiness tracking
+"""
+from readiness import Readiness
+
+
+def test_ready_once_all_components_settle():
+    readiness = Readiness(['storage', 'models', 'ocr'])
+    assert not readiness.is_ready()
+    readiness.run('storage', lambda: {"entries": 3})
+    readiness.run('models', lambda: {"available": False})  # heuristics still serve
+    assert not readiness.is_ready()
+    readiness.start_background([('ocr', lambda: None)]).join(5)
+    snapshot = readiness.snapshot()
+    assert snapshot['ready']
+    assert snapshot['components']['models']['state'] == 'unavailable'
+    assert snapshot['components']['storage']['details'] == {"entries": 3}
+    assert snapshot['components']['ocr']['seconds'] is not None
+
+
+def test_failed_component_blocks_readiness_only_if_required():
+    readiness = Readiness(['storage', 'ocr'], required=['storage'])
+
+    def boom():
+        raise RuntimeError("load failed")
+
+    readiness.run('ocr', boom)  # uploads fall back to manual entry
+    readiness.run('storage', boom)
+    snapshot = readiness.snapshot()
+    assert not snapshot['ready']
+    assert snapshot['components']['ocr'] == dict(snapshot['components']['ocr'], state='failed', error="load failed")
+    readiness.run('storage', lambda: {"entries": 0})  # a retry succeeds
+    assert readiness.is_ready()
+
+
+def test_deferred_counts_as_ready():
+    readiness = Readiness(['ocr'])
+    readiness.defer('ocr')
+    assert readiness.is_ready()
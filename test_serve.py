@@ -0,0 +1,84 @@
+"""
+Test the pre-fork server end to end: workers answer, SIGHUP replaces them, SIGTERM stops it
+"""
+import io, os, sys, json, time, signal, socket, subprocess, urllib.request
+
+import serve
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def children(pid):
+    found = []
+    for name in os.listdir('/proc'):
+        if name.isdigit():
+            try:
+                with open(f'/proc/{name}/stat') as f:
+                    if int(f.read().rsplit(')', 1)[1].split()[1]) == pid:
+                        found.append(int(name))
+            except (OSError, IndexError, ValueError):
+                pass
+    return sorted(found)
+
+
+def wait_until(check, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            result = check()
+            if result:
+                return result
+        except OSError:
+            pass
+        time.sleep(0.1)
+    raise AssertionError("timed out")
+
+
+def test_listen_is_non_blocking():
+    listener = serve.listen('127.0.0.1:0')
+    try:
+        assert listener.gettimeout() == 0.0
+    finally:
+        listener.close()
+
+
+def test_request_body_reads_beat_the_heartbeat():
+    beats = []
+    body = serve._BeatingInput(io.BytesIO(b'line one\nline two\n'), lambda: beats.append(1))
+    assert body.readline() == b'line one\n'
+    buffer = bytearray(4)
+    assert body.readinto(buffer) == 4 and bytes(buffer) == b'line'
+    assert body.read() == b' two\n'
+    assert len(beats) == 3
+
+
+def test_prefork_workers_restart_and_stop(tmp_path):
+    port = free_port()
+    env = dict(os.environ, PYTHONPATH=HERE, LOG_LEVEL='WARNING', APP_WARMUP='0', MODEL_DIR=str(tmp_path / 'models'),
+               DATABASE_URL=f"sqlite:///{tmp_path / 'serve.db'}", OCR_CACHE_DIR=str(tmp_path / 'ocr_cache'),
+               OCR_STATS_FILE=str(tmp_path / 'stats.json'), OCR_TIER_STATS_FILE=str(tmp_path / 'tiers.json'),
+               JOB_STATE_DIR=str(tmp_path / 'jobs'))
+    proc = subprocess.Popen([sys.executable, os.path.join(HERE, 'serve.py'), '--bind', f'127.0.0.1:{port}',
+                             '--workers', '2', '--graceful-timeout', '5'], cwd=tmp_path, env=env)
+    url = f'http://127.0.0.1:{port}'
+    try:
+        wait_until(lambda: urllib.request.urlopen(f'{url}/healthz', timeout=2).status == 200)
+        old = wait_until(lambda: len(children(proc.pid)) == 2 and children(proc.pid))
+        request = urllib.request.Request(f'{url}/predict/batch', data=json.dumps({"amounts": [100]}).encode(),
+                                         headers={'Content-Type': 'application/json'})
+        assert len(json.load(urllib.request.urlopen(request, timeout=5))['predictions']) == 1
+        proc.send_signal(signal.SIGHUP)
+        new = wait_until(lambda: (lambda pids: len(pids) == 2 and not set(pids) & set(old) and pids)(children(proc.pid)))
+        assert urllib.request.urlopen(f'{url}/', timeout=5).status == 200
+        proc.send_signal(signal.SIGTERM)
+        assert proc.wait(timeout=15) == 0
+        assert not any(os.path.exists(f'/proc/{pid}') for pid in new)
+    finally:
+        if proc.poll() is None:
+            proc.kill()
@@ -0,0 +1,144 @@
+"""
+Test the SQLite entry storage and the data.json migration
+"""
+import json
+
+import pytest
+
+import storage as storage_module
+from storage import Storage, QuotaExceeded, daily_agg
+
+
+@pytest.fixture
+def storage(tmp_path):
+    return Storage(f"sqlite:///{tmp_path / 'test.db'}")
+
+
+def test_add_and_query(storage):
+    storage.add_entry({"date": "2025-10-08", "amount": 50.0, "category": "food", "source": "manual"})
+    storage.add_entry({"date": "2025-10-08", "filename": "r.jpg", "extracted_amount": None, "ocr_text": ""})
+    storage.add_entry({"date": "2025-10-31", "amount": 20.0, "category": "bus"})
+    storage.add_entry({"date": "2025-11-01", "amount": 5.0, "category": "food"})
+
+    todays = storage.entries_on("2025-10-08")
+    assert len(todays) == 2
+    assert 'extracted_amount' not in todays[1]  # NULL columns are left out of the dict
+    assert todays[1].get('category', 'Misc') == 'Misc'
+    assert storage.month_total("2025-10-15") == 70.0
+    assert storage.category_totals() == {"food": 55.0, "Misc": 0.0, "bus": 20.0}
+    assert storage.latest()['date'] == "2025-11-01"
+    assert [e['amount'] for e in storage.recent(2)] == [5.0, 20.0]
+    assert storage.amount_stats() == (3, 25.0)
+
+
+def test_unknown_keys_round_trip(storage):
+    storage.add_entry({"date": "2025-10-08", "amount": 1.0, "note": "from import"})
+    assert storage.latest()['note'] == "from import"
+
+
+def test_migrate_from_json_once(storage, tmp_path):
+    legacy = [
+        {"date": "2025-08-13", "filename": "22.jpg", "extracted_amount": None, "ocr_text": ""},
+        {"date": "2025-08-13", "amount": 1000.0, "category": "bill", "source": "manual",
+         "predicted_annual_expense": 365000.0, "distress_probability": 1.0, "advice": "..."},
+    ]
+    path = tmp_path / 'data.json'
+    path.write_text(json.dumps(legacy))
+    assert storage.migrate_from_json(str(path)) == 2
+    assert storage.migrate_from_json(str(path)) == 0
+    assert storage.count() == 2
+    assert list(storage.iter_entries(batch_size=1))[1]['predicted_annual_expense'] == 365000.0
+
+
+def test_aggregates_track_inserts_and_rebuild(storage):
+    storage.add_entries([
+        {"date": "2025-10-08", "amount": 50.0, "category": "food"},
+        {"date": "2025-10-08", "amount": 25.0, "category": "bus"},
+        {"date": "2025-10-09", "filename": "r.jpg"},
+    ])
+    storage.add_entry({"date": "2025-10-09", "amount": 5.0, "category": "food"})
+    assert storage.day_total("2025-10-08") == 75.0
+    assert storage.day_total("2025-10-10") == 0.0
+    assert storage.month_total("2025-10-01") == 80.0
+    assert storage.category_totals() == {"food": 55.0, "bus": 25.0, "Misc": 0.0}
+    assert storage.amount_stats() == (3, 80.0 / 3)
+    assert storage.aggregates_consistent()
+
+    with storage.engine.begin() as conn:
+        conn.execute(daily_agg.delete())
+    assert not storage.aggregates_consistent()
+    storage.ensure_aggregates()
+    assert storage.day_total("2025-10-08") == 75.0
+
+
+def test_history_keyset_pages(storage):
+    storage.add_entries([{"date": f"2025-10-{day:02d}", "amount": float(day)} for day in (3, 1, 2, 2, 5)])
+    seen, cursor = [], None
+    while True:
+        page, cursor = storage.history(2, cursor)
+        seen.extend((e['date'], e['id']) for e in page)
+        if cursor is None:
+            break
+    assert seen == sorted(seen, reverse=True)
+    assert [d for d, _ in seen] == ["2025-10-05", "2025-10-03", "2025-10-02", "2025-10-02", "2025-10-01"]
+    assert storage.history(10) == (storage.history(10)[0], None)
+    with pytest.raises(ValueError):
+        storage.history(2, 'not-a-cursor')
+
+
+def test_users_are_partitioned(storage):
+    alice = storage.create_user("alice", "hash-a")
+    bob = storage.create_user("bob", "hash-b")
+    with pytest.raises(ValueError):
+        storage.create_user("alice", "again")
+    storage.add_entry({"date": "2025-10-08", "amount": 50.0, "category": "food"}, user=alice)
+    storage.add_entries([{"date": "2025-10-08", "amount": 7.0, "category": "bus"},
+                         {"date": "2025-10-09", "amount": 3.0, "category": "food"}], user=bob)
+    storage.add_entry({"date": "2025-10-08", "amount": 1.0})  # anonymous / default user
+
+    assert storage.day_total("2025-10-08", user=alice) == 50.0
+    assert storage.day_total("2025-10-08", user=bob) == 7.0
+    assert storage.category_totals(user=bob) == {"bus": 7.0, "food": 3.0}
+    assert storage.amount_stats(user=alice) == (1, 50.0)
+    assert storage.latest(user=alice)['amount'] == 50.0
+    assert [e['amount'] for e in storage.history(10, user=bob)[0]] == [3.0, 7.0]
+    assert storage.count(user=bob) == 2 and storage.count() == 4
+    assert storage.get_user(username="bob")['id'] == bob
+    storage.rebuild_aggregates()
+    assert storage.month_total("2025-10-01", user=bob) == 10.0
+    assert storage.month_total("2025-10-01") == 1.0
+
+
+def test_quotas(storage, monkeypatch):
+    monkeypatch.setattr(storage_module, 'USER_OCR_TEXT_QUOTA', 10)
+    storage.add_entries([{"date": "2025-10-08", "ocr_text": "TOTAL 120"},
+                         {"date": "2025-10-08", "ocr_text": "GRAND TOTAL 99"}], user=5)
+    texts = [e.get('ocr_text') for e in storage.iter_entries(user=5)]
+    assert texts == ["TOTAL 120", "G"]
+    assert storage.usage(5)['ocr_text_chars'] == 10
+    storage.record_upload(5, 600, quota=1000)
+    with pytest.raises(QuotaExceeded):
+        storage.record_upload(5, 600, quota=1000)
+    assert storage.usage(5)['uploads'] == 1
+    storage.release_upload(5, 600)
+    assert (storage.usage(5)['upload_bytes'], storage.usage(5)['uploads']) == (0, 0)
+    assert storage.usage(6) == {'ocr_text_chars': 0, 'upload_bytes': 0, 'uploads': 0}
+
+
+def test_upgrades_single_user_database(tmp_path):
+    from sqlalchemy import create_engine, text
+    path = tmp_path / 'old.db'
+    engine = create_engine(f"sqlite:///{path}")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE entries (id INTEGER PRIMARY KEY, date VARCHAR(10) NOT NULL, amount FLOAT, "
+                          "extracted_amount FLOAT, category VARCHAR(100), source VARCHAR(20), filename VARCHAR(255), "
+                          "ocr_text TEXT, all_detected_amounts JSON, predicted_annual_expense FLOAT, "
+                          "predicted_annual_savings FLOAT, distress_probability FLOAT, advice TEXT, extra JSON)"))
+        conn.execute(text("CREATE INDEX ix_entries_date ON entries (date)"))
+        conn.execute(text("CREATE TABLE daily_totals (date VARCHAR(10) PRIMARY KEY, total FLOAT)"))
+        conn.execute(text("INSERT INTO entries (date, amount, category) VALUES ('2025-10-08', 12.0, 'food')"))
+    engine.dispose()
+    storage = Storage(f"sqlite:///{path}")
+    assert storage.day_total("2025-10-08") == 12.0
+    assert storage.category_totals() == {"food": 12.0}
+    assert storage.aggregates_consistent()
@@ -0,0 +1,76 @@
+"""
+Test content-addressed, background-written upload storage
+"""
+import os, threading
+
+import cv2
+import numpy as np
+import pytest
+
+import ocr
+from upload_store import UploadStore, content_name
+
+
+def test_names_are_content_addressed():
+    a = content_name(b'first receipt', 'receipt.JPG')
+    b = content_name(b'second receipt', 'receipt.JPG')
+    assert a != b
+    assert a.endswith('.jpg') and len(a) == 64 + 4
+    assert content_name(b'first receipt', 'other.jpg') == a
+
+
+def test_save_async_writes_once(tmp_path):
+    store = UploadStore(str(tmp_path / 'uploads'))
+    name = content_name(b'bytes', 'x.png')
+    path = store.save_async(name, b'bytes').result(5)
+    assert open(path, 'rb').read() == b'bytes'
+    store.save_async(name, b'bytes').result(5)
+    assert store.stats() == {"saved": 1, "deduplicated": 1, "failed": 0, "bytes_written": 5}
+    assert not [f for f in os.listdir(tmp_path / 'uploads') if f.endswith('.tmp')]
+    store.shutdown()
+
+
+def test_only_one_concurrent_upload_reserves_the_name(tmp_path):
+    store = UploadStore(str(tmp_path / 'uploads'))
+    name = content_name(b'bytes', 'x.png')
+    start = threading.Barrier(8)
+    claims = []
+
+    def claim():
+        start.wait()
+        claims.append(store.reserve(name, 3))
+
+    threads = [threading.Thread(target=claim) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(5)
+    assert sorted(claims) == [False] * 7 + [True]
+    assert not store.exists(name, 3)  # claimed, not yet written
+    path = store.save(name, b'bytes', 3, reserved=True)
+    assert open(path, 'rb').read() == b'bytes' and store.exists(name, 3)
+    assert not store.reserve(name, 3)
+    store.shutdown()
+
+
+def test_failed_reserved_save_gives_the_name_back(tmp_path, monkeypatch):
+    store = UploadStore(str(tmp_path / 'uploads'))
+    name = content_name(b'bytes', 'x.png')
+    assert store.reserve(name)
+    monkeypatch.setattr(os, 'replace', lambda *a: (_ for _ in ()).throw(OSError("disk full")))
+    with pytest.raises(OSError):
+        store.save(name, b'bytes', reserved=True)
+    monkeypatch.undo()
+    assert store.reserve(name)
+    store.shutdown()
+
+
+def test_images_decode_from_memory():
+    img = np.zeros((30, 40, 3), dtype=np.uint8)
+    img[:, :20] = 255
+    ok, encoded = cv2.imencode('.png', img)
+    assert ok
+    decoded = ocr.load_image(encoded.tobytes())
+    assert decoded.shape == (30, 40, 3)
+    assert (decoded == img).all()
+    assert ocr.load_image(b'not an image') is None
@@ -1,10 +1,9 @@
 # Train simple regression and classification models on synthetic data.
-import numpy as np, pickle, os
+import numpy as np
 from sklearn.linear_model import LinearRegression, LogisticRegression
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.model_selection import train_test_split
-
-os.makedirs('models', exist_ok=True)
+from model_registry import ModelRegistry
 
 # Synthetic dataset: daily amount -> annual expense (rough) and distress label
 np.random.seed(0)
@@ -20,9 +19,6 @@ y_clf = labels
 reg = LinearRegression().fit(X, y_reg)
 clf = RandomForestClassifier(n_estimators=50, random_state=0).fit(np.hstack([X, y_reg.reshape(-1,1)]), y_clf)
 
-with open('models/regression_model.pkl','wb') as f:
-    pickle.dump(reg, f)
-with open('models/classification_model.pkl','wb') as f:
-    pickle.dump(clf, f)
-
-print('Models trained and saved to models/')
\ No newline at end of file
+# Published as a new registry version and activated; running apps pick it up without a restart
+version = ModelRegistry().publish(reg, clf, metadata={"trainer": "train_models.py", "samples": len(X)})
+print(f'Models trained and published as version {version}')
@@ -0,0 +1,117 @@
+"""
+Content-addressed storage for uploaded receipts.
+
+Files are named after the SHA-256 of their bytes (plus the original
+extension), so two different receipts both called "receipt.jpg" no longer
+overwrite each other and re-uploading the same image writes nothing. Writes
+happen on a background thread: the upload route already holds the bytes and
+hands them straight to OCR, so the request doesn't wait on the disk.
+
+Each user's receipts live in their own subdirectory (u<id>/); the default
+user's stay at the top level, where uploads have always been written.
+
+reserve() claims a name with an exclusive create before anything is
+charged, so of two concurrent uploads of the same bytes only one counts
+against the quota. The claimed file stays empty until save() fills it; an
+empty file is never taken for a stored upload.
+"""
+import os, hashlib, logging, threading
+from concurrent.futures import ThreadPoolExecutor
+import metrics
+
+UPLOAD_WRITERS = int(os.environ.get('UPLOAD_WRITERS', 2))
+
+log = logging.getLogger(__name__)
+
+
+def content_name(data, original_filename, digest=None):
+    """'<sha256>.<ext>' for the bytes, keeping the uploaded file's extension"""
+    digest = digest or hashlib.sha256(data).hexdigest()
+    ext = original_filename.rsplit('.', 1)[1].lower() if '.' in original_filename else 'bin'
+    return f"{digest}.{ext}"
+
+
+class UploadStore:
+    def __init__(self, directory, writers=UPLOAD_WRITERS):
+        self.directory = directory
+        self._executor = ThreadPoolExecutor(max_workers=writers, thread_name_prefix='upload-writer')
+        self._lock = threading.Lock()
+        self._stats = {"saved": 0, "deduplicated": 0, "failed": 0, "bytes_written": 0}
+
+    def user_directory(self, user=None):
+        return self.directory if not user else os.path.join(self.directory, f"u{user}")
+
+    def path(self, name, user=None):
+        return os.path.join(self.user_directory(user), name)
+
+    def exists(self, name, user=None):
+        try:
+            return os.path.getsize(self.path(name, user)) > 0
+        except OSError:
+            return False
+
+    def reserve(self, name, user=None):
+        """
+        Claim `name` for a new upload: True for the one caller whose exclusive
+        create succeeds (it should charge the upload and save with
+        reserved=True), False if the name is taken or can't be created.
+        """
+        path = self.path(name, user)
+        try:
+            os.makedirs(self.user_directory(user), exist_ok=True)
+            os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644))
+        except FileExistsError:
+            return False
+        except OSError as e:
+            log.warning("could not reserve upload path=%s: %s", path, e)
+            return False
+        return True
+
+    def release(self, name, user=None):
+        """Give up a reserve() claim that won't be saved"""
+        try:
+            os.unlink(self.path(name, user))
+        except OSError:
+            pass
+
+    def save_async(self, name, data, user=None, reserved=False):
+        """Write data to `name` in the background; returns a Future of the path"""
+        return self._executor.submit(self.save, name, data, user, reserved)
+
+    def save(self, name, data, user=None, reserved=False):
+        """
+        Write data to `name` now (unless it is already stored); returns the
+        path. With reserved=True a failed write gives the claim back.
+        """
+        path = self.path(name, user)
+        try:
+            if not reserved and self.exists(name, user):
+                # Same name means same content - nothing to write
+                self._count("deduplicated")
+                return path
+            with metrics.span('upload.save'):
+                os.makedirs(self.user_directory(user), exist_ok=True)
+                tmp = f"{path}.{threading.get_ident()}.tmp"
+                with open(tmp, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp, path)
+            self._count("saved", len(data))
+            return path
+        except OSError:
+            log.exception("could not save upload path=%s", path)
+            self._count("failed")
+            if reserved:
+                self.release(name, user)
+            raise
+
+    def _count(self, field, nbytes=0):
+        with self._lock:
+            self._stats[field] += 1
+            self._stats["bytes_written"] += nbytes
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,18 @@
+"""
+WSGI entry point: `application` is the app with its models preloaded.
+
+    python serve.py                                        # built-in pre-fork server
+    gunicorn --preload --workers 4 --timeout 60 wsgi:application
+
+Importing this module runs serve.preload(), which loads the prediction
+models and the OCR reader in the importing process and sets up every
+worker forked from it afterwards. Load it in the pre-forking master
+(gunicorn --preload, uWSGI without lazy-apps) so the workers share that
+memory; otherwise each worker loads its own copy. Without --preload each
+worker would also create its own temporary JOB_STATE_DIR, so set
+JOB_STATE_DIR to one directory for all of them; the temporary one is removed
+when the process that created it exits.
+"""
+import serve
+
+application = serve.preload()